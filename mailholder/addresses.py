@@ -0,0 +1,169 @@
+"""
+Single-pass parsing of RFC 5322 address lists (From, To, Cc, ...).
+
+``parse_address_list`` tokenizes the whole header once and returns
+``(name, address)`` pairs, handling quoted display names with commas,
+comments, groups and RFC 2047 encoded words in display names.
+"""
+import binascii
+import re
+
+
+TOKEN_RE = re.compile(r'''
+    (?P<space>[ \t\r\n]+)
+  | (?P<quoted>"(?:[^"\\]|\\.)*"?)
+  | (?P<angle><[^>]*>?)
+  | (?P<literal>\[(?:[^\]\\]|\\.)*\]?)
+  | (?P<special>[,;:()])
+  | (?P<atom>[^ \t\r\n"<>\[\],;:()]+)
+  | (?P<other>.)
+''', re.VERBOSE | re.DOTALL)
+QUOTED_PAIR_RE = re.compile(r'\\(.)', re.DOTALL)
+ENCODED_WORD_RE = re.compile(r'=\?([^?\s]+)\?([qQbB])\?([^?\s]*)\?=')
+
+
+def _unquote(token):
+    if token.endswith('"') and len(token) > 1:
+        token = token[1:-1]
+    else:
+        token = token[1:]
+    return QUOTED_PAIR_RE.sub(r'\1', token)
+
+
+def _skip_comment(text, pos):
+    """Return the comment starting at ``text[pos] == '('`` and its end."""
+    depth = 0
+    start = pos + 1
+    while pos < len(text):
+        char = text[pos]
+        if char == '\\':
+            pos += 2
+            continue
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+            if not depth:
+                return text[start:pos], pos + 1
+        pos += 1
+    return text[start:], pos
+
+
+def _angle_address(token):
+    address = token[1:-1] if token.endswith('>') else token[1:]
+    # Drop an obsolete source route (<@relay1,@relay2:user@host>).
+    if address.startswith('@') and ':' in address:
+        address = address.split(':', 1)[1]
+    return ''.join(address.split())
+
+
+def _decode_word(encoding, payload):
+    payload = payload.encode('ascii', 'surrogateescape')
+    if encoding in 'bB':
+        return binascii.a2b_base64(payload + b'=' * (-len(payload) % 4))
+    return binascii.a2b_qp(payload, header=True)
+
+
+def decode_words(text, to_text=None):
+    """
+    Decode the RFC 2047 encoded words of a display name. Whitespace
+    between adjacent encoded words is dropped and their bytes joined
+    before decoding, so a character split across words survives.
+    ``to_text`` turns a ``(bytes, charset)`` fragment into ``str``; by
+    default the charset is trusted.
+    """
+    if '=?' not in text:
+        return text
+    if to_text is None:
+        to_text = _to_text
+    out = []
+    pending, pending_charset = b'', None
+    pos = 0
+    for match in ENCODED_WORD_RE.finditer(text):
+        gap = text[pos:match.start()]
+        charset = match.group(1).split('*', 1)[0].lower()
+        try:
+            data = _decode_word(match.group(2), match.group(3))
+        except (binascii.Error, UnicodeEncodeError):
+            continue
+        if gap and not (pending and gap.isspace()):
+            if pending:
+                out.append(to_text(pending, pending_charset))
+                pending = b''
+            out.append(gap)
+        if pending and charset != pending_charset:
+            out.append(to_text(pending, pending_charset))
+            pending = b''
+        pending += data
+        pending_charset = charset
+        pos = match.end()
+    if pending:
+        out.append(to_text(pending, pending_charset))
+    out.append(text[pos:])
+    return ''.join(out)
+
+
+def _to_text(value, charset=None):
+    if isinstance(value, str):
+        return value
+    try:
+        return value.decode(charset or 'ascii')
+    except (LookupError, UnicodeDecodeError):
+        return value.decode('latin-1')
+
+
+def parse_address_list(text, to_text=None):
+    """
+    Return the ``(name, address)`` pairs of an address list in one scan.
+    Group names are dropped and their members returned; entries without
+    an address (e.g. ``undisclosed-recipients:;``) are skipped. A
+    comment stands in for a missing display name, as with
+    ``email.utils.parseaddr``.
+    """
+    result = []
+    words = []      # display name words, or the parts of a bare addr-spec
+    raw = []        # the same tokens as written, for a bare addr-spec
+    address = None
+    comment = None
+
+    def flush():
+        if address is None:
+            # A bare addr-spec, perhaps named by a comment.
+            name, addr = comment or '', ''.join(raw)
+        else:
+            name, addr = ' '.join(words) or comment or '', address
+        if addr:
+            result.append((decode_words(name, to_text).strip(), addr))
+
+    pos = 0
+    end = len(text)
+    while pos < end:
+        match = TOKEN_RE.match(text, pos)
+        kind = match.lastgroup
+        token = match.group()
+        pos = match.end()
+        if kind == 'space':
+            continue
+        if kind == 'special':
+            if token == '(':
+                comment, pos = _skip_comment(text, match.start())
+                comment = ' '.join(comment.split())
+                continue
+            if token == ':' and address is None:
+                # A group: forget its name, keep its members.
+                words, raw, comment = [], [], None
+                continue
+            if token in ',;':
+                flush()
+                words, raw, address, comment = [], [], None, None
+            continue
+        if kind == 'angle':
+            address = _angle_address(token)
+        elif kind == 'quoted':
+            words.append(_unquote(token))
+            raw.append(token)
+        elif address is None:
+            words.append(token)
+            raw.append(token)
+    flush()
+    return result
@@ -0,0 +1,401 @@
+"""
+Load generator and throughput benchmark for the SMTP capture servers.
+
+Replays the ``eml_files/`` corpus plus synthetic MIME messages over N
+concurrent connections and reports messages/sec, MB/sec, end-to-end
+latency percentiles and peak RSS. ``--addresses N`` instead times the
+address list parser against the old split-on-commas path on a header of
+N recipients. Run ``python -m mailholder.bench -h``.
+"""
+import argparse
+import asyncio
+import email.header
+import email.utils
+import glob
+import json
+import os
+import random
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORPUS_DIR = os.path.join(ROOT_DIR, 'eml_files')
+LINE_END_RE = re.compile(rb'\r?\n')
+
+
+def load_corpus(directory=CORPUS_DIR):
+    messages = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.eml'))):
+        with open(path, 'rb') as f:
+            messages.append(f.read())
+    return messages
+
+
+def synthetic_message(size, parts, attachment_ratio, rnd):
+    """
+    Build a multipart message of roughly ``size`` bytes split over
+    ``parts`` parts, ``attachment_ratio`` of which are base64
+    attachments and the rest text.
+    """
+    msg = MIMEMultipart()
+    msg['From'] = 'bench@example.com'
+    msg['To'] = 'sink@example.com'
+    msg['Subject'] = 'bench {}'.format(rnd.randrange(1 << 30))
+    part_size = max(size // max(parts, 1), 1)
+    for i in range(parts):
+        if rnd.random() < attachment_ratio:
+            # Base64 inflates by 4/3, so generate 3/4 of the budget.
+            attachment = MIMEApplication(os.urandom(part_size * 3 // 4))
+            attachment.add_header('Content-Disposition', 'attachment',
+                                  filename='file{}.bin'.format(i))
+            msg.attach(attachment)
+        else:
+            words = ' '.join('word{}'.format(rnd.randrange(1000))
+                             for _ in range(part_size // 8))
+            msg.attach(MIMEText(words))
+    return msg.as_bytes()
+
+
+def encode_data(message):
+    """Return ``message`` with CRLF line endings, dot-stuffed for DATA."""
+    lines = LINE_END_RE.split(message)
+    if lines and lines[-1] == b'':
+        lines.pop()
+    lines = [b'.' + line if line.startswith(b'.') else line
+             for line in lines]
+    return b'\r\n'.join(lines) + b'\r\n.\r\n'
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    rank = max(int(round(pct / 100.0 * len(values))) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+class SMTPClient(object):
+    """A minimal asyncio SMTP client that pipelines each transaction."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.pipelining = False
+        self.writer = None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(
+            self.host, self.port)
+        await self.reply()
+        self.writer.write(b'EHLO bench\r\n')
+        code, lines = await self.reply()
+        self.pipelining = any(line[4:].upper() == b'PIPELINING'
+                              for line in lines)
+
+    async def reply(self):
+        lines = []
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                raise ConnectionResetError("server closed the connection")
+            lines.append(line.rstrip(b'\r\n'))
+            if line[3:4] != b'-':
+                return int(line[:3]), lines
+
+    async def send(self, mailfrom, rcpttos, data):
+        """Send one pre-encoded message; return the final reply code."""
+        commands = [b'MAIL FROM:<' + mailfrom + b'>\r\n']
+        commands += [b'RCPT TO:<' + rcpt + b'>\r\n' for rcpt in rcpttos]
+        commands.append(b'DATA\r\n')
+        if self.pipelining:
+            self.writer.write(b''.join(commands))
+            codes = [(await self.reply())[0] for _ in commands]
+        else:
+            codes = []
+            for command in commands:
+                self.writer.write(command)
+                codes.append((await self.reply())[0])
+        if codes[-1] != 354:
+            if codes[-1] < 400:
+                # Recover from an unexpected reply without desyncing.
+                self.writer.write(b'RSET\r\n')
+                await self.reply()
+            # The first refusal says why (e.g. 451 to MAIL, then 503s).
+            return next((code for code in codes if code >= 400), codes[-1])
+        self.writer.write(data)
+        return (await self.reply())[0]
+
+    async def close(self):
+        self.writer.write(b'QUIT\r\n')
+        try:
+            await self.reply()
+        except ConnectionError:
+            pass
+        self.writer.close()
+
+    def abort(self):
+        """Drop the connection without a QUIT."""
+        if self.writer is not None:
+            self.writer.close()
+
+
+async def run_load(host, port, messages, total, concurrency, recipients):
+    """Send ``total`` messages over ``concurrency`` connections."""
+    queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(messages[i % len(messages)])
+    rcpttos = [b'rcpt%d@example.com' % i for i in range(recipients)]
+    latencies = []
+    results = {'accepted': 0, 'rejected': 0, 'tempfailed': 0, 'bytes': 0}
+
+    async def worker():
+        client = None
+        while not queue.empty():
+            data = queue.get_nowait()
+            start = time.perf_counter()
+            try:
+                if client is None:
+                    client = SMTPClient(host, port)
+                    await client.connect()
+                code = await client.send(b'bench@example.com', rcpttos, data)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                # Dropped, e.g. after a 421 from admission control.
+                code = 421
+            else:
+                latencies.append(time.perf_counter() - start)
+            if code == 250:
+                results['accepted'] += 1
+                results['bytes'] += len(data)
+            elif 400 <= code < 500:
+                results['tempfailed'] += 1
+            else:
+                results['rejected'] += 1
+            if code == 421 and client is not None:
+                # The server is closing the connection; start a new one.
+                client.abort()
+                client = None
+        if client is not None:
+            await client.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    results['elapsed'] = time.perf_counter() - start
+    results['latencies'] = sorted(latencies)
+    return results
+
+
+def peak_rss(pid=None):
+    """Peak resident set size in bytes of ``pid`` (default: this process)."""
+    if pid is None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    try:
+        with open('/proc/{}/status'.format(pid)) as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except FileNotFoundError:
+        pass
+    return None
+
+
+def spawn_server(target, port, mail_dir):
+    if target == 'fakesmtp':
+        command = [sys.executable, '-m', 'mailholder.fakesmtp',
+                   '--mail-dir', mail_dir, '-H', '127.0.0.1',
+                   '-p', str(port), '--log-file', os.devnull]
+    else:
+        command = [sys.executable, '-m', 'mailholder.bench',
+                   '--serve-local', str(port)]
+    return subprocess.Popen(command, cwd=ROOT_DIR, stdout=subprocess.DEVNULL)
+
+
+async def wait_for_port(host, port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.05)
+            continue
+        writer.close()
+        return
+
+
+def serve_local(port):
+    """Run ``parsemail.LocalHandler`` behind the asyncio SMTP server."""
+    from .parsemail import LocalHandler
+    from .smtpserver import SMTPServer
+
+    server = SMTPServer(LocalHandler(), '127.0.0.1', port)
+    asyncio.run(server.serve_forever())
+
+
+def recipient_header(count, rnd):
+    """An address list of ``count`` plain, quoted and encoded entries."""
+    entries = []
+    for i in range(count):
+        kind = rnd.randrange(3)
+        if kind == 0:
+            entries.append('user{}@example.com'.format(i))
+        elif kind == 1:
+            entries.append('"User, No. {0}" <user{0}@example.com>'.format(i))
+        else:
+            entries.append('=?utf-8?q?J=C3=B6rg_{0}?= <user{0}@example.com>'
+                           .format(i))
+    return ',\r\n '.join(entries)
+
+
+def split_recipients(header):
+    """The recipient parsing ``MailJson`` did before ``addresses``."""
+    result = []
+    for entry in header.replace('\r', ' ').replace('\n', ' ').split(','):
+        entry = ''.join(
+            value.decode(charset or 'ascii') if isinstance(value, bytes)
+            else value for value, charset in email.header.decode_header(entry))
+        name, address = email.utils.parseaddr(entry.strip())
+        if address:
+            result.append((name, address))
+    return result
+
+
+def bench_addresses(count, rnd, repeat=5):
+    from .addresses import parse_address_list
+
+    header = recipient_header(count, rnd)
+    timings = {}
+    for name, parse in (('split', split_recipients),
+                        ('tokenizer', parse_address_list)):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            parsed = parse(header)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings[name] = {'seconds': round(best, 6), 'addresses': len(parsed)}
+    return {'recipients': count, 'results': timings}
+
+
+def report(results, args, server_rss):
+    latencies = results.pop('latencies')
+    elapsed = results['elapsed']
+    summary = {
+        'target': args.target,
+        'concurrency': args.concurrency,
+        'recipients': args.recipients,
+        'messages': args.messages,
+        'accepted': results['accepted'],
+        'rejected': results['rejected'],
+        'tempfailed': results['tempfailed'],
+        'elapsed_s': round(elapsed, 4),
+        'messages_per_s': round(results['accepted'] / elapsed, 2),
+        'mb_per_s': round(results['bytes'] / elapsed / 1e6, 3),
+        'latency_ms': {
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+        },
+        'client_peak_rss': peak_rss(),
+        'server_peak_rss': server_rss,
+    }
+    for key, value in summary['latency_ms'].items():
+        if value is not None:
+            summary['latency_ms'][key] = round(value * 1000, 3)
+    return summary
+
+
+def bench_parser():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--target', choices=('fakesmtp', 'local', 'remote'),
+                        default='fakesmtp',
+                        help="server to spawn, or 'remote' for --host/--port")
+    parser.add_argument('-H', '--host', default='127.0.0.1')
+    parser.add_argument('-p', '--port', type=int, default=2525)
+    parser.add_argument('-n', '--messages', type=int, default=1000)
+    parser.add_argument('-c', '--concurrency', type=int, default=10)
+    parser.add_argument('--recipients', type=int, default=1)
+    parser.add_argument('--no-corpus', action='store_true',
+                        help="skip the eml_files corpus")
+    parser.add_argument('--synthetic', type=int, default=10,
+                        help="number of synthetic messages to generate")
+    parser.add_argument('--size', type=int, default=20000,
+                        help="approximate size of synthetic messages")
+    parser.add_argument('--parts', type=int, default=3)
+    parser.add_argument('--attachment-ratio', type=float, default=0.3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', metavar='PATH',
+                        help="write the results as JSON ('-' for stdout)")
+    parser.add_argument('--addresses', type=int, metavar='N',
+                        help="benchmark parsing an address list of N "
+                             "recipients instead of running the load")
+    parser.add_argument('--serve-local', type=int, metavar='PORT',
+                        help=argparse.SUPPRESS)
+    return parser
+
+
+def main():
+    args = bench_parser().parse_args()
+    if args.serve_local:
+        serve_local(args.serve_local)
+        return
+
+    rnd = random.Random(args.seed)
+    if args.addresses:
+        json.dump(bench_addresses(args.addresses, rnd), sys.stdout, indent=2)
+        print()
+        return
+
+    corpus = [] if args.no_corpus else load_corpus()
+    corpus += [synthetic_message(args.size, args.parts,
+                                 args.attachment_ratio, rnd)
+               for _ in range(args.synthetic)]
+    if not corpus:
+        sys.exit("No messages to send")
+    messages = [encode_data(message) for message in corpus]
+
+    server = None
+    mail_dir = None
+    if args.target != 'remote':
+        mail_dir = tempfile.mkdtemp(prefix='mailholder-bench-')
+        server = spawn_server(args.target, args.port, mail_dir)
+    try:
+        asyncio.run(wait_for_port(args.host, args.port))
+        results = asyncio.run(run_load(
+            args.host, args.port, messages, args.messages,
+            args.concurrency, args.recipients))
+        server_rss = peak_rss(server.pid) if server else None
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        if mail_dir is not None:
+            shutil.rmtree(mail_dir, ignore_errors=True)
+
+    summary = report(results, args, server_rss)
+    if args.json == '-':
+        json.dump(summary, sys.stdout, indent=2)
+        print()
+        return
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2)
+    print("{accepted} accepted, {rejected} rejected, {tempfailed} "
+          "temporarily failed in {elapsed_s}s: "
+          "{messages_per_s} msg/s, {mb_per_s} MB/s".format(**summary))
+    print("latency p50/p95/p99: {p50} / {p95} / {p99} ms".format(
+        **summary['latency_ms']))
+    print("peak RSS: client {} bytes, server {} bytes".format(
+        summary['client_peak_rss'], summary['server_peak_rss']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+import hashlib
+import os
+import sqlite3
+import tempfile
+
+
+CHUNK_SIZE = 65536
+
+
+class BlobStore(object):
+    """
+    A SHA-256 content-addressed file store shared by the mail parser
+    and the attachment models.
+
+    A blob lives at ``<root>/<digest[:2]>/<digest[2:]>`` and is written
+    only the first time its content is seen; every ``put`` of the same
+    content just bumps its reference count. ``decref`` drops a
+    reference and ``gc`` removes blobs nobody refers to anymore.
+    Reference counts are kept in ``<root>/refs.sqlite3`` so several
+    processes can share one store.
+    """
+    def __init__(self, root):
+        self.root = root
+        self.db_path = os.path.join(root, 'refs.sqlite3')
+        self._db = None
+        self._db_pid = None
+        os.makedirs(root, 0o775, exist_ok=True)
+
+    @property
+    def db(self):
+        # sqlite connections must not be shared across fork().
+        if self._db is None or self._db_pid != os.getpid():
+            self._db = sqlite3.connect(self.db_path, timeout=30,
+                                       isolation_level=None)
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS blobs ('
+                'digest TEXT PRIMARY KEY, size INTEGER NOT NULL, '
+                'refs INTEGER NOT NULL)')
+            self._db_pid = os.getpid()
+        return self._db
+
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], digest[2:])
+
+    def exists(self, digest):
+        return os.path.exists(self.path(digest))
+
+    def open(self, digest):
+        return open(self.path(digest), 'rb')
+
+    def size(self, digest):
+        return os.path.getsize(self.path(digest))
+
+    def put(self, data):
+        """Store ``data`` and return its digest."""
+        digest = hashlib.sha256(data).hexdigest()
+        # Take the reference first so a concurrent gc() cannot remove
+        # the blob between the existence check and the increment.
+        self.incref(digest, len(data))
+        if not self.exists(digest):
+            with self._tempfile(digest) as f:
+                f.write(data)
+            self._link(f.name, digest)
+        return digest
+
+    def put_file(self, fp):
+        """Store the content of a binary file object, read in chunks."""
+        with self.writer() as writer:
+            for chunk in iter(lambda: fp.read(CHUNK_SIZE), b''):
+                writer.write(chunk)
+        return writer.digest
+
+    def writer(self):
+        """Return a ``BlobWriter`` for content produced piece by piece."""
+        return BlobWriter(self)
+
+    def _tempfile(self, digest=None):
+        directory = os.path.dirname(self.path(digest)) if digest else \
+            self.root
+        os.makedirs(directory, 0o775, exist_ok=True)
+        return tempfile.NamedTemporaryFile(dir=directory, prefix='.tmp',
+                                           delete=False)
+
+    def _link(self, tmp_path, digest):
+        path = self.path(digest)
+        os.makedirs(os.path.dirname(path), 0o775, exist_ok=True)
+        # rename() replaces atomically, so a concurrent writer of the
+        # same content is harmless.
+        os.rename(tmp_path, path)
+
+    def incref(self, digest, size=None):
+        if size is None:
+            size = self.size(digest)
+        self.db.execute(
+            'INSERT INTO blobs (digest, size, refs) VALUES (?, ?, 1) '
+            'ON CONFLICT(digest) DO UPDATE SET refs = refs + 1',
+            (digest, size))
+
+    def decref(self, digest):
+        self.db.execute('UPDATE blobs SET refs = refs - 1 '
+                        'WHERE digest = ? AND refs > 0', (digest,))
+
+    def refs(self, digest):
+        row = self.db.execute('SELECT refs FROM blobs WHERE digest = ?',
+                              (digest,)).fetchone()
+        return row[0] if row else 0
+
+    def gc(self):
+        """Delete unreferenced blobs and return how many were removed."""
+        db = self.db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            dead = [row[0] for row in db.execute(
+                'SELECT digest FROM blobs WHERE refs <= 0')]
+            for digest in dead:
+                try:
+                    os.unlink(self.path(digest))
+                except FileNotFoundError:
+                    pass
+            db.executemany('DELETE FROM blobs WHERE digest = ?',
+                           [(digest,) for digest in dead])
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        return len(dead)
+
+
+class BlobWriter(object):
+    """
+    Write a blob incrementally; the digest is only known (and the blob
+    only linked into the store) once ``close`` is called.
+    """
+    def __init__(self, store):
+        self.store = store
+        self.sha = hashlib.sha256()
+        self.size = 0
+        self.file = store._tempfile()
+        self.digest = None
+
+    def write(self, data):
+        self.sha.update(data)
+        self.size += len(data)
+        return self.file.write(data)
+
+    def close(self):
+        if self.digest is not None:
+            return self.digest
+        self.file.close()
+        self.digest = self.sha.hexdigest()
+        self.store.incref(self.digest, self.size)
+        if self.store.exists(self.digest):
+            os.unlink(self.file.name)
+        else:
+            self.store._link(self.file.name, self.digest)
+        return self.digest
+
+    def abort(self):
+        self.file.close()
+        os.unlink(self.file.name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
@@ -0,0 +1,91 @@
+"""
+Compile perm-headers.csv (the IANA permanent message header field
+registry) into mailholder/headers_registry.py.
+
+Run ``python -m mailholder.build_headers`` after updating the CSV;
+``--check`` exits non-zero when the generated module is out of date.
+"""
+import argparse
+import csv
+import os
+import sys
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CSV_PATH = os.path.join(ROOT_DIR, 'perm-headers.csv')
+MODULE_PATH = os.path.join(ROOT_DIR, 'mailholder', 'headers_registry.py')
+
+HEADER = '''\
+# Generated by ``python -m mailholder.build_headers`` from
+# perm-headers.csv. Do not edit.
+import collections
+import sys
+from types import MappingProxyType
+
+
+# ``statuses`` pairs every protocol the field is registered for with its
+# status there ('' when the registry gives none).
+HeaderInfo = collections.namedtuple('HeaderInfo', 'name statuses')
+
+'''
+
+
+def read_registry(path=CSV_PATH):
+    """Return ``{lower name: (name, ((protocol, status), ...))}``."""
+    registry = {}
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            name = row['Header Field Name'].strip()
+            if not name:
+                continue
+            entry = registry.setdefault(name.lower(), (name, []))
+            pair = (row['Protocol'].strip().lower(), row['Status'].strip())
+            if pair not in entry[1]:
+                entry[1].append(pair)
+    return {key: (name, tuple(statuses))
+            for key, (name, statuses) in sorted(registry.items())}
+
+
+def render(registry):
+    lines = [HEADER, 'HEADERS = MappingProxyType({']
+    for key, (name, statuses) in registry.items():
+        lines.append('    sys.intern({!r}): HeaderInfo(sys.intern({!r}), {!r}),'
+                     .format(key, name, statuses))
+    lines.append('})')
+    protocols = sorted({protocol for _, statuses in registry.values()
+                        for protocol, _ in statuses})
+    lines += ['', '', '# Lower-case names registered for each protocol.',
+              'BY_PROTOCOL = MappingProxyType({']
+    for protocol in protocols:
+        lines.append('    {!r}: frozenset(('.format(protocol))
+        for key, (_, statuses) in registry.items():
+            if any(p == protocol for p, _ in statuses):
+                lines.append('        {!r},'.format(key))
+        lines.append('    )),')
+    lines.append('})')
+    return '\n'.join(lines) + '\n'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--csv', default=CSV_PATH)
+    parser.add_argument('--output', default=MODULE_PATH)
+    parser.add_argument('--check', action='store_true',
+                        help="fail if the output is not up to date")
+    args = parser.parse_args()
+    source = render(read_registry(args.csv))
+    if args.check:
+        try:
+            with open(args.output, encoding='utf-8') as f:
+                current = f.read()
+        except FileNotFoundError:
+            current = None
+        if current != source:
+            sys.exit("{} is out of date".format(args.output))
+        return
+    with open(args.output, 'w', encoding='utf-8') as f:
+        f.write(source)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,283 @@
+"""
+Convert a mail directory, Maildir or mbox file to JSON Lines.
+
+Messages are parsed by a pool of worker processes through
+``mailtojson.MailJson`` and written one JSON document per line, in
+source order or (``--unordered``) as soon as they are done. With
+``--checkpoint`` an interrupted run picks up where it stopped. Run
+``python -m mailholder.convert -h``.
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+
+from .rawmessage import RawMessage
+
+
+SPOOL_FILES = ('envelopes.idx',)
+
+# mboxrd quoting: a body line matching ``>*From `` gets one more ``>``.
+QUOTED_FROM_RE = re.compile(rb'^>(>*From )', re.M)
+
+
+def spool_messages(directory):
+    """
+    Yield ``(path, start, stop)`` for every message file below
+    ``directory``: the ``messages`` folder of a fakesmtp spool, the
+    ``new`` and ``cur`` folders of a Maildir or any other tree of files.
+    """
+    if os.path.isdir(os.path.join(directory, 'messages')):
+        folders = [os.path.join(directory, 'messages')]
+    elif all(os.path.isdir(os.path.join(directory, sub))
+             for sub in ('new', 'cur', 'tmp')):
+        folders = [os.path.join(directory, sub) for sub in ('new', 'cur')]
+    else:
+        folders = [directory]
+    for folder in folders:
+        for root, dirs, files in os.walk(folder):
+            dirs.sort()
+            # The recipient index of a spool holds ids, not messages.
+            dirs[:] = [d for d in dirs if d not in ('rcpt', 'tmp')]
+            for name in sorted(files):
+                # Skip messages that are still being written.
+                if name in SPOOL_FILES or name.startswith('.') or \
+                        name.endswith('.tmp'):
+                    continue
+                yield os.path.join(root, name), 0, None
+
+
+def mbox_messages(path):
+    """
+    Yield ``(path, start, stop)`` for every message of an mbox file. A
+    message starts at a ``From `` line at the beginning of the file or
+    after an empty line; the ``From `` line itself and the empty line
+    before the next one are skipped. The range still holds the quoted
+    ``>From `` lines; ``read_message`` unquotes them.
+    """
+    start = None
+    # The start of the file counts as an empty line.
+    previous = b'\n'
+    with open(path, 'rb') as f:
+        offset = 0
+        for line in f:
+            blank = previous in (b'\n', b'\r\n')
+            if blank and line.startswith(b'From '):
+                if start is not None:
+                    yield path, start, offset - len(previous)
+                start = offset + len(line)
+            previous = line
+            offset += len(line)
+    if start is not None:
+        if previous in (b'\n', b'\r\n') and offset - len(previous) >= start:
+            offset -= len(previous)
+        yield path, start, offset
+
+
+def read_message(path, start, stop):
+    """
+    Return the message at ``(path, start, stop)`` as yielded by
+    ``iter_sources``, with the mboxrd quoting of an mbox message undone.
+    """
+    with open(path, 'rb') as f:
+        if stop is None:
+            return f.read()
+        f.seek(start)
+        data = f.read(stop - start)
+    return QUOTED_FROM_RE.sub(rb'\1', data)
+
+
+def iter_sources(source):
+    if os.path.isdir(source):
+        return spool_messages(source)
+    return mbox_messages(source)
+
+
+_blob_store = None
+
+
+def _init_worker(blob_dir):
+    global _blob_store
+    if blob_dir:
+        from .blobstore import BlobStore
+
+        _blob_store = BlobStore(blob_dir)
+
+
+def convert_one(item):
+    """
+    Convert one message; return ``(index, line, error)``. Runs in the
+    worker processes.
+    """
+    from .mailtojson import MailJson
+
+    index, (path, start, stop) = item
+    try:
+        data = read_message(path, start, stop)
+        out = io.StringIO()
+        out.write('{{"index": {}, "source": {}, "offset": {}, "mail": '.format(
+            index, json.dumps(path), start))
+        MailJson(RawMessage.from_bytes(data)).dump(out, store=_blob_store)
+        out.write('}\n')
+        return index, out.getvalue(), None
+    except Exception as e:
+        return index, None, '{}: {}'.format(type(e).__name__, e)
+
+
+class Checkpoint(object):
+    """
+    Progress of a conversion: every index below ``done`` plus those in
+    ``extra`` are written, and the output was ``size`` bytes long at
+    that point. It is replaced atomically, and resuming truncates the
+    output back to ``size``, so no message is written twice.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.done = 0
+        self.extra = set()
+        self.size = 0
+        self.failed = 0
+        if path and os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            self.done = state['done']
+            self.extra = set(state['extra'])
+            self.size = state['size']
+            self.failed = state.get('failed', 0)
+
+    def __contains__(self, index):
+        return index < self.done or index in self.extra
+
+    def add(self, index):
+        self.extra.add(index)
+        while self.done in self.extra:
+            self.extra.remove(self.done)
+            self.done += 1
+
+    def save(self, size):
+        self.size = size
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'done': self.done, 'extra': sorted(self.extra),
+                       'size': size, 'failed': self.failed}, f)
+        os.replace(tmp, self.path)
+
+
+class Progress(object):
+    def __init__(self, enabled, interval=2.0, stream=sys.stderr):
+        self.enabled = enabled
+        self.interval = interval
+        self.stream = stream
+        self.start = self.last = time.monotonic()
+        self.count = 0
+
+    def update(self, done, total):
+        self.count += 1
+        now = time.monotonic()
+        if self.enabled and now - self.last >= self.interval:
+            self.last = now
+            self.report(done, total, now)
+
+    def report(self, done, total, now=None):
+        if not self.enabled:
+            return
+        elapsed = (now or time.monotonic()) - self.start
+        self.stream.write('{}/{} messages, {:.0f} msg/s\n'.format(
+            done, total, self.count / elapsed if elapsed else 0))
+        self.stream.flush()
+
+
+def convert(source, out, jobs=None, ordered=True, checkpoint=None,
+            blob_dir=None, progress=False, checkpoint_every=1000,
+            chunksize=16):
+    """
+    Convert every message of ``source`` and append the JSON lines to
+    the binary file ``out``. Returns ``(written, failed)``.
+    """
+    state = checkpoint if isinstance(checkpoint, Checkpoint) else \
+        Checkpoint(checkpoint)
+    if state.path:
+        # Drop whatever was written after the last checkpoint.
+        out.seek(state.size)
+        out.truncate()
+    items = list(enumerate(iter_sources(source)))
+    todo = [item for item in items if item[0] not in state]
+    meter = Progress(progress)
+    written = failed = 0
+    with multiprocessing.Pool(jobs, _init_worker, (blob_dir,)) as pool:
+        mapper = pool.imap if ordered else pool.imap_unordered
+        for index, line, error in mapper(convert_one, todo, chunksize):
+            if error is None:
+                out.write(line.encode('utf-8'))
+                written += 1
+            else:
+                path, start, _ = items[index][1]
+                sys.stderr.write('Failed to convert {} at {}: {}\n'.format(
+                    path, start, error))
+                state.failed += 1
+                failed += 1
+            state.add(index)
+            meter.update(state.done + len(state.extra), len(items))
+            if state.path and (written + failed) % checkpoint_every == 0:
+                out.flush()
+                state.save(out.tell())
+    out.flush()
+    if state.path:
+        state.save(out.tell())
+    meter.report(state.done + len(state.extra), len(items))
+    return written, failed
+
+
+def convert_parser():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('source',
+                        help="fakesmtp spool, Maildir, directory of "
+                             "messages or mbox file")
+    parser.add_argument('-o', '--output', default='-',
+                        help="JSON Lines file to append to ('-' for stdout)")
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help="worker processes (default: one per CPU)")
+    parser.add_argument('--unordered', action='store_true',
+                        help="write messages as they finish instead of in "
+                             "source order")
+    parser.add_argument('--checkpoint', metavar='PATH',
+                        help="record progress here and resume from it")
+    parser.add_argument('--checkpoint-every', type=int, default=1000,
+                        help="messages between checkpoints")
+    parser.add_argument('--blob-dir',
+                        help="store attachments in this BlobStore and write "
+                             "references instead of base64 content")
+    parser.add_argument('--progress', action='store_true',
+                        help="report progress on stderr")
+    return parser
+
+
+def main():
+    parser = convert_parser()
+    args = parser.parse_args()
+    if not os.path.exists(args.source):
+        parser.error("{} does not exist".format(args.source))
+    if args.output == '-':
+        if args.checkpoint:
+            parser.error("--checkpoint needs an --output file")
+        out = sys.stdout.buffer
+    else:
+        out = open(args.output, 'ab+')
+    try:
+        written, failed = convert(
+            args.source, out, args.jobs, not args.unordered, args.checkpoint,
+            args.blob_dir, args.progress, args.checkpoint_every)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+    if failed:
+        sys.stderr.write('{} converted, {} failed\n'.format(written, failed))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
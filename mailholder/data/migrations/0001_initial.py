@@ -0,0 +1,110 @@
+import django.db.models.deletion
+import jsonfield.fields
+from django.db import migrations, models
+
+import data.fields
+import data.models
+import data.storage
+import data.utils
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='User',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, verbose_name='Name')),
+                ('email_address', models.EmailField(max_length=255, verbose_name='Email')),
+            ],
+            options={
+                'verbose_name': 'User',
+                'verbose_name_plural': 'Users',
+            },
+        ),
+        migrations.CreateModel(
+            name='EmailTemplate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text="e.g: 'welcome_email'", max_length=255, verbose_name='Name')),
+                ('description', models.TextField(blank=True, help_text='Description of this template.', verbose_name='Description')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('last_updated', models.DateTimeField(auto_now=True)),
+                ('subject', models.CharField(blank=True, max_length=255, validators=[data.utils.validate_template_syntax], verbose_name='Subject')),
+                ('content', models.TextField(blank=True, validators=[data.utils.validate_template_syntax], verbose_name='Content')),
+                ('html_content', models.TextField(blank=True, validators=[data.utils.validate_template_syntax], verbose_name='HTML content')),
+                ('language', models.CharField(blank=True, default='', help_text='Render template in alternative language', max_length=12, verbose_name='Language')),
+                ('default_template', models.ForeignKey(default=None, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='translated_templates', to='data.emailtemplate', verbose_name='Default template')),
+            ],
+            options={
+                'verbose_name': 'Email Template',
+                'verbose_name_plural': 'Email Templates',
+                'ordering': ['name'],
+                'unique_together': {('name', 'language', 'default_template')},
+            },
+        ),
+        migrations.CreateModel(
+            name='Email',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('emailaddress', models.EmailField(max_length=255)),
+                ('from_email', models.CharField(max_length=254, validators=[data.utils.validate_email_with_name], verbose_name='Email From')),
+                ('to', data.fields.CommaSeparatedEmailField(blank=True, verbose_name='Email To')),
+                ('cc', data.fields.CommaSeparatedEmailField(blank=True, verbose_name='Cc')),
+                ('bcc', data.fields.CommaSeparatedEmailField(blank=True, verbose_name='Bcc')),
+                ('subject', models.CharField(blank=True, max_length=989, verbose_name='Subject')),
+                ('message', models.TextField(blank=True, verbose_name='Message')),
+                ('html_message', models.TextField(blank=True, verbose_name='HTML Message')),
+                ('status', models.PositiveSmallIntegerField(blank=True, choices=[(0, 'sent'), (1, 'hold'), (2, 'queued')], db_index=True, null=True, verbose_name='Status')),
+                ('priority', models.PositiveSmallIntegerField(blank=True, choices=[(0, 'low'), (1, 'medium'), (2, 'high'), (3, 'now')], null=True, verbose_name='Priority')),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('last_updated', models.DateTimeField(auto_now=True, db_index=True)),
+                ('scheduled_time', models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='The scheduled sending time')),
+                ('headers', jsonfield.fields.JSONField(blank=True, null=True, verbose_name='Headers')),
+                ('context', jsonfield.fields.JSONField(blank=True, null=True, verbose_name='Context')),
+                ('backend_alias', models.CharField(blank=True, default='', max_length=64, verbose_name='Backend alias')),
+                ('template', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='data.emailtemplate', verbose_name='Email template')),
+                ('username', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='data.user', verbose_name='User Name')),
+            ],
+            options={
+                'verbose_name': 'Email',
+                'verbose_name_plural': 'Emails',
+            },
+        ),
+        migrations.CreateModel(
+            name='Log',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateTimeField(auto_now_add=True)),
+                ('status', models.PositiveSmallIntegerField(choices=[(0, 'sent'), (1, 'failed')], verbose_name='Status')),
+                ('exception_type', models.CharField(blank=True, max_length=255, verbose_name='Exception type')),
+                ('message', models.TextField(verbose_name='Message')),
+                ('email', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='logs', to='data.email', verbose_name='Email address')),
+            ],
+            options={
+                'verbose_name': 'Log',
+                'verbose_name_plural': 'Logs',
+            },
+        ),
+        migrations.CreateModel(
+            name='Attachment',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file', models.FileField(storage=data.storage.BlobStorage(), upload_to=data.models.get_upload_path, verbose_name='File')),
+                ('filename', models.CharField(help_text='The original filename', max_length=255, verbose_name='Filename')),
+                ('mimetype', models.CharField(blank=True, default='', max_length=255)),
+                ('headers', jsonfield.fields.JSONField(blank=True, null=True, verbose_name='Headers')),
+                ('emails', models.ManyToManyField(related_name='attachments', to='data.Email', verbose_name='Email addresses')),
+            ],
+            options={
+                'verbose_name': 'Attachment',
+                'verbose_name_plural': 'Attachments',
+            },
+        ),
+    ]
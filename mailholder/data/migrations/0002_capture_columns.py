@@ -0,0 +1,37 @@
+import data.models
+import data.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Columns the capture server (``mailholder.persist``) writes through
+    the Tortoise models in ``mailholder/models.py``.
+    """
+
+    dependencies = [
+        ('data', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='email',
+            name='spool_id',
+            field=models.CharField(blank=True, max_length=255, null=True, unique=True, verbose_name='Spool id'),
+        ),
+        migrations.AddField(
+            model_name='attachment',
+            name='digest',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True, verbose_name='Digest'),
+        ),
+        migrations.AddField(
+            model_name='attachment',
+            name='size',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Size'),
+        ),
+        migrations.AlterField(
+            model_name='attachment',
+            name='file',
+            field=models.FileField(blank=True, null=True, storage=data.storage.BlobStorage(), upload_to=data.models.get_upload_path, verbose_name='File'),
+        ),
+    ]
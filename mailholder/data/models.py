@@ -4,6 +4,8 @@ from uuid import uuid4
 from email.mime.nonmultipart import MIMENonMultipart
 from django.core.mail import EmailMessage, EmailMultiAlternatives
 from django.db import models
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from django.utils.encoding import smart_str
 from django.utils.translation import pgettext_lazy, ugettext_lazy as _
 from django.utils import timezone
@@ -11,6 +13,7 @@ from jsonfield import JSONField
 from .cache import Cache
 from .fields import CommaSeparatedEmailField
 from .connections import connections
+from .storage import BlobStorage
 from .utils import (context_field_class,
                                    get_log_level,
                                    get_template_engine,
@@ -75,6 +78,10 @@ class Email(models.Model):
     context = context_field_class(_('Context'), blank=True, null=True)
     backend_alias = models.CharField(_('Backend alias'), blank=True, default='',
                                      max_length=64)
+    # Set by the capture server; Maildir ids end in the host name, so
+    # they need more than a fixed-size id column.
+    spool_id = models.CharField(_('Spool id'), max_length=255, unique=True,
+                                blank=True, null=True)
 
     class Meta:
         app_label = 'data'
@@ -291,11 +298,19 @@ def get_upload_path(instance, filename):
                         str(date.month), str(date.day), filename)
 
 
+blob_storage = BlobStorage()
+
+
 class Attachment(models.Model):
     """
     A model describing an email attachment.
     """
-    file = models.FileField(_('File'), upload_to=get_upload_path)
+    file = models.FileField(_('File'), upload_to=get_upload_path,
+                            storage=blob_storage, blank=True, null=True)
+    # Attachments stored by the capture server name their blob here.
+    digest = models.CharField(_('Digest'), max_length=64, db_index=True,
+                              blank=True, null=True)
+    size = models.PositiveIntegerField(_('Size'), blank=True, null=True)
     filename = models.CharField(_('Filename'), max_length=255, help_text=_("The original filename"))
     emails = models.ManyToManyField(Email, related_name='attachments',
                                     verbose_name=_('Email addresses'))
@@ -309,3 +324,19 @@ class Attachment(models.Model):
 
     def __str__(self):
         return self.name
+
+
+@receiver(post_delete, sender=Attachment)
+def release_attachment_blob(sender, instance, **kwargs):
+    """
+    Release the deleted row's reference on its shared blob. A signal
+    rather than ``delete()`` so queryset, cascade and admin deletes do
+    it too.
+    """
+    name = instance.file.name
+    if name:
+        instance.file.storage.delete(name)
+    elif instance.digest:
+        # A captured attachment (persist.EmailBatcher) has no file; its
+        # row holds one reference on the blob named by its digest.
+        instance.file.storage.delete(instance.digest)
@@ -0,0 +1,50 @@
+from django.core.files import File
+from django.core.files.storage import Storage
+from django.utils.deconstruct import deconstructible
+from django.utils.functional import cached_property
+
+from mailholder.blobstore import BlobStore
+from .utils import get_blob_root
+
+
+@deconstructible
+class BlobStorage(Storage):
+    """
+    A storage backed by ``mailholder.blobstore.BlobStore``.
+
+    Saved files are named by the SHA-256 digest of their content, so the
+    same attachment uploaded many times is stored once and just gains a
+    reference. Deleting a file drops a reference; the data goes away
+    when ``BlobStore.gc`` finds it unreferenced.
+    """
+    def __init__(self, location=None):
+        self.location = location
+
+    @cached_property
+    def store(self):
+        return BlobStore(self.location or get_blob_root())
+
+    def _open(self, name, mode='rb'):
+        return File(self.store.open(name), name)
+
+    def _save(self, name, content):
+        with self.store.writer() as writer:
+            for chunk in content.chunks():
+                writer.write(chunk)
+        return writer.digest
+
+    def get_available_name(self, name, max_length=None):
+        # The stored name is the digest, chosen by _save.
+        return name
+
+    def delete(self, name):
+        self.store.decref(name)
+
+    def exists(self, name):
+        return self.store.exists(name)
+
+    def size(self, name):
+        return self.store.size(name)
+
+    def path(self, name):
+        return self.store.path(name)
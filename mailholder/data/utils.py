@@ -118,6 +118,13 @@ def get_template_engine():
 def get_override_recipients():
     return ('OVERRIDE_RECIPIENTS', None)
 
+
+def get_blob_root():
+    """Directory of the content-addressed attachment store."""
+    media_root = getattr(settings, 'MEDIA_ROOT', '') or os.getcwd()
+    return get_config().get('BLOB_ROOT',
+                            os.path.join(media_root, 'mailholder_blobs'))
+
 def validate_email_with_name(value):
     """
     Validate email address.
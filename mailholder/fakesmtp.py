@@ -1,41 +1,144 @@
 import argparse
-import asyncore
+import asyncio
+import concurrent.futures
 import errno
 import logging
 import os
 import shutil
 import signal
-import smtpd
+import socket
+import tempfile
 import time
 
+from . import metrics
+from .blobstore import BlobStore
+from .ingest import MessageSink, store_attachments
+from .rawmessage import RawMessage
+from .smtpserver import SMTPServer
+from .spool import FSYNC_POLICIES, SPOOLS, FsyncPolicy
 
-class FakeSMTPServer(smtpd.SMTPServer):
+
+PARSE_SECONDS = metrics.stage('parse')
+SPOOL_SECONDS = metrics.stage('spool')
+
+
+class FakeSMTPServer(SMTPServer):
     """
     A SMTP server that catches all outgoing messages and saves them to
     a file. Messages are not sent to the recipients. Useful for
     testing mail functionality of other systems.
     """
-    def __init__(self, localaddr, mail_dir):
-        smtpd.SMTPServer.__init__(self, localaddr, None)
+    def __init__(self, localaddr, mail_dir, spool='flat', fsync=None,
+                 mime_index=False, **kwargs):
+        host, port = localaddr
+        kwargs.setdefault('spool_dir', mail_dir)
+        SMTPServer.__init__(self, self, host, port, **kwargs)
         self.mail_dir = mail_dir
+        self.spool = SPOOLS[spool](mail_dir, fsync)
+        self.mime_index = mime_index
+        self.persister = None
+        self.persist_executor = None
+        self.blob_store = None
 
         self.logger = logging.getLogger('fakesmtpd')
         self.logger.info("SMTP server started")
         self.logger.info("Mail directory %s", self.mail_dir)
 
+    async def open_DATA(self, server, session, envelope):
+        """Stream the message data straight into the spool."""
+        return MessageSink(self.spool.open(envelope.mail_from,
+                                           envelope.rcpt_tos))
+
+    async def handle_DATA(self, server, session, envelope):
+        """Adapt the asyncio handler hook to ``process_message``."""
+        if envelope.sink is None:
+            self.process_message(session.peer, envelope.mail_from,
+                                 envelope.rcpt_tos, envelope.content)
+            await self.spool.fsync.wait()
+            return '250 OK'
+        self.logger.info("Incoming mail from %s", envelope.mail_from)
+        with PARSE_SECONDS.time():
+            envelope.sink.close()
+            if self.mime_index:
+                self.write_structure(envelope.sink)
+        with SPOOL_SECONDS.time():
+            msg_id = envelope.sink.fp.commit()
+            self.logger.info("Logged mail %s for %s", msg_id,
+                             ', '.join(envelope.rcpt_tos))
+            await self.spool.fsync.wait()
+        if self.persister is not None:
+            await self.persist(msg_id, envelope)
+        return '250 OK'
+
+    def write_structure(self, sink):
+        """Store the MIME part offsets of a message before it is committed."""
+        if sink.header_size is None:
+            # No body; the headers run to the end of the data.
+            return sink.fp.write_structure()
+        return sink.fp.write_structure(sink.message, sink.header_size)
+
+    async def persist(self, msg_id, envelope):
+        """Queue a captured message for the database writer."""
+        if self.persist_executor is None:
+            # One thread: the blob store's sqlite connection stays in it.
+            self.persist_executor = concurrent.futures.ThreadPoolExecutor(
+                1, thread_name_prefix='persist')
+        captured = await asyncio.get_running_loop().run_in_executor(
+            self.persist_executor, self.capture, msg_id, envelope)
+        try:
+            await self.persister.put(captured)
+        except BaseException:
+            # Never queued (e.g. cancelled at shutdown while the queue
+            # was full): nothing will take over its blob references.
+            self.release_blobs(a['digest'] for a in captured.attachments)
+            raise
+
+    def release_blobs(self, digests):
+        """
+        Drop blob references taken by ``capture`` that no attachment row
+        took over; ``EmailBatcher`` calls it after each batch.
+        """
+        return asyncio.get_running_loop().run_in_executor(
+            self.persist_executor, self._decref, list(digests))
+
+    def _decref(self, digests):
+        for digest in digests:
+            self.blob_store.decref(digest)
+
+    def capture(self, msg_id, envelope):
+        """
+        Read a committed message back from the spool, store its
+        attachments and return the ``CapturedEmail``. Blocking; run off
+        the event loop by ``persist``.
+        """
+        from .persist import CapturedEmail
+
+        if self.mime_index:
+            # The parts are already located; no need to scan the data.
+            msg = self.spool.open_message(msg_id)
+        else:
+            msg = RawMessage(open(self.spool.path(msg_id), 'rb'),
+                             headers=envelope.sink.message,
+                             body_offset=envelope.sink.header_size)
+        try:
+            with PARSE_SECONDS.time():
+                attachments = ()
+                if self.blob_store is not None:
+                    attachments = store_attachments(msg, self.blob_store)
+                return CapturedEmail.from_message(
+                    msg_id, msg, envelope.mail_from, envelope.rcpt_tos,
+                    attachments)
+        finally:
+            msg.close()
+
     def process_message(self, peer, mailfrom, rcpttos, data):
         """
-        Write outgoing mail data to a temporary file. Write one file
-        per recipient.
+        Write outgoing mail data to the spool. The data is written once
+        and indexed for every recipient.
         """
         self.logger.info("Incoming mail from %s", mailfrom)
-        for recipient in rcpttos:
-            self.logger.info("Logging mail for %s", recipient)
-            filename = "{}.{:f}.mail".format(recipient, time.time())
-            path = os.path.join(self.mail_dir, filename)
-            with open(path, 'w') as f:
-                f.write(data)
-                f.write('\n')
+        msg_id = self.spool.deliver(mailfrom, rcpttos, data)
+        self.logger.info("Logged mail %s for %s", msg_id, ', '.join(rcpttos))
 
 
 def fakesmtpd_parser():
@@ -48,47 +151,263 @@ def fakesmtpd_parser():
     parser.add_argument('-p', '--port', type=int, default=25)
     parser.add_argument(
         '--mail-dir',
-        required=True,
-        help="directory to save incoming mail")
+        help="directory to save incoming mail; it is kept on exit. "
+             "Without it mail goes to a temporary directory that is "
+             "removed on exit")
     parser.add_argument(
         '--log-file',
         help="send output to a log file instead of stdout")
+    parser.add_argument(
+        '--timeout',
+        type=float,
+        default=300,
+        help="seconds an idle connection is kept open")
+    parser.add_argument(
+        '--max-sessions',
+        type=int,
+        default=None,
+        help="maximum number of concurrent SMTP sessions")
+    parser.add_argument(
+        '--max-message-size',
+        type=float,
+        default=32,
+        help="largest accepted message in megabytes, advertised as SIZE")
+    parser.add_argument(
+        '--max-inflight',
+        type=int,
+        default=None,
+        help="messages received or stored at once before MAIL, RCPT and "
+             "DATA are answered with 451")
+    parser.add_argument(
+        '--max-inflight-bytes',
+        type=float,
+        default=None,
+        help="megabytes of message data in progress before new messages "
+             "are answered with 451")
+    parser.add_argument(
+        '--min-free-space',
+        type=float,
+        default=None,
+        help="megabytes that must stay free on the mail directory's "
+             "filesystem; below it senders get a 421")
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help="number of capture processes sharing the port via "
+             "SO_REUSEPORT")
+    parser.add_argument(
+        '--spool',
+        choices=sorted(SPOOLS),
+        default='flat',
+        help="layout of the mail directory")
+    parser.add_argument(
+        '--fsync',
+        choices=FSYNC_POLICIES,
+        default='none',
+        help="when to force spooled mail to disk")
+    parser.add_argument(
+        '--fsync-batch',
+        type=int,
+        default=100,
+        help="messages per group commit with --fsync group")
+    parser.add_argument(
+        '--fsync-interval',
+        type=float,
+        default=10.0,
+        help="milliseconds before a group commit with --fsync group")
+    parser.add_argument(
+        '--mime-index',
+        action='store_true',
+        help="store the byte offsets of every MIME part next to each "
+             "message so readers slice parts instead of parsing")
+    parser.add_argument(
+        '--database',
+        action='store_true',
+        help="also store captured mail in the Tortoise database")
+    parser.add_argument(
+        '--blob-dir',
+        help="content-addressed attachment store used with --database")
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=100,
+        help="messages per database write with --database")
+    parser.add_argument(
+        '--flush-interval',
+        type=float,
+        default=50.0,
+        help="milliseconds before a partial batch is written")
+    parser.add_argument(
+        '--max-queue',
+        type=int,
+        default=1000,
+        help="messages waiting for the database before senders block")
+    parser.add_argument(
+        '--metrics-port',
+        type=int,
+        help="serve Prometheus metrics at /metrics on this port; worker "
+             "N of --workers listens on port + N")
+    parser.add_argument(
+        '--metrics-host',
+        default='127.0.0.1',
+        help="address the metrics endpoint listens on")
     return parser
 
 
-def attach_signal_handlers(server):
+def megabytes(value):
+    return None if value is None else int(value * 1024 * 1024)
+
+
+def attach_signal_handlers(server, loop):
     """Attach signal handlers to cleanly shutdown the SMTP server."""
     signals = {
         signal.SIGINT: 'SIGINT',
         signal.SIGTERM: 'SIGTERM',
     }
 
-    def shutdown(signum, _frame):
+    def shutdown(signum):
         """
         Log the signal received and close the SMTP server's
-        socket. The asyncore loop will end once all servers are
-        closed.
+        socket. The event loop will end once the server is closed.
         """
         server.logger.info("Received signal {}".format(signals[signum]))
         server.logger.info("Shutting down SMTP server")
         server.close()
 
     for signum in signals.keys():
-        signal.signal(signum, shutdown)
+        loop.add_signal_handler(signum, shutdown, signum)
+
+
+async def serve(args, worker=0, **kwargs):
+    if args.metrics_port is not None:
+        await metrics.serve_metrics(args.metrics_host,
+                                    args.metrics_port + worker)
+    fsync = FsyncPolicy(args.fsync, args.fsync_batch, args.fsync_interval)
+    server = FakeSMTPServer((args.host, args.port), args.mail_dir,
+                            spool=args.spool, fsync=fsync,
+                            mime_index=args.mime_index,
+                            timeout=args.timeout,
+                            max_sessions=args.max_sessions,
+                            data_size_limit=megabytes(args.max_message_size),
+                            max_inflight=args.max_inflight,
+                            max_inflight_bytes=megabytes(
+                                args.max_inflight_bytes),
+                            min_free_space=megabytes(args.min_free_space))
+    attach_signal_handlers(server, asyncio.get_running_loop())
+    persist_task = None
+    if args.database:
+        from .persist import EmailBatcher, init_database
+
+        await init_database()
+        if args.blob_dir:
+            server.blob_store = BlobStore(args.blob_dir)
+        server.persister = EmailBatcher(args.batch_size, args.flush_interval,
+                                        args.max_queue,
+                                        release=server.release_blobs)
+        persist_task = asyncio.create_task(server.persister.run())
+    await server.start(**kwargs)
+    await server.serve_forever()
+    await server.spool.fsync.wait()
+    server.spool.fsync.close()
+    if persist_task is not None:
+        await server.persister.stop()
+        await persist_task
+        if server.persist_executor is not None:
+            server.persist_executor.shutdown()
+        from tortoise import Tortoise
+
+        await Tortoise.close_connections()
+
+
+class Supervisor(object):
+    """
+    Fork ``workers`` capture processes that each bind the same address
+    with SO_REUSEPORT, so the kernel spreads connections across them.
+    Workers that exit while the supervisor is still running are
+    restarted. SIGINT/SIGTERM are forwarded to the workers.
+    """
+    def __init__(self, args, workers, restart_delay=1.0):
+        self.args = args
+        self.workers = workers
+        self.restart_delay = restart_delay
+        self.children = {}
+        self.stopping = False
+        self.logger = logging.getLogger('fakesmtpd')
+
+    def spawn(self, number):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                for signum in (signal.SIGINT, signal.SIGTERM):
+                    signal.signal(signum, signal.SIG_DFL)
+                asyncio.run(serve(self.args, number, reuse_port=True))
+            except BaseException:
+                self.logger.exception("Worker %d crashed", number)
+                code = 1
+            finally:
+                logging.shutdown()
+                os._exit(code)
+        self.logger.info("Started worker %d (pid %d)", number, pid)
+        self.children[pid] = number
+
+    def stop(self, signum, _frame):
+        self.logger.info("Received signal {}, stopping workers".format(
+            signal.Signals(signum).name))
+        self.stopping = True
+        for pid in self.children:
+            os.kill(pid, signal.SIGTERM)
+
+    def run(self):
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, self.stop)
+        for number in range(self.workers):
+            self.spawn(number)
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            number = self.children.pop(pid, None)
+            if number is None or self.stopping:
+                continue
+            self.logger.warning("Worker %d (pid %d) exited with status %d, "
+                                "restarting", number, pid,
+                                os.waitstatus_to_exitcode(status))
+            time.sleep(self.restart_delay)
+            if not self.stopping:
+                self.spawn(number)
 
 
 def main():
     """Parse the command line arguments and start the SMTP server."""
     parser = fakesmtpd_parser()
     args = parser.parse_args()
-    try:
-        os.makedirs(args.mail_dir, 0o775)
-    except OSError as e:
-        if e.errno != errno.EEXIST:
-            raise
+    if args.workers > 1 and not hasattr(socket, 'SO_REUSEPORT'):
+        parser.error("--workers requires SO_REUSEPORT support")
+    temp_dir = None
+    if args.mail_dir is None:
+        temp_dir = args.mail_dir = tempfile.mkdtemp(prefix='fakesmtpd-')
+    else:
+        try:
+            os.makedirs(args.mail_dir, 0o775)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
     logging.basicConfig(filename=args.log_file, level=logging.DEBUG)
 
-    server = FakeSMTPServer((args.host, args.port), args.mail_dir)
-    attach_signal_handlers(server)
-    asyncore.loop()
-    shutil.rmtree(args.mail_dir)
\ No newline at end of file
+    try:
+        if args.workers > 1:
+            Supervisor(args, args.workers).run()
+        else:
+            asyncio.run(serve(args))
+    finally:
+        # The spool (and any --blob-dir in it) is only thrown away when
+        # it is our own temporary directory.
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    main()
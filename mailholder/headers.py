@@ -0,0 +1,52 @@
+"""
+O(1) lookups in the IANA message header registry compiled into
+``headers_registry`` (see ``build_headers``).
+"""
+from .headers_registry import BY_PROTOCOL, HEADERS
+
+
+MAIL_PROTOCOLS = ('mail', 'mime')
+# Names a mail message can carry and still be "standard".
+MAIL_HEADERS = frozenset().union(*(BY_PROTOCOL.get(protocol, ())
+                                   for protocol in MAIL_PROTOCOLS))
+
+
+def lookup(name):
+    """Return the registry's ``HeaderInfo`` for ``name`` or None."""
+    return HEADERS.get(name.lower())
+
+
+def canonical(name):
+    """Return the registered spelling of ``name`` (e.g. Message-ID)."""
+    info = HEADERS.get(name.lower())
+    return info.name if info is not None else name
+
+
+def is_registered(name, protocols=MAIL_PROTOCOLS):
+    """Whether ``name`` is registered for one of ``protocols``."""
+    key = name.lower()
+    if protocols is MAIL_PROTOCOLS:
+        return key in MAIL_HEADERS
+    return any(key in BY_PROTOCOL.get(protocol, ()) for protocol in protocols)
+
+
+class HeaderFilter(object):
+    """
+    Include/exclude lists of header names compiled into frozen sets of
+    lower-case names. An empty ``include`` lets every header through;
+    ``exclude`` always wins.
+    """
+    __slots__ = ('include', 'exclude')
+
+    def __init__(self, include=(), exclude=()):
+        self.include = frozenset(name.lower() for name in include or ())
+        self.exclude = frozenset(name.lower() for name in exclude or ())
+
+    def __bool__(self):
+        return bool(self.include or self.exclude)
+
+    def allows(self, key):
+        """``key`` must already be lower case."""
+        if key in self.exclude:
+            return False
+        return not self.include or key in self.include
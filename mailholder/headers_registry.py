@@ -0,0 +1,698 @@
+# Generated by ``python -m mailholder.build_headers`` from
+# perm-headers.csv. Do not edit.
+import collections
+import sys
+from types import MappingProxyType
+
+
+# ``statuses`` pairs every protocol the field is registered for with its
+# status there ('' when the registry gives none).
+HeaderInfo = collections.namedtuple('HeaderInfo', 'name statuses')
+
+
+HEADERS = MappingProxyType({
+    sys.intern('a-im'): HeaderInfo(sys.intern('A-IM'), (('http', ''),)),
+    sys.intern('accept'): HeaderInfo(sys.intern('Accept'), (('http', 'standard'),)),
+    sys.intern('accept-additions'): HeaderInfo(sys.intern('Accept-Additions'), (('http', ''),)),
+    sys.intern('accept-charset'): HeaderInfo(sys.intern('Accept-Charset'), (('http', 'standard'),)),
+    sys.intern('accept-datetime'): HeaderInfo(sys.intern('Accept-Datetime'), (('http', 'informational'),)),
+    sys.intern('accept-encoding'): HeaderInfo(sys.intern('Accept-Encoding'), (('http', 'standard'),)),
+    sys.intern('accept-features'): HeaderInfo(sys.intern('Accept-Features'), (('http', ''),)),
+    sys.intern('accept-language'): HeaderInfo(sys.intern('Accept-Language'), (('http', 'standard'), ('mail', ''))),
+    sys.intern('accept-patch'): HeaderInfo(sys.intern('Accept-Patch'), (('http', ''),)),
+    sys.intern('accept-post'): HeaderInfo(sys.intern('Accept-Post'), (('http', 'standard'),)),
+    sys.intern('accept-ranges'): HeaderInfo(sys.intern('Accept-Ranges'), (('http', 'standard'),)),
+    sys.intern('age'): HeaderInfo(sys.intern('Age'), (('http', 'standard'),)),
+    sys.intern('allow'): HeaderInfo(sys.intern('Allow'), (('http', 'standard'),)),
+    sys.intern('alpn'): HeaderInfo(sys.intern('ALPN'), (('http', 'standard'),)),
+    sys.intern('also-control'): HeaderInfo(sys.intern('Also-Control'), (('netnews', 'obsoleted'),)),
+    sys.intern('alt-svc'): HeaderInfo(sys.intern('Alt-Svc'), (('http', 'standard'),)),
+    sys.intern('alt-used'): HeaderInfo(sys.intern('Alt-Used'), (('http', 'standard'),)),
+    sys.intern('alternate-recipient'): HeaderInfo(sys.intern('Alternate-Recipient'), (('mail', ''),)),
+    sys.intern('alternates'): HeaderInfo(sys.intern('Alternates'), (('http', ''),)),
+    sys.intern('apply-to-redirect-ref'): HeaderInfo(sys.intern('Apply-To-Redirect-Ref'), (('http', ''),)),
+    sys.intern('approved'): HeaderInfo(sys.intern('Approved'), (('netnews', 'standard'),)),
+    sys.intern('arc-authentication-results'): HeaderInfo(sys.intern('ARC-Authentication-Results'), (('mail', 'experimental'),)),
+    sys.intern('arc-message-signature'): HeaderInfo(sys.intern('ARC-Message-Signature'), (('mail', 'experimental'),)),
+    sys.intern('arc-seal'): HeaderInfo(sys.intern('ARC-Seal'), (('mail', 'experimental'),)),
+    sys.intern('archive'): HeaderInfo(sys.intern('Archive'), (('netnews', 'standard'),)),
+    sys.intern('archived-at'): HeaderInfo(sys.intern('Archived-At'), (('mail', 'standard'), ('netnews', 'standard'))),
+    sys.intern('article-names'): HeaderInfo(sys.intern('Article-Names'), (('netnews', 'obsoleted'),)),
+    sys.intern('article-updates'): HeaderInfo(sys.intern('Article-Updates'), (('netnews', 'obsoleted'),)),
+    sys.intern('authentication-control'): HeaderInfo(sys.intern('Authentication-Control'), (('http', 'experimental'),)),
+    sys.intern('authentication-info'): HeaderInfo(sys.intern('Authentication-Info'), (('http', 'standard'),)),
+    sys.intern('authentication-results'): HeaderInfo(sys.intern('Authentication-Results'), (('mail', 'standard'),)),
+    sys.intern('authorization'): HeaderInfo(sys.intern('Authorization'), (('http', 'standard'),)),
+    sys.intern('auto-submitted'): HeaderInfo(sys.intern('Auto-Submitted'), (('mail', 'standard'),)),
+    sys.intern('autoforwarded'): HeaderInfo(sys.intern('Autoforwarded'), (('mail', ''),)),
+    sys.intern('autosubmitted'): HeaderInfo(sys.intern('Autosubmitted'), (('mail', ''),)),
+    sys.intern('base'): HeaderInfo(sys.intern('Base'), (('mime', 'obsoleted'),)),
+    sys.intern('bcc'): HeaderInfo(sys.intern('Bcc'), (('mail', 'standard'),)),
+    sys.intern('body'): HeaderInfo(sys.intern('Body'), (('none', 'reserved'),)),
+    sys.intern('c-ext'): HeaderInfo(sys.intern('C-Ext'), (('http', ''),)),
+    sys.intern('c-man'): HeaderInfo(sys.intern('C-Man'), (('http', ''),)),
+    sys.intern('c-opt'): HeaderInfo(sys.intern('C-Opt'), (('http', ''),)),
+    sys.intern('c-pep'): HeaderInfo(sys.intern('C-PEP'), (('http', ''),)),
+    sys.intern('c-pep-info'): HeaderInfo(sys.intern('C-PEP-Info'), (('http', ''),)),
+    sys.intern('cache-control'): HeaderInfo(sys.intern('Cache-Control'), (('http', 'standard'),)),
+    sys.intern('cal-managed-id'): HeaderInfo(sys.intern('Cal-Managed-ID'), (('http', 'standard'),)),
+    sys.intern('caldav-timezones'): HeaderInfo(sys.intern('CalDAV-Timezones'), (('http', 'standard'),)),
+    sys.intern('cancel-key'): HeaderInfo(sys.intern('Cancel-Key'), (('netnews', 'standard'),)),
+    sys.intern('cancel-lock'): HeaderInfo(sys.intern('Cancel-Lock'), (('netnews', 'standard'),)),
+    sys.intern('cc'): HeaderInfo(sys.intern('Cc'), (('mail', 'standard'),)),
+    sys.intern('cdn-loop'): HeaderInfo(sys.intern('CDN-Loop'), (('http', 'standard'),)),
+    sys.intern('cert-not-after'): HeaderInfo(sys.intern('Cert-Not-After'), (('http', 'standard'),)),
+    sys.intern('cert-not-before'): HeaderInfo(sys.intern('Cert-Not-Before'), (('http', 'standard'),)),
+    sys.intern('close'): HeaderInfo(sys.intern('Close'), (('http', 'reserved'),)),
+    sys.intern('comments'): HeaderInfo(sys.intern('Comments'), (('mail', 'standard'), ('netnews', 'standard'))),
+    sys.intern('connection'): HeaderInfo(sys.intern('Connection'), (('http', 'standard'),)),
+    sys.intern('content-alternative'): HeaderInfo(sys.intern('Content-Alternative'), (('mime', ''),)),
+    sys.intern('content-base'): HeaderInfo(sys.intern('Content-Base'), (('http', 'obsoleted'), ('mime', 'obsoleted'))),
+    sys.intern('content-description'): HeaderInfo(sys.intern('Content-Description'), (('mime', ''),)),
+    sys.intern('content-disposition'): HeaderInfo(sys.intern('Content-Disposition'), (('http', 'standard'), ('mime', ''))),
+    sys.intern('content-duration'): HeaderInfo(sys.intern('Content-Duration'), (('mime', ''),)),
+    sys.intern('content-encoding'): HeaderInfo(sys.intern('Content-Encoding'), (('http', 'standard'),)),
+    sys.intern('content-features'): HeaderInfo(sys.intern('Content-features'), (('mime', ''),)),
+    sys.intern('content-id'): HeaderInfo(sys.intern('Content-ID'), (('http', ''), ('mime', ''))),
+    sys.intern('content-identifier'): HeaderInfo(sys.intern('Content-Identifier'), (('mail', ''),)),
+    sys.intern('content-language'): HeaderInfo(sys.intern('Content-Language'), (('http', 'standard'), ('mime', ''))),
+    sys.intern('content-length'): HeaderInfo(sys.intern('Content-Length'), (('http', 'standard'),)),
+    sys.intern('content-location'): HeaderInfo(sys.intern('Content-Location'), (('http', 'standard'), ('mime', ''))),
+    sys.intern('content-md5'): HeaderInfo(sys.intern('Content-MD5'), (('http', ''), ('mime', ''))),
+    sys.intern('content-range'): HeaderInfo(sys.intern('Content-Range'), (('http', 'standard'),)),
+    sys.intern('content-return'): HeaderInfo(sys.intern('Content-Return'), (('mail', ''),)),
+    sys.intern('content-script-type'): HeaderInfo(sys.intern('Content-Script-Type'), (('http', ''),)),
+    sys.intern('content-style-type'): HeaderInfo(sys.intern('Content-Style-Type'), (('http', ''),)),
+    sys.intern('content-transfer-encoding'): HeaderInfo(sys.intern('Content-Transfer-Encoding'), (('mime', ''),)),
+    sys.intern('content-translation-type'): HeaderInfo(sys.intern('Content-Translation-Type'), (('mime', 'standard'),)),
+    sys.intern('content-type'): HeaderInfo(sys.intern('Content-Type'), (('http', 'standard'), ('mime', ''))),
+    sys.intern('content-version'): HeaderInfo(sys.intern('Content-Version'), (('http', ''),)),
+    sys.intern('control'): HeaderInfo(sys.intern('Control'), (('netnews', 'standard'),)),
+    sys.intern('conversion'): HeaderInfo(sys.intern('Conversion'), (('mail', ''),)),
+    sys.intern('conversion-with-loss'): HeaderInfo(sys.intern('Conversion-With-Loss'), (('mail', ''),)),
+    sys.intern('cookie'): HeaderInfo(sys.intern('Cookie'), (('http', 'standard'),)),
+    sys.intern('cookie2'): HeaderInfo(sys.intern('Cookie2'), (('http', 'obsoleted'),)),
+    sys.intern('dasl'): HeaderInfo(sys.intern('DASL'), (('http', 'standard'),)),
+    sys.intern('date'): HeaderInfo(sys.intern('Date'), (('http', 'standard'), ('mail', 'standard'), ('netnews', 'standard'))),
+    sys.intern('date-received'): HeaderInfo(sys.intern('Date-Received'), (('netnews', 'obsoleted'),)),
+    sys.intern('dav'): HeaderInfo(sys.intern('DAV'), (('http', 'standard'),)),
+    sys.intern('default-style'): HeaderInfo(sys.intern('Default-Style'), (('http', ''),)),
+    sys.intern('deferred-delivery'): HeaderInfo(sys.intern('Deferred-Delivery'), (('mail', ''),)),
+    sys.intern('delivery-date'): HeaderInfo(sys.intern('Delivery-Date'), (('mail', ''),)),
+    sys.intern('delta-base'): HeaderInfo(sys.intern('Delta-Base'), (('http', ''),)),
+    sys.intern('depth'): HeaderInfo(sys.intern('Depth'), (('http', 'standard'),)),
+    sys.intern('derived-from'): HeaderInfo(sys.intern('Derived-From'), (('http', ''),)),
+    sys.intern('destination'): HeaderInfo(sys.intern('Destination'), (('http', 'standard'),)),
+    sys.intern('differential-id'): HeaderInfo(sys.intern('Differential-ID'), (('http', ''),)),
+    sys.intern('digest'): HeaderInfo(sys.intern('Digest'), (('http', ''),)),
+    sys.intern('discarded-x400-ipms-extensions'): HeaderInfo(sys.intern('Discarded-X400-IPMS-Extensions'), (('mail', ''),)),
+    sys.intern('discarded-x400-mts-extensions'): HeaderInfo(sys.intern('Discarded-X400-MTS-Extensions'), (('mail', ''),)),
+    sys.intern('disclose-recipients'): HeaderInfo(sys.intern('Disclose-Recipients'), (('mail', ''),)),
+    sys.intern('disposition-notification-options'): HeaderInfo(sys.intern('Disposition-Notification-Options'), (('mail', ''),)),
+    sys.intern('disposition-notification-to'): HeaderInfo(sys.intern('Disposition-Notification-To'), (('mail', ''),)),
+    sys.intern('distribution'): HeaderInfo(sys.intern('Distribution'), (('netnews', 'standard'),)),
+    sys.intern('dkim-signature'): HeaderInfo(sys.intern('DKIM-Signature'), (('mail', 'standard'),)),
+    sys.intern('dl-expansion-history'): HeaderInfo(sys.intern('DL-Expansion-History'), (('mail', ''),)),
+    sys.intern('downgraded-bcc'): HeaderInfo(sys.intern('Downgraded-Bcc'), (('mail', 'obsoleted'),)),
+    sys.intern('downgraded-cc'): HeaderInfo(sys.intern('Downgraded-Cc'), (('mail', 'obsoleted'),)),
+    sys.intern('downgraded-disposition-notification-to'): HeaderInfo(sys.intern('Downgraded-Disposition-Notification-To'), (('mail', 'obsoleted'),)),
+    sys.intern('downgraded-final-recipient'): HeaderInfo(sys.intern('Downgraded-Final-Recipient'), (('mail', 'standard'),)),
+    sys.intern('downgraded-from'): HeaderInfo(sys.intern('Downgraded-From'), (('mail', 'obsoleted'),)),
+    sys.intern('downgraded-in-reply-to'): HeaderInfo(sys.intern('Downgraded-In-Reply-To'), (('mail', 'standard'),)),
+    sys.intern('downgraded-mail-from'): HeaderInfo(sys.intern('Downgraded-Mail-From'), (('mail', 'obsoleted'),)),
+    sys.intern('downgraded-message-id'): HeaderInfo(sys.intern('Downgraded-Message-Id'), (('mail', 'standard'),)),
+    sys.intern('downgraded-original-recipient'): HeaderInfo(sys.intern('Downgraded-Original-Recipient'), (('mail', 'standard'),)),
+    sys.intern('downgraded-rcpt-to'): HeaderInfo(sys.intern('Downgraded-Rcpt-To'), (('mail', 'obsoleted'),)),
+    sys.intern('downgraded-references'): HeaderInfo(sys.intern('Downgraded-References'), (('mail', 'standard'),)),
+    sys.intern('downgraded-reply-to'): HeaderInfo(sys.intern('Downgraded-Reply-To'), (('mail', 'obsoleted'),)),
+    sys.intern('downgraded-resent-bcc'): HeaderInfo(sys.intern('Downgraded-Resent-Bcc'), (('mail', 'obsoleted'),)),
+    sys.intern('downgraded-resent-cc'): HeaderInfo(sys.intern('Downgraded-Resent-Cc'), (('mail', 'obsoleted'),)),
+    sys.intern('downgraded-resent-from'): HeaderInfo(sys.intern('Downgraded-Resent-From'), (('mail', 'obsoleted'),)),
+    sys.intern('downgraded-resent-reply-to'): HeaderInfo(sys.intern('Downgraded-Resent-Reply-To'), (('mail', 'obsoleted'),)),
+    sys.intern('downgraded-resent-sender'): HeaderInfo(sys.intern('Downgraded-Resent-Sender'), (('mail', 'obsoleted'),)),
+    sys.intern('downgraded-resent-to'): HeaderInfo(sys.intern('Downgraded-Resent-To'), (('mail', 'obsoleted'),)),
+    sys.intern('downgraded-return-path'): HeaderInfo(sys.intern('Downgraded-Return-Path'), (('mail', 'obsoleted'),)),
+    sys.intern('downgraded-sender'): HeaderInfo(sys.intern('Downgraded-Sender'), (('mail', 'obsoleted'),)),
+    sys.intern('downgraded-to'): HeaderInfo(sys.intern('Downgraded-To'), (('mail', 'obsoleted'),)),
+    sys.intern('early-data'): HeaderInfo(sys.intern('Early-Data'), (('http', 'standard'),)),
+    sys.intern('encoding'): HeaderInfo(sys.intern('Encoding'), (('mail', ''),)),
+    sys.intern('encrypted'): HeaderInfo(sys.intern('Encrypted'), (('mail', ''),)),
+    sys.intern('etag'): HeaderInfo(sys.intern('ETag'), (('http', 'standard'),)),
+    sys.intern('expect'): HeaderInfo(sys.intern('Expect'), (('http', 'standard'),)),
+    sys.intern('expect-ct'): HeaderInfo(sys.intern('Expect-CT'), (('http', 'experimental'),)),
+    sys.intern('expires'): HeaderInfo(sys.intern('Expires'), (('http', 'standard'), ('mail', ''), ('netnews', 'standard'))),
+    sys.intern('expiry-date'): HeaderInfo(sys.intern('Expiry-Date'), (('mail', ''),)),
+    sys.intern('ext'): HeaderInfo(sys.intern('Ext'), (('http', ''),)),
+    sys.intern('followup-to'): HeaderInfo(sys.intern('Followup-To'), (('netnews', 'standard'),)),
+    sys.intern('forwarded'): HeaderInfo(sys.intern('Forwarded'), (('http', 'standard'),)),
+    sys.intern('from'): HeaderInfo(sys.intern('From'), (('http', 'standard'), ('mail', 'standard'), ('netnews', 'standard'))),
+    sys.intern('generate-delivery-report'): HeaderInfo(sys.intern('Generate-Delivery-Report'), (('mail', ''),)),
+    sys.intern('getprofile'): HeaderInfo(sys.intern('GetProfile'), (('http', ''),)),
+    sys.intern('hobareg'): HeaderInfo(sys.intern('Hobareg'), (('http', 'experimental'),)),
+    sys.intern('host'): HeaderInfo(sys.intern('Host'), (('http', 'standard'),)),
+    sys.intern('http2-settings'): HeaderInfo(sys.intern('HTTP2-Settings'), (('http', 'standard'),)),
+    sys.intern('if'): HeaderInfo(sys.intern('If'), (('http', 'standard'),)),
+    sys.intern('if-match'): HeaderInfo(sys.intern('If-Match'), (('http', 'standard'),)),
+    sys.intern('if-modified-since'): HeaderInfo(sys.intern('If-Modified-Since'), (('http', 'standard'),)),
+    sys.intern('if-none-match'): HeaderInfo(sys.intern('If-None-Match'), (('http', 'standard'),)),
+    sys.intern('if-range'): HeaderInfo(sys.intern('If-Range'), (('http', 'standard'),)),
+    sys.intern('if-schedule-tag-match'): HeaderInfo(sys.intern('If-Schedule-Tag-Match'), (('http', 'standard'),)),
+    sys.intern('if-unmodified-since'): HeaderInfo(sys.intern('If-Unmodified-Since'), (('http', 'standard'),)),
+    sys.intern('im'): HeaderInfo(sys.intern('IM'), (('http', ''),)),
+    sys.intern('importance'): HeaderInfo(sys.intern('Importance'), (('mail', ''),)),
+    sys.intern('in-reply-to'): HeaderInfo(sys.intern('In-Reply-To'), (('mail', 'standard'),)),
+    sys.intern('include-referred-token-binding-id'): HeaderInfo(sys.intern('Include-Referred-Token-Binding-ID'), (('http', 'standard'),)),
+    sys.intern('incomplete-copy'): HeaderInfo(sys.intern('Incomplete-Copy'), (('mail', ''),)),
+    sys.intern('injection-date'): HeaderInfo(sys.intern('Injection-Date'), (('netnews', 'standard'),)),
+    sys.intern('injection-info'): HeaderInfo(sys.intern('Injection-Info'), (('netnews', 'standard'),)),
+    sys.intern('keep-alive'): HeaderInfo(sys.intern('Keep-Alive'), (('http', ''),)),
+    sys.intern('keywords'): HeaderInfo(sys.intern('Keywords'), (('mail', 'standard'), ('netnews', 'standard'))),
+    sys.intern('label'): HeaderInfo(sys.intern('Label'), (('http', ''),)),
+    sys.intern('language'): HeaderInfo(sys.intern('Language'), (('mail', ''),)),
+    sys.intern('last-modified'): HeaderInfo(sys.intern('Last-Modified'), (('http', 'standard'),)),
+    sys.intern('latest-delivery-time'): HeaderInfo(sys.intern('Latest-Delivery-Time'), (('mail', ''),)),
+    sys.intern('lines'): HeaderInfo(sys.intern('Lines'), (('netnews', 'deprecated'),)),
+    sys.intern('link'): HeaderInfo(sys.intern('Link'), (('http', 'standard'),)),
+    sys.intern('list-archive'): HeaderInfo(sys.intern('List-Archive'), (('mail', ''),)),
+    sys.intern('list-help'): HeaderInfo(sys.intern('List-Help'), (('mail', ''),)),
+    sys.intern('list-id'): HeaderInfo(sys.intern('List-ID'), (('mail', ''),)),
+    sys.intern('list-owner'): HeaderInfo(sys.intern('List-Owner'), (('mail', ''),)),
+    sys.intern('list-post'): HeaderInfo(sys.intern('List-Post'), (('mail', ''),)),
+    sys.intern('list-subscribe'): HeaderInfo(sys.intern('List-Subscribe'), (('mail', ''),)),
+    sys.intern('list-unsubscribe'): HeaderInfo(sys.intern('List-Unsubscribe'), (('mail', ''),)),
+    sys.intern('list-unsubscribe-post'): HeaderInfo(sys.intern('List-Unsubscribe-Post'), (('mail', 'standard'),)),
+    sys.intern('location'): HeaderInfo(sys.intern('Location'), (('http', 'standard'),)),
+    sys.intern('lock-token'): HeaderInfo(sys.intern('Lock-Token'), (('http', 'standard'),)),
+    sys.intern('man'): HeaderInfo(sys.intern('Man'), (('http', ''),)),
+    sys.intern('max-forwards'): HeaderInfo(sys.intern('Max-Forwards'), (('http', 'standard'),)),
+    sys.intern('memento-datetime'): HeaderInfo(sys.intern('Memento-Datetime'), (('http', 'informational'),)),
+    sys.intern('message-context'): HeaderInfo(sys.intern('Message-Context'), (('mail', ''),)),
+    sys.intern('message-id'): HeaderInfo(sys.intern('Message-ID'), (('mail', 'standard'), ('netnews', 'standard'))),
+    sys.intern('message-type'): HeaderInfo(sys.intern('Message-Type'), (('mail', ''),)),
+    sys.intern('meter'): HeaderInfo(sys.intern('Meter'), (('http', ''),)),
+    sys.intern('mime-version'): HeaderInfo(sys.intern('MIME-Version'), (('http', 'standard'), ('mime', ''))),
+    sys.intern('mmhs-acp127-message-identifier'): HeaderInfo(sys.intern('MMHS-Acp127-Message-Identifier'), (('mail', ''),)),
+    sys.intern('mmhs-codress-message-indicator'): HeaderInfo(sys.intern('MMHS-Codress-Message-Indicator'), (('mail', ''),)),
+    sys.intern('mmhs-copy-precedence'): HeaderInfo(sys.intern('MMHS-Copy-Precedence'), (('mail', ''),)),
+    sys.intern('mmhs-exempted-address'): HeaderInfo(sys.intern('MMHS-Exempted-Address'), (('mail', ''),)),
+    sys.intern('mmhs-extended-authorisation-info'): HeaderInfo(sys.intern('MMHS-Extended-Authorisation-Info'), (('mail', ''),)),
+    sys.intern('mmhs-handling-instructions'): HeaderInfo(sys.intern('MMHS-Handling-Instructions'), (('mail', ''),)),
+    sys.intern('mmhs-message-instructions'): HeaderInfo(sys.intern('MMHS-Message-Instructions'), (('mail', ''),)),
+    sys.intern('mmhs-message-type'): HeaderInfo(sys.intern('MMHS-Message-Type'), (('mail', ''),)),
+    sys.intern('mmhs-originator-plad'): HeaderInfo(sys.intern('MMHS-Originator-PLAD'), (('mail', ''),)),
+    sys.intern('mmhs-originator-reference'): HeaderInfo(sys.intern('MMHS-Originator-Reference'), (('mail', ''),)),
+    sys.intern('mmhs-other-recipients-indicator-cc'): HeaderInfo(sys.intern('MMHS-Other-Recipients-Indicator-CC'), (('mail', ''),)),
+    sys.intern('mmhs-other-recipients-indicator-to'): HeaderInfo(sys.intern('MMHS-Other-Recipients-Indicator-To'), (('mail', ''),)),
+    sys.intern('mmhs-primary-precedence'): HeaderInfo(sys.intern('MMHS-Primary-Precedence'), (('mail', ''),)),
+    sys.intern('mmhs-subject-indicator-codes'): HeaderInfo(sys.intern('MMHS-Subject-Indicator-Codes'), (('mail', ''),)),
+    sys.intern('mt-priority'): HeaderInfo(sys.intern('MT-Priority'), (('mail', 'standard'),)),
+    sys.intern('negotiate'): HeaderInfo(sys.intern('Negotiate'), (('http', ''),)),
+    sys.intern('newsgroups'): HeaderInfo(sys.intern('Newsgroups'), (('netnews', 'standard'),)),
+    sys.intern('nntp-posting-date'): HeaderInfo(sys.intern('NNTP-Posting-Date'), (('netnews', 'obsoleted'),)),
+    sys.intern('nntp-posting-host'): HeaderInfo(sys.intern('NNTP-Posting-Host'), (('netnews', 'obsoleted'),)),
+    sys.intern('obsoletes'): HeaderInfo(sys.intern('Obsoletes'), (('mail', ''),)),
+    sys.intern('opt'): HeaderInfo(sys.intern('Opt'), (('http', ''),)),
+    sys.intern('optional-www-authenticate'): HeaderInfo(sys.intern('Optional-WWW-Authenticate'), (('http', 'experimental'),)),
+    sys.intern('ordering-type'): HeaderInfo(sys.intern('Ordering-Type'), (('http', 'standard'),)),
+    sys.intern('organization'): HeaderInfo(sys.intern('Organization'), (('mail', 'informational'), ('netnews', 'standard'))),
+    sys.intern('origin'): HeaderInfo(sys.intern('Origin'), (('http', 'standard'),)),
+    sys.intern('original-encoded-information-types'): HeaderInfo(sys.intern('Original-Encoded-Information-Types'), (('mail', ''),)),
+    sys.intern('original-from'): HeaderInfo(sys.intern('Original-From'), (('mail', 'standard'),)),
+    sys.intern('original-message-id'): HeaderInfo(sys.intern('Original-Message-ID'), (('mail', ''),)),
+    sys.intern('original-recipient'): HeaderInfo(sys.intern('Original-Recipient'), (('mail', 'standard'),)),
+    sys.intern('original-sender'): HeaderInfo(sys.intern('Original-Sender'), (('netnews', 'standard'),)),
+    sys.intern('original-subject'): HeaderInfo(sys.intern('Original-Subject'), (('mail', 'standard'),)),
+    sys.intern('originator-return-address'): HeaderInfo(sys.intern('Originator-Return-Address'), (('mail', ''),)),
+    sys.intern('oscore'): HeaderInfo(sys.intern('OSCORE'), (('http', 'standard'),)),
+    sys.intern('overwrite'): HeaderInfo(sys.intern('Overwrite'), (('http', 'standard'),)),
+    sys.intern('p3p'): HeaderInfo(sys.intern('P3P'), (('http', ''),)),
+    sys.intern('path'): HeaderInfo(sys.intern('Path'), (('netnews', 'standard'),)),
+    sys.intern('pep'): HeaderInfo(sys.intern('PEP'), (('http', ''),)),
+    sys.intern('pep-info'): HeaderInfo(sys.intern('Pep-Info'), (('http', ''),)),
+    sys.intern('pics-label'): HeaderInfo(sys.intern('PICS-Label'), (('http', ''), ('mail', ''))),
+    sys.intern('position'): HeaderInfo(sys.intern('Position'), (('http', 'standard'),)),
+    sys.intern('posting-version'): HeaderInfo(sys.intern('Posting-Version'), (('netnews', 'obsoleted'),)),
+    sys.intern('pragma'): HeaderInfo(sys.intern('Pragma'), (('http', 'standard'),)),
+    sys.intern('prefer'): HeaderInfo(sys.intern('Prefer'), (('http', 'standard'),)),
+    sys.intern('preference-applied'): HeaderInfo(sys.intern('Preference-Applied'), (('http', 'standard'),)),
+    sys.intern('prevent-nondelivery-report'): HeaderInfo(sys.intern('Prevent-NonDelivery-Report'), (('mail', ''),)),
+    sys.intern('priority'): HeaderInfo(sys.intern('Priority'), (('mail', ''),)),
+    sys.intern('profileobject'): HeaderInfo(sys.intern('ProfileObject'), (('http', ''),)),
+    sys.intern('protocol'): HeaderInfo(sys.intern('Protocol'), (('http', ''),)),
+    sys.intern('protocol-info'): HeaderInfo(sys.intern('Protocol-Info'), (('http', ''),)),
+    sys.intern('protocol-query'): HeaderInfo(sys.intern('Protocol-Query'), (('http', ''),)),
+    sys.intern('protocol-request'): HeaderInfo(sys.intern('Protocol-Request'), (('http', ''),)),
+    sys.intern('proxy-authenticate'): HeaderInfo(sys.intern('Proxy-Authenticate'), (('http', 'standard'),)),
+    sys.intern('proxy-authentication-info'): HeaderInfo(sys.intern('Proxy-Authentication-Info'), (('http', 'standard'),)),
+    sys.intern('proxy-authorization'): HeaderInfo(sys.intern('Proxy-Authorization'), (('http', 'standard'),)),
+    sys.intern('proxy-features'): HeaderInfo(sys.intern('Proxy-Features'), (('http', ''),)),
+    sys.intern('proxy-instruction'): HeaderInfo(sys.intern('Proxy-Instruction'), (('http', ''),)),
+    sys.intern('public'): HeaderInfo(sys.intern('Public'), (('http', ''),)),
+    sys.intern('public-key-pins'): HeaderInfo(sys.intern('Public-Key-Pins'), (('http', 'standard'),)),
+    sys.intern('public-key-pins-report-only'): HeaderInfo(sys.intern('Public-Key-Pins-Report-Only'), (('http', 'standard'),)),
+    sys.intern('range'): HeaderInfo(sys.intern('Range'), (('http', 'standard'),)),
+    sys.intern('received'): HeaderInfo(sys.intern('Received'), (('mail', 'standard'),)),
+    sys.intern('received-spf'): HeaderInfo(sys.intern('Received-SPF'), (('mail', 'standard'),)),
+    sys.intern('redirect-ref'): HeaderInfo(sys.intern('Redirect-Ref'), (('http', ''),)),
+    sys.intern('references'): HeaderInfo(sys.intern('References'), (('mail', 'standard'), ('netnews', 'standard'))),
+    sys.intern('referer'): HeaderInfo(sys.intern('Referer'), (('http', 'standard'),)),
+    sys.intern('relay-version'): HeaderInfo(sys.intern('Relay-Version'), (('netnews', 'obsoleted'),)),
+    sys.intern('replay-nonce'): HeaderInfo(sys.intern('Replay-Nonce'), (('http', 'standard'),)),
+    sys.intern('reply-by'): HeaderInfo(sys.intern('Reply-By'), (('mail', ''),)),
+    sys.intern('reply-to'): HeaderInfo(sys.intern('Reply-To'), (('mail', 'standard'), ('netnews', 'standard'))),
+    sys.intern('require-recipient-valid-since'): HeaderInfo(sys.intern('Require-Recipient-Valid-Since'), (('mail', 'standard'),)),
+    sys.intern('resent-bcc'): HeaderInfo(sys.intern('Resent-Bcc'), (('mail', 'standard'),)),
+    sys.intern('resent-cc'): HeaderInfo(sys.intern('Resent-Cc'), (('mail', 'standard'),)),
+    sys.intern('resent-date'): HeaderInfo(sys.intern('Resent-Date'), (('mail', 'standard'),)),
+    sys.intern('resent-from'): HeaderInfo(sys.intern('Resent-From'), (('mail', 'standard'),)),
+    sys.intern('resent-message-id'): HeaderInfo(sys.intern('Resent-Message-ID'), (('mail', 'standard'),)),
+    sys.intern('resent-reply-to'): HeaderInfo(sys.intern('Resent-Reply-To'), (('mail', 'obsoleted'),)),
+    sys.intern('resent-sender'): HeaderInfo(sys.intern('Resent-Sender'), (('mail', 'standard'),)),
+    sys.intern('resent-to'): HeaderInfo(sys.intern('Resent-To'), (('mail', 'standard'),)),
+    sys.intern('retry-after'): HeaderInfo(sys.intern('Retry-After'), (('http', 'standard'),)),
+    sys.intern('return-path'): HeaderInfo(sys.intern('Return-Path'), (('mail', 'standard'),)),
+    sys.intern('safe'): HeaderInfo(sys.intern('Safe'), (('http', ''),)),
+    sys.intern('schedule-reply'): HeaderInfo(sys.intern('Schedule-Reply'), (('http', 'standard'),)),
+    sys.intern('schedule-tag'): HeaderInfo(sys.intern('Schedule-Tag'), (('http', 'standard'),)),
+    sys.intern('sec-token-binding'): HeaderInfo(sys.intern('Sec-Token-Binding'), (('http', 'standard'),)),
+    sys.intern('sec-websocket-accept'): HeaderInfo(sys.intern('Sec-WebSocket-Accept'), (('http', 'standard'),)),
+    sys.intern('sec-websocket-extensions'): HeaderInfo(sys.intern('Sec-WebSocket-Extensions'), (('http', 'standard'),)),
+    sys.intern('sec-websocket-key'): HeaderInfo(sys.intern('Sec-WebSocket-Key'), (('http', 'standard'),)),
+    sys.intern('sec-websocket-protocol'): HeaderInfo(sys.intern('Sec-WebSocket-Protocol'), (('http', 'standard'),)),
+    sys.intern('sec-websocket-version'): HeaderInfo(sys.intern('Sec-WebSocket-Version'), (('http', 'standard'),)),
+    sys.intern('security-scheme'): HeaderInfo(sys.intern('Security-Scheme'), (('http', ''),)),
+    sys.intern('see-also'): HeaderInfo(sys.intern('See-Also'), (('netnews', 'obsoleted'),)),
+    sys.intern('sender'): HeaderInfo(sys.intern('Sender'), (('mail', 'standard'), ('netnews', 'standard'))),
+    sys.intern('sensitivity'): HeaderInfo(sys.intern('Sensitivity'), (('mail', ''),)),
+    sys.intern('server'): HeaderInfo(sys.intern('Server'), (('http', 'standard'),)),
+    sys.intern('set-cookie'): HeaderInfo(sys.intern('Set-Cookie'), (('http', 'standard'),)),
+    sys.intern('set-cookie2'): HeaderInfo(sys.intern('Set-Cookie2'), (('http', 'obsoleted'),)),
+    sys.intern('setprofile'): HeaderInfo(sys.intern('SetProfile'), (('http', ''),)),
+    sys.intern('slug'): HeaderInfo(sys.intern('SLUG'), (('http', 'standard'),)),
+    sys.intern('soapaction'): HeaderInfo(sys.intern('SoapAction'), (('http', ''),)),
+    sys.intern('solicitation'): HeaderInfo(sys.intern('Solicitation'), (('mail', ''),)),
+    sys.intern('status-uri'): HeaderInfo(sys.intern('Status-URI'), (('http', ''),)),
+    sys.intern('strict-transport-security'): HeaderInfo(sys.intern('Strict-Transport-Security'), (('http', 'standard'),)),
+    sys.intern('subject'): HeaderInfo(sys.intern('Subject'), (('mail', 'standard'), ('netnews', 'standard'))),
+    sys.intern('summary'): HeaderInfo(sys.intern('Summary'), (('netnews', 'standard'),)),
+    sys.intern('sunset'): HeaderInfo(sys.intern('Sunset'), (('http', 'informational'),)),
+    sys.intern('supersedes'): HeaderInfo(sys.intern('Supersedes'), (('mail', ''), ('netnews', 'standard'))),
+    sys.intern('surrogate-capability'): HeaderInfo(sys.intern('Surrogate-Capability'), (('http', ''),)),
+    sys.intern('surrogate-control'): HeaderInfo(sys.intern('Surrogate-Control'), (('http', ''),)),
+    sys.intern('tcn'): HeaderInfo(sys.intern('TCN'), (('http', ''),)),
+    sys.intern('te'): HeaderInfo(sys.intern('TE'), (('http', 'standard'),)),
+    sys.intern('timeout'): HeaderInfo(sys.intern('Timeout'), (('http', 'standard'),)),
+    sys.intern('tls-report-domain'): HeaderInfo(sys.intern('TLS-Report-Domain'), (('mail', 'standard'),)),
+    sys.intern('tls-report-submitter'): HeaderInfo(sys.intern('TLS-Report-Submitter'), (('mail', 'standard'),)),
+    sys.intern('tls-required'): HeaderInfo(sys.intern('TLS-Required'), (('mail', 'standard'),)),
+    sys.intern('to'): HeaderInfo(sys.intern('To'), (('mail', 'standard'),)),
+    sys.intern('topic'): HeaderInfo(sys.intern('Topic'), (('http', 'standard'),)),
+    sys.intern('trailer'): HeaderInfo(sys.intern('Trailer'), (('http', 'standard'),)),
+    sys.intern('transfer-encoding'): HeaderInfo(sys.intern('Transfer-Encoding'), (('http', 'standard'),)),
+    sys.intern('ttl'): HeaderInfo(sys.intern('TTL'), (('http', 'standard'),)),
+    sys.intern('upgrade'): HeaderInfo(sys.intern('Upgrade'), (('http', 'standard'),)),
+    sys.intern('urgency'): HeaderInfo(sys.intern('Urgency'), (('http', 'standard'),)),
+    sys.intern('uri'): HeaderInfo(sys.intern('URI'), (('http', ''),)),
+    sys.intern('user-agent'): HeaderInfo(sys.intern('User-Agent'), (('http', 'standard'), ('netnews', 'standard'))),
+    sys.intern('variant-vary'): HeaderInfo(sys.intern('Variant-Vary'), (('http', ''),)),
+    sys.intern('vary'): HeaderInfo(sys.intern('Vary'), (('http', 'standard'),)),
+    sys.intern('vbr-info'): HeaderInfo(sys.intern('VBR-Info'), (('mail', 'standard'),)),
+    sys.intern('via'): HeaderInfo(sys.intern('Via'), (('http', 'standard'),)),
+    sys.intern('want-digest'): HeaderInfo(sys.intern('Want-Digest'), (('http', ''),)),
+    sys.intern('warning'): HeaderInfo(sys.intern('Warning'), (('http', 'standard'),)),
+    sys.intern('www-authenticate'): HeaderInfo(sys.intern('WWW-Authenticate'), (('http', 'standard'),)),
+    sys.intern('x-content-type-options'): HeaderInfo(sys.intern('X-Content-Type-Options'), (('http', 'standard'),)),
+    sys.intern('x-frame-options'): HeaderInfo(sys.intern('X-Frame-Options'), (('http', 'informational'),)),
+    sys.intern('x400-content-identifier'): HeaderInfo(sys.intern('X400-Content-Identifier'), (('mail', ''),)),
+    sys.intern('x400-content-return'): HeaderInfo(sys.intern('X400-Content-Return'), (('mail', ''),)),
+    sys.intern('x400-content-type'): HeaderInfo(sys.intern('X400-Content-Type'), (('mail', ''),)),
+    sys.intern('x400-mts-identifier'): HeaderInfo(sys.intern('X400-MTS-Identifier'), (('mail', ''),)),
+    sys.intern('x400-originator'): HeaderInfo(sys.intern('X400-Originator'), (('mail', ''),)),
+    sys.intern('x400-received'): HeaderInfo(sys.intern('X400-Received'), (('mail', ''),)),
+    sys.intern('x400-recipients'): HeaderInfo(sys.intern('X400-Recipients'), (('mail', ''),)),
+    sys.intern('x400-trace'): HeaderInfo(sys.intern('X400-Trace'), (('mail', ''),)),
+    sys.intern('xref'): HeaderInfo(sys.intern('Xref'), (('netnews', 'standard'),)),
+})
+
+
+# Lower-case names registered for each protocol.
+BY_PROTOCOL = MappingProxyType({
+    'http': frozenset((
+        'a-im',
+        'accept',
+        'accept-additions',
+        'accept-charset',
+        'accept-datetime',
+        'accept-encoding',
+        'accept-features',
+        'accept-language',
+        'accept-patch',
+        'accept-post',
+        'accept-ranges',
+        'age',
+        'allow',
+        'alpn',
+        'alt-svc',
+        'alt-used',
+        'alternates',
+        'apply-to-redirect-ref',
+        'authentication-control',
+        'authentication-info',
+        'authorization',
+        'c-ext',
+        'c-man',
+        'c-opt',
+        'c-pep',
+        'c-pep-info',
+        'cache-control',
+        'cal-managed-id',
+        'caldav-timezones',
+        'cdn-loop',
+        'cert-not-after',
+        'cert-not-before',
+        'close',
+        'connection',
+        'content-base',
+        'content-disposition',
+        'content-encoding',
+        'content-id',
+        'content-language',
+        'content-length',
+        'content-location',
+        'content-md5',
+        'content-range',
+        'content-script-type',
+        'content-style-type',
+        'content-type',
+        'content-version',
+        'cookie',
+        'cookie2',
+        'dasl',
+        'date',
+        'dav',
+        'default-style',
+        'delta-base',
+        'depth',
+        'derived-from',
+        'destination',
+        'differential-id',
+        'digest',
+        'early-data',
+        'etag',
+        'expect',
+        'expect-ct',
+        'expires',
+        'ext',
+        'forwarded',
+        'from',
+        'getprofile',
+        'hobareg',
+        'host',
+        'http2-settings',
+        'if',
+        'if-match',
+        'if-modified-since',
+        'if-none-match',
+        'if-range',
+        'if-schedule-tag-match',
+        'if-unmodified-since',
+        'im',
+        'include-referred-token-binding-id',
+        'keep-alive',
+        'label',
+        'last-modified',
+        'link',
+        'location',
+        'lock-token',
+        'man',
+        'max-forwards',
+        'memento-datetime',
+        'meter',
+        'mime-version',
+        'negotiate',
+        'opt',
+        'optional-www-authenticate',
+        'ordering-type',
+        'origin',
+        'oscore',
+        'overwrite',
+        'p3p',
+        'pep',
+        'pep-info',
+        'pics-label',
+        'position',
+        'pragma',
+        'prefer',
+        'preference-applied',
+        'profileobject',
+        'protocol',
+        'protocol-info',
+        'protocol-query',
+        'protocol-request',
+        'proxy-authenticate',
+        'proxy-authentication-info',
+        'proxy-authorization',
+        'proxy-features',
+        'proxy-instruction',
+        'public',
+        'public-key-pins',
+        'public-key-pins-report-only',
+        'range',
+        'redirect-ref',
+        'referer',
+        'replay-nonce',
+        'retry-after',
+        'safe',
+        'schedule-reply',
+        'schedule-tag',
+        'sec-token-binding',
+        'sec-websocket-accept',
+        'sec-websocket-extensions',
+        'sec-websocket-key',
+        'sec-websocket-protocol',
+        'sec-websocket-version',
+        'security-scheme',
+        'server',
+        'set-cookie',
+        'set-cookie2',
+        'setprofile',
+        'slug',
+        'soapaction',
+        'status-uri',
+        'strict-transport-security',
+        'sunset',
+        'surrogate-capability',
+        'surrogate-control',
+        'tcn',
+        'te',
+        'timeout',
+        'topic',
+        'trailer',
+        'transfer-encoding',
+        'ttl',
+        'upgrade',
+        'urgency',
+        'uri',
+        'user-agent',
+        'variant-vary',
+        'vary',
+        'via',
+        'want-digest',
+        'warning',
+        'www-authenticate',
+        'x-content-type-options',
+        'x-frame-options',
+    )),
+    'mail': frozenset((
+        'accept-language',
+        'alternate-recipient',
+        'arc-authentication-results',
+        'arc-message-signature',
+        'arc-seal',
+        'archived-at',
+        'authentication-results',
+        'auto-submitted',
+        'autoforwarded',
+        'autosubmitted',
+        'bcc',
+        'cc',
+        'comments',
+        'content-identifier',
+        'content-return',
+        'conversion',
+        'conversion-with-loss',
+        'date',
+        'deferred-delivery',
+        'delivery-date',
+        'discarded-x400-ipms-extensions',
+        'discarded-x400-mts-extensions',
+        'disclose-recipients',
+        'disposition-notification-options',
+        'disposition-notification-to',
+        'dkim-signature',
+        'dl-expansion-history',
+        'downgraded-bcc',
+        'downgraded-cc',
+        'downgraded-disposition-notification-to',
+        'downgraded-final-recipient',
+        'downgraded-from',
+        'downgraded-in-reply-to',
+        'downgraded-mail-from',
+        'downgraded-message-id',
+        'downgraded-original-recipient',
+        'downgraded-rcpt-to',
+        'downgraded-references',
+        'downgraded-reply-to',
+        'downgraded-resent-bcc',
+        'downgraded-resent-cc',
+        'downgraded-resent-from',
+        'downgraded-resent-reply-to',
+        'downgraded-resent-sender',
+        'downgraded-resent-to',
+        'downgraded-return-path',
+        'downgraded-sender',
+        'downgraded-to',
+        'encoding',
+        'encrypted',
+        'expires',
+        'expiry-date',
+        'from',
+        'generate-delivery-report',
+        'importance',
+        'in-reply-to',
+        'incomplete-copy',
+        'keywords',
+        'language',
+        'latest-delivery-time',
+        'list-archive',
+        'list-help',
+        'list-id',
+        'list-owner',
+        'list-post',
+        'list-subscribe',
+        'list-unsubscribe',
+        'list-unsubscribe-post',
+        'message-context',
+        'message-id',
+        'message-type',
+        'mmhs-acp127-message-identifier',
+        'mmhs-codress-message-indicator',
+        'mmhs-copy-precedence',
+        'mmhs-exempted-address',
+        'mmhs-extended-authorisation-info',
+        'mmhs-handling-instructions',
+        'mmhs-message-instructions',
+        'mmhs-message-type',
+        'mmhs-originator-plad',
+        'mmhs-originator-reference',
+        'mmhs-other-recipients-indicator-cc',
+        'mmhs-other-recipients-indicator-to',
+        'mmhs-primary-precedence',
+        'mmhs-subject-indicator-codes',
+        'mt-priority',
+        'obsoletes',
+        'organization',
+        'original-encoded-information-types',
+        'original-from',
+        'original-message-id',
+        'original-recipient',
+        'original-subject',
+        'originator-return-address',
+        'pics-label',
+        'prevent-nondelivery-report',
+        'priority',
+        'received',
+        'received-spf',
+        'references',
+        'reply-by',
+        'reply-to',
+        'require-recipient-valid-since',
+        'resent-bcc',
+        'resent-cc',
+        'resent-date',
+        'resent-from',
+        'resent-message-id',
+        'resent-reply-to',
+        'resent-sender',
+        'resent-to',
+        'return-path',
+        'sender',
+        'sensitivity',
+        'solicitation',
+        'subject',
+        'supersedes',
+        'tls-report-domain',
+        'tls-report-submitter',
+        'tls-required',
+        'to',
+        'vbr-info',
+        'x400-content-identifier',
+        'x400-content-return',
+        'x400-content-type',
+        'x400-mts-identifier',
+        'x400-originator',
+        'x400-received',
+        'x400-recipients',
+        'x400-trace',
+    )),
+    'mime': frozenset((
+        'base',
+        'content-alternative',
+        'content-base',
+        'content-description',
+        'content-disposition',
+        'content-duration',
+        'content-features',
+        'content-id',
+        'content-language',
+        'content-location',
+        'content-md5',
+        'content-transfer-encoding',
+        'content-translation-type',
+        'content-type',
+        'mime-version',
+    )),
+    'netnews': frozenset((
+        'also-control',
+        'approved',
+        'archive',
+        'archived-at',
+        'article-names',
+        'article-updates',
+        'cancel-key',
+        'cancel-lock',
+        'comments',
+        'control',
+        'date',
+        'date-received',
+        'distribution',
+        'expires',
+        'followup-to',
+        'from',
+        'injection-date',
+        'injection-info',
+        'keywords',
+        'lines',
+        'message-id',
+        'newsgroups',
+        'nntp-posting-date',
+        'nntp-posting-host',
+        'organization',
+        'original-sender',
+        'path',
+        'posting-version',
+        'references',
+        'relay-version',
+        'reply-to',
+        'see-also',
+        'sender',
+        'subject',
+        'summary',
+        'supersedes',
+        'user-agent',
+        'xref',
+    )),
+    'none': frozenset((
+        'body',
+    )),
+})
@@ -15,10 +15,14 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
 
+import atexit
+import os
 import random
+import datetime
 import email
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
 from email.header import decode_header
-import mailbox
 import email.utils
 from itertools import count
 try:
@@ -31,6 +35,28 @@ from zope.interface import implementer
 from twisted.mail import imap4
 from twisted.python import log
 
+from . import metrics
+from . import msgcache
+from .journal import Journal
+from .mboxfile import MboxFile
+from .rawmessage import RawMessage
+from .text import DEFAULT_CHARSET, iter_text, lookup_codec
+
+# Exposed with the rest of metrics.REGISTRY by metrics.serve_metrics.
+APPENDED = metrics.REGISTRY.counter(
+    'mailholder_imap_appended_messages_total',
+    'Messages added to IMAP mailboxes.')
+APPENDED_BYTES = metrics.REGISTRY.counter(
+    'mailholder_imap_appended_bytes_total',
+    'Bytes of messages added to IMAP mailboxes.')
+EXPUNGED = metrics.REGISTRY.counter(
+    'mailholder_imap_expunged_messages_total',
+    'Messages expunged from IMAP mailboxes.')
+APPEND_SECONDS = metrics.stage('imap_append')
+FETCH_SECONDS = metrics.stage('imap_fetch')
+STORE_SECONDS = metrics.stage('imap_store')
+EXPUNGE_SECONDS = metrics.stage('imap_expunge')
+
 UID_GENERATOR = count()
 LAST_UID = next(UID_GENERATOR)
 
@@ -40,6 +66,26 @@ DELETED = r'\Deleted'
 FLAGGED = r'\Flagged'
 ANSWERED = r'\Answered'
 RECENT = r'\Recent'
+DRAFT = r'\Draft'
+
+# SEARCH keys answered from the flag index alone: key -> (flag, present).
+FLAG_KEYS = {
+    'ANSWERED': (ANSWERED, True), 'UNANSWERED': (ANSWERED, False),
+    'DELETED': (DELETED, True), 'UNDELETED': (DELETED, False),
+    'DRAFT': (DRAFT, True), 'UNDRAFT': (DRAFT, False),
+    'FLAGGED': (FLAGGED, True), 'UNFLAGGED': (FLAGGED, False),
+    'RECENT': (RECENT, True), 'OLD': (RECENT, False),
+    'SEEN': (SEEN, True), 'UNSEEN': (SEEN, False),
+}
+HEADER_KEYS = ('FROM', 'TO', 'CC', 'BCC', 'SUBJECT')
+DATE_KEYS = {
+    'BEFORE': (False, lambda day, date: day < date),
+    'ON': (False, lambda day, date: day == date),
+    'SINCE': (False, lambda day, date: day >= date),
+    'SENTBEFORE': (True, lambda day, date: day < date),
+    'SENTON': (True, lambda day, date: day == date),
+    'SENTSINCE': (True, lambda day, date: day >= date),
+}
 
 
 def get_counter():
@@ -48,48 +94,181 @@ def get_counter():
     return LAST_UID
 
 
-@implementer(imap4.IMailbox)
+def _text(token):
+    if isinstance(token, bytes):
+        return token.decode('utf-8', 'replace')
+    return token
+
+
+def _day(value):
+    """The date of an RFC 2822 date string, or None."""
+    try:
+        return email.utils.parsedate_to_datetime(value).date()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+@implementer(imap4.IMailbox, imap4.ISearchableMailbox)
 class MemoryIMAPMailbox(object):
 
     mbox = None
+    journal = None
+    bodies = None
 
     def addMessage(self, msg_fp, flags=None, date=None):
         if flags is None:
             flags = []
         if date is None:
             date = email.utils.formatdate()
-        msg = Message(msg_fp, flags, date)
-        if self.mbox is not None:
-            self.mbox.add(msg.msg)
+        with APPEND_SECONDS.time():
+            msg = Message(msg_fp, flags, date, self.next_uid())
+            if self.journal is not None:
+                offset = self.journal.add(msg.uid, msg.flags, date,
+                                          msg.raw.read())
+                if self.bodies is not None:
+                    msg = CompactMessage(
+                        self.bodies, msg.uid, offset, msg.raw.size,
+                        msg.headers, msg.raw.body_offset, msg.flags, date)
+            elif self.mbox is not None:
+                self.mbox_keys[msg.uid] = self.mbox.add(msg.raw.read())
+            self._insert(msg)
+            self.flush()
+        APPENDED.inc()
+        APPENDED_BYTES.inc(msg.getSize())
+
+    def _insert(self, msg):
         self.msgs.append(msg)
-        self.flush()
-
-    def setFile(self, path):
-        log.msg("creating mbox file %s" % path)
-        self.mbox = mailbox.mbox(path)
+        self.uids.append(msg.uid)
+        self.by_uid[msg.uid] = msg
+        for flag in msg.flags:
+            self.flag_index[flag].add(msg.uid)
+
+    def setFile(self, path, journal=False, checkpoint_every=1000,
+                compact=False, cache_bytes=msgcache.DEFAULT_MAX_BYTES):
+        """
+        Keep the mailbox in the mbox file ``path`` or, with ``journal``,
+        in an append-only ``journal.Journal``: messages and flag changes
+        are appended as records and an existing journal is replayed
+        into the mailbox. Call it before any message is added.
+
+        With ``compact`` (journal only) messages keep nothing but their
+        headers and flags in memory; bodies are read from the mapped
+        journal and at most ``cache_bytes`` of parsed messages are kept.
+
+        The file is closed by ``close``, at the latest when the process
+        exits.
+        """
+        atexit.register(self.close)
+        if not journal:
+            log.msg("creating mbox file %s" % path)
+            self.mbox = MboxFile(path)
+            return
+        log.msg("opening journal %s" % path)
+        self.journal = Journal(path, checkpoint_every)
+        self.journal.open(self.uidvalidity)
+        self.uidvalidity = self.journal.uidvalidity
+        self.last_uid = max(self.last_uid, self.journal.last_uid)
+        if compact:
+            self.bodies = JournalBodies(self.journal, cache_bytes)
+            for uid, entry in self.journal.messages.items():
+                self._insert(self.bodies.message(uid, entry))
+            return
+        fp = self.journal.map()
+        for uid, entry in self.journal.messages.items():
+            self._insert(Message(self.journal.message(fp, uid), entry.flags,
+                                 entry.date, uid))
 
     def flush(self):
-        if self.mbox is not None:
+        if self.journal is not None:
+            self.journal.flush()
+        elif self.mbox is not None:
             log.msg("flushing mailbox")
             self.mbox.flush()
 
+    def close(self):
+        """Checkpoint and close the journal or mbox file of the mailbox."""
+        if self.journal is not None:
+            log.msg("closing journal %s" % self.journal.path)
+            self.journal.close()
+        elif self.mbox is not None:
+            log.msg("closing mailbox")
+            self.mbox.close()
+
+    def _sync_journal(self):
+        """Flush the journal after a change, compacting it when due."""
+        if self.journal is None:
+            return
+        if self.journal.wants_compaction:
+            self.compact_journal()
+        else:
+            self.journal.flush()
+
+    def compact_journal(self):
+        """
+        Rewrite the journal without its dead records (``Journal.compact``)
+        and point the messages at their data in the new file.
+        """
+        log.msg("compacting journal %s" % self.journal.path)
+        self.journal.compact()
+        entries = self.journal.messages
+        if self.bodies is not None:
+            self.bodies.fp = None
+            for msg in self.msgs:
+                msg.offset = entries[msg.uid].offset
+            return
+        # Earlier maps keep the replaced file alive until dropped.
+        fp = self.journal.map()
+        for msg in self.msgs:
+            entry = entries[msg.uid]
+            msg.raw = RawMessage(fp, entry.offset, msg.headers,
+                                 msg.raw.body_offset,
+                                 entry.offset + entry.size)
+
     def __init__(self):
         # can't use OrderedDict as need to support 2.6 :(
         self.msgs = []
+        # The UIDs of self.msgs in the same (ascending) order, so UID
+        # ranges are found by bisection, and the message of every UID.
+        self.uids = []
+        self.by_uid = {}
+        self.last_uid = 0
+        # The UIDs carrying each flag, kept in step by addMessage, store
+        # and expunge so STATUS and flag searches never scan self.msgs.
+        self.flag_index = defaultdict(set)
+        # The MboxFile key of every message written to self.mbox.
+        self.mbox_keys = {}
         self.listeners = []
         self.uidvalidity = random.randint(1000000, 9999999)
 
+    def next_uid(self):
+        """Allocate the next UID of this mailbox."""
+        self.last_uid += 1
+        return self.last_uid
+
     def _get_msgs(self, msg_set, uid):
+        """
+        Return ``{sequence number: message}`` for ``msg_set``, a set of
+        UIDs or of (1-based) sequence numbers. Each range costs a
+        bisection (or a slice) plus the messages it matches.
+        """
         if not self.msgs:
             return {}
         if uid:
-            msg_set.last = LAST_UID
-            uids = set(msg_set)
-            return {i: msg for i, msg in enumerate(self.msgs)
-                                if msg.uid in uids}
+            # '*' is the highest UID in use.
+            msg_set.last = self.uids[-1]
         else:
             msg_set.last = len(self.msgs)
-            return {i: self.msgs[i - 1] for i in msg_set}
+        found = {}
+        for low, high in sorted(msg_set.ranges):
+            if uid:
+                start = bisect_left(self.uids, low)
+                stop = bisect_right(self.uids, high)
+            else:
+                start = max(low, 1) - 1
+                stop = min(high, len(self.msgs))
+            for i in range(start, stop):
+                found[i + 1] = self.msgs[i]
+        return found
 
     def getHierarchicalDelimiter(self):
         return "."
@@ -102,10 +281,10 @@ class MemoryIMAPMailbox(object):
         return len(self.msgs)
 
     def getRecentCount(self):
-        return len([m for m in self.msgs if RECENT in m.getFlags()])
+        return len(self.flag_index.get(RECENT, ()))
 
     def getUnseenCount(self):
-        return len([m for m in self.msgs if UNSEEN in m.getFlags()])
+        return len(self.flag_index.get(UNSEEN, ()))
 
     def isWriteable(self):
         return True
@@ -117,11 +296,12 @@ class MemoryIMAPMailbox(object):
         return self.msgs[messageNum - 1].uid
 
     def getUIDNext(self):
-        return LAST_UID + 1
+        return self.last_uid + 1
 
     def fetch(self, msg_set, uid):
-        messages = self._get_msgs(msg_set, uid)
-        return list(messages.items())
+        with FETCH_SECONDS.time():
+            messages = self._get_msgs(msg_set, uid)
+            return list(messages.items())
 
     def addListener(self, listener):
         self.listeners.append(listener)
@@ -135,77 +315,235 @@ class MemoryIMAPMailbox(object):
         return imap4.statusRequestHelper(self, path)
 
     def store(self, msg_set, flags, mode, uid):
+        with STORE_SECONDS.time():
+            return self._store(msg_set, flags, mode, uid)
+
+    def _store(self, msg_set, flags, mode, uid):
         messages = self._get_msgs(msg_set, uid)
         setFlags = {}
         for seq, msg in messages.items():
             if mode == 0:  # replace flags
-                msg.flags = set(flags)
-            else:
-                for flag in flags:
-                    # mode 1 is append, mode -1 is delete
-                    if mode == 1 and flag not in msg.flags:
-                        msg.flags.add(flag)
-                    elif mode == -1 and flag in msg.flags:
-                        msg.flags.remove(flag)
+                new = set(flags)
+            elif mode == 1:  # append
+                new = msg.flags.union(flags)
+            else:  # mode -1 is delete
+                new = msg.flags.difference(flags)
+            self._set_flags(msg, new)
             setFlags[seq] = msg.flags
+        self._sync_journal()
         return setFlags
 
+    def _set_flags(self, msg, flags):
+        """Give ``msg`` the set ``flags``, updating the flag index."""
+        if self.journal is not None and flags != msg.flags:
+            self.journal.set_flags(msg.uid, flags)
+        self._unindex_flags(msg, msg.flags - flags)
+        for flag in flags - msg.flags:
+            self.flag_index[flag].add(msg.uid)
+        msg.flags = flags
+
+    def _unindex_flags(self, msg, flags):
+        for flag in flags:
+            uids = self.flag_index.get(flag)
+            if uids is not None:
+                uids.discard(msg.uid)
+                if not uids:
+                    del self.flag_index[flag]
+
+    def search(self, query, uid):
+        """
+        Return the UIDs (or sequence numbers) of the messages matching
+        the parsed SEARCH ``query``. Criteria are applied left to right
+        to the set of candidate UIDs: flag keys are set operations on
+        the flag index and only the remaining candidates are looked at
+        for header, body, size and date keys.
+        """
+        tokens = list(query)
+        candidates = set(self.uids)
+        while tokens:
+            candidates = self._search_key(tokens, candidates)
+        if uid:
+            return sorted(candidates)
+        return [bisect_left(self.uids, u) + 1 for u in sorted(candidates)]
+
+    def _search_key(self, tokens, candidates):
+        """Apply the search key at the front of ``tokens``."""
+        token = tokens.pop(0)
+        if isinstance(token, list):
+            tokens = list(token)
+            while tokens:
+                candidates = self._search_key(tokens, candidates)
+            return candidates
+        key = _text(token).upper()
+        if key == 'ALL':
+            return candidates
+        if key in FLAG_KEYS:
+            flag, present = FLAG_KEYS[key]
+            uids = self.flag_index.get(flag, set())
+            return candidates & uids if present else candidates - uids
+        if key == 'NEW':
+            return (candidates & self.flag_index.get(RECENT, set())) - \
+                self.flag_index.get(SEEN, set())
+        if key in ('KEYWORD', 'UNKEYWORD'):
+            uids = self.flag_index.get(_text(tokens.pop(0)), set())
+            return candidates & uids if key == 'KEYWORD' \
+                else candidates - uids
+        if key == 'NOT':
+            return candidates - self._search_key(tokens, candidates)
+        if key == 'OR':
+            return self._search_key(tokens, candidates) | \
+                self._search_key(tokens, candidates)
+        if key == 'UID' or key[:1].isdigit() or key[:1] == '*':
+            if key == 'UID':
+                matched = self._get_msgs(self._id_list(tokens.pop(0)), True)
+            else:
+                matched = self._get_msgs(self._id_list(token), False)
+            return candidates & set(msg.uid for msg in matched.values())
+        match = self._message_filter(key, tokens)
+        return set(u for u in candidates if match(self.by_uid[u]))
+
+    @staticmethod
+    def _id_list(token):
+        if not isinstance(token, bytes):
+            token = token.encode('ascii')
+        return imap4.parseIdList(token)
+
+    def _message_filter(self, key, tokens):
+        """Return a predicate on messages for a key the index can't answer."""
+        if key in HEADER_KEYS or key == 'HEADER':
+            name = _text(tokens.pop(0)) if key == 'HEADER' else key
+            needle = _text(tokens.pop(0)).lower()
+            return lambda msg: any(
+                needle in str(value).lower()
+                for value in msg.headers.get_all(name, ()))
+        if key in ('BODY', 'TEXT'):
+            needle = _text(tokens.pop(0)).lower().encode('utf-8')
+            if key == 'BODY':
+                return lambda msg: needle in msg.raw.read_body().lower()
+            return lambda msg: needle in msg.raw.read().lower()
+        if key in ('LARGER', 'SMALLER'):
+            size = int(_text(tokens.pop(0)))
+            if key == 'LARGER':
+                return lambda msg: msg.getSize() > size
+            return lambda msg: msg.getSize() < size
+        if key in DATE_KEYS:
+            sent, compare = DATE_KEYS[key]
+            try:
+                date = datetime.datetime.strptime(
+                    _text(tokens.pop(0)), '%d-%b-%Y').date()
+            except ValueError:
+                raise imap4.IllegalQueryError("Bad date in search")
+
+            def match(msg):
+                day = _day(msg.headers.get('Date') if sent else msg.date)
+                return day is not None and compare(day, date)
+            return match
+        raise imap4.IllegalQueryError("Unsupported search key: %s" % key)
+
     def expunge(self):
-        "remove all messages marked for deletion"
+        """
+        Remove all messages marked for deletion in one pass and return
+        their sequence numbers as the EXPUNGE responses must give them:
+        each one counts the messages already expunged before it.
+        """
         removed = []
-        for i, msg in enumerate(self.msgs[:]):
-            if DELETED in msg.flags:
-                # use less efficient remove() because the indexes are changing
-                self.msgs.remove(msg)
-                removed.append(msg.uid)
-        self.flush()
+        with EXPUNGE_SECONDS.time():
+            deleted = self.flag_index.get(DELETED)
+            if not deleted:
+                return removed
+            kept, gone = [], []
+            for seq, msg in enumerate(self.msgs, 1):
+                if msg.uid in deleted:
+                    removed.append(seq - len(gone))
+                    gone.append(msg)
+                else:
+                    kept.append(msg)
+            self.msgs = kept
+            self.uids = [msg.uid for msg in kept]
+            for msg in gone:
+                del self.by_uid[msg.uid]
+                self._unindex_flags(msg, msg.flags)
+                if self.bodies is not None:
+                    self.bodies.cache.discard(msg.uid)
+            if self.journal is not None:
+                self.journal.expunge(msg.uid for msg in gone)
+                self._sync_journal()
+            elif self.mbox is not None:
+                self._compact_mbox(gone)
+        EXPUNGED.inc(len(removed))
         return removed
 
+    def _compact_mbox(self, removed):
+        """Cut ``removed`` out of the mbox file (``MboxFile.remove``)."""
+        self.mbox.remove([self.mbox_keys.pop(msg.uid) for msg in removed
+                          if msg.uid in self.mbox_keys])
+
     def destroy(self):
         "complete remove the mailbox and all its contents"
         raise imap4.MailboxException("Permission denied.")
 
 
 INBOX = MemoryIMAPMailbox()
+metrics.REGISTRY.gauge('mailholder_imap_inbox_messages',
+                       'Messages in the IMAP inbox.',
+                       function=INBOX.getMessageCount)
 
 
 @implementer(imap4.IMessagePart)
 class MessagePart(object):
+    __slots__ = ('raw', 'headers', '_msg')
 
     def __init__(self, msg):
-        self.msg = msg
+        # A RawMessage is only parsed up to the end of its headers until
+        # something needs the MIME tree.
+        if isinstance(msg, RawMessage):
+            self.raw = msg
+            self.headers = msg.headers
+            self._msg = None
+        else:
+            self.raw = None
+            self.headers = msg
+            self._msg = msg
+
+    @property
+    def msg(self):
+        if self._msg is None:
+            self._msg = self.raw.message
+        return self._msg
 
     def to_json(self):
         import json
         out = {}
-            for header in self.msg.keys():
-                out[header] = self.msg.get(header, '')
-            if self.msg.is_multipart:
-                num = 0
-                for payload in self.msg.get_payload():
-                    out['Content'] = {}
-                    out['Content']['MultiPart' + str(num)] = {}
-                    for key in payload.keys():
-                        out['Content']['MultiPart' + str(num)][key] = payload.get(key, '')
-                    out['Content']['MultiPart' + str(num)]['Content'] = payload._payload
-                    num += 1
-            else:
-                out['Content'] = self.msg._payload
-            out =
-            return json.dumps(out)
+        for header in self.msg.keys():
+            out[header] = self.msg.get(header, '')
+        if self.msg.is_multipart:
+            num = 0
+            for payload in self.msg.get_payload():
+                out['Content'] = {}
+                out['Content']['MultiPart' + str(num)] = {}
+                for key in payload.keys():
+                    out['Content']['MultiPart' + str(num)][key] = payload.get(key, '')
+                out['Content']['MultiPart' + str(num)]['Content'] = payload._payload
+                num += 1
+        else:
+            out['Content'] = self.msg._payload
+        return json.dumps(out)
 
     def getHeaders(self, negate, *names):
         headers = {}
         if negate:
-            for header in self.msg.keys():
+            for header in self.headers.keys():
                 if header.lower() not in names:
-                    headers[header] = self.msg.get(header, '')
+                    headers[header] = self.headers.get(header, '')
         else:
             for name in names:
-                headers[name] = self.msg.get(name, '')
+                headers[name] = self.headers.get(name, '')
         return headers
 
     def getBodyFile(self):
+        if self.raw is not None and not self.raw.is_multipart():
+            # The raw body is exactly the payload a full parse would give.
+            return StringIO(self.raw.read_body())
         if self.msg.is_multipart():
             raise TypeError("Requested body file of a multipart message")
         # On Python 3, the payload may be a string created using
@@ -220,29 +558,39 @@ class MessagePart(object):
         return StringIO(payload)
 
     def getSize(self):
+        if self.raw is not None:
+            return self.raw.size
         return len(self.msg.as_string())
 
     def isMultipart(self):
+        if self.raw is not None:
+            return self.raw.is_multipart()
         return self.msg.is_multipart()
 
     def getSubPart(self, part):
+        if self.raw is not None and not self.raw.parsed:
+            # Located by byte offsets (or loaded from the spool's
+            # structure sidecar); the part is a slice of the raw data.
+            if self.raw.has_subparts():
+                return MessagePart(self.raw.subpart(part))
+            raise TypeError('Not a multipart message')
         if self.msg.is_multipart():
             return MessagePart(self.msg.get_payload()[part])
         raise TypeError("Not a multipart message")
 
     def parse_charset(self, default='utf8'):
-        charset = self.msg.get_charset()
+        charset = self.headers.get_charset()
         if charset is not None:
             return charset
 
-        for chunk in self.msg['Content-type'].split(';'):
+        for chunk in self.headers.get('Content-type', '').split(';'):
             if 'charset' in chunk:
                 return chunk.split('=')[1]
         return default
 
     def unicode(self, header):
         """Converts a header to unicode"""
-        value = self.msg[header]
+        value = self.headers[header]
         parts = decode_header(value)
         return ''.join(
             decoded_part.decode(codec)
@@ -252,20 +600,23 @@ class MessagePart(object):
 
 #@implementer(imap4.IMessage)
 class Message(MessagePart):
-
-    def __init__(self, fp, flags, date):
-        # email.message_from_binary_file is new in Python 3.3,
-        # and we need to use it if we are on Python3.
-        if hasattr(email, 'message_from_binary_file'):
-            parsed_message = email.message_from_binary_file(fp)
-        else:
-            parsed_message = email.message_from_file(fp)
-        super(Message, self).__init__(parsed_message)
-        self.data = str(self.msg)
-        self.uid = get_counter()
+    __slots__ = ('uid', 'flags', 'date')
+
+    def __init__(self, fp, flags, date, uid=None):
+        # Keep the raw bytes and parse only the headers; FETCH of a body
+        # part or payloads() builds the MIME tree on demand. A RawMessage
+        # (e.g. from Spool.open_message) is used as it is.
+        if not isinstance(fp, RawMessage):
+            fp = RawMessage.from_file(fp)
+        super(Message, self).__init__(fp)
+        self.uid = get_counter() if uid is None else uid
         self.flags = set(flags)
         self.date = date
 
+    @property
+    def data(self):
+        return self.raw.read().decode('ascii', 'surrogateescape')
+
     def getUID(self):
         return self.uid
 
@@ -280,9 +631,98 @@ class Message(MessagePart):
         return "<From: %s, To: %s, Uid: %s>" % (h['from'], h['to'], self.uid)
 
     def payloads(self):
+        default = str(self.parse_charset())
         for part in self.msg.walk():
-            if part.get_content_maintype() == 'multipart':
+            if part.is_multipart():
                 continue
             payload = part.get_payload(decode=True)
-            enc = self.parse_charset()
-            yield payload.decode(enc)
+            yield payload.decode(
+                lookup_codec(part.get_content_charset(), default))
+
+    def text(self, attachments=False):
+        """
+        Yield ``(content_type, text)`` for the text parts only, each
+        decoded with its own charset; see ``text.iter_text``.
+        """
+        return iter_text(self.raw, self.headers.get_content_charset() or
+                         DEFAULT_CHARSET, attachments)
+
+
+class CompactMessage(Message):
+    """
+    A message of a compact mailbox: only its headers, flags and where
+    its data lies in the journal stay in memory. The raw data is a
+    slice of the mapped journal and the parsed message comes from the
+    mailbox's ``JournalBodies`` cache.
+    """
+    __slots__ = ('bodies', 'offset', 'size', 'body_offset')
+
+    def __init__(self, bodies, uid, offset, size, headers, body_offset,
+                 flags, date):
+        self.bodies = bodies
+        self.uid = uid
+        self.offset = offset
+        self.size = size
+        self.headers = headers
+        self.body_offset = body_offset
+        self.flags = set(flags)
+        self.date = date
+
+    @property
+    def raw(self):
+        return self.bodies.raw(self)
+
+    @property
+    def msg(self):
+        return self.bodies.parsed(self)
+
+    def getSize(self):
+        return self.size
+
+    def isMultipart(self):
+        return self.headers.get_content_maintype() == 'multipart'
+
+    def getSubPart(self, part):
+        if self.msg.is_multipart():
+            return MessagePart(self.msg.get_payload()[part])
+        raise TypeError("Not a multipart message")
+
+
+class JournalBodies(object):
+    """
+    Message data of a compact mailbox, read from an mmap of its journal
+    (remapped as the journal grows). Parsed messages are kept in a
+    ``msgcache.MessageCache`` bounded to ``max_bytes`` of raw data.
+    """
+    def __init__(self, journal, max_bytes=msgcache.DEFAULT_MAX_BYTES):
+        self.journal = journal
+        self.cache = msgcache.MessageCache(max_bytes, 'journal')
+        self.fp = None
+
+    def _map(self, end):
+        if self.fp is None or self.fp.size < end:
+            # Earlier maps stay valid for RawMessages still using them.
+            self.fp = self.journal.map()
+        return self.fp
+
+    def raw(self, msg):
+        end = msg.offset + msg.size
+        return RawMessage(self._map(end), msg.offset, msg.headers,
+                          msg.body_offset, end)
+
+    def parsed(self, msg):
+        message = self.cache.get(msg.uid)
+        if message is None:
+            end = msg.offset + msg.size
+            message = email.message_from_bytes(
+                self._map(end).slice(msg.offset, end))
+            self.cache.put(msg.uid, message, msg.size)
+        return message
+
+    def message(self, uid, entry):
+        """Build the ``CompactMessage`` of a journal entry."""
+        end = entry.offset + entry.size
+        raw = RawMessage(self._map(end), entry.offset, end=end)
+        return CompactMessage(self, uid, entry.offset, entry.size,
+                              raw.headers, raw.body_offset, entry.flags,
+                              entry.date)
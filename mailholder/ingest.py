@@ -0,0 +1,100 @@
+import email.parser
+
+from .rawmessage import RawMessage, header_end
+
+
+class MessageSink(object):
+    """
+    Receive message data in chunks as it comes off the wire, copy it to
+    ``fp`` and feed it to an incremental ``BytesFeedParser``.
+
+    With ``headers_only`` (the default) only the header block reaches
+    the parser, so memory stays bounded by the chunk size and the body
+    is left in ``fp`` for whoever needs it later.
+    """
+    def __init__(self, fp, headers_only=True):
+        self.fp = fp
+        self.headers_only = headers_only
+        self.parser = email.parser.BytesFeedParser()
+        self.message = None
+        self.size = 0
+        self.header_size = None
+        # Pretend the data starts on a fresh line so a message without
+        # headers is recognised by the same blank-line search.
+        self._tail = b'\n'
+
+    def feed(self, chunk):
+        self.fp.write(chunk)
+        self.size += len(chunk)
+        if self.header_size is None:
+            end = header_end(self._tail + chunk)
+            if end < 0:
+                self.parser.feed(chunk)
+                self._tail = (self._tail + chunk)[-3:]
+                return
+            cut = end - len(self._tail)
+            self.parser.feed(chunk[:cut])
+            self.header_size = self.size - len(chunk) + cut
+            chunk = chunk[cut:]
+        if not self.headers_only:
+            self.parser.feed(chunk)
+
+    def close(self):
+        """Finish parsing and return the parsed ``email.message.Message``."""
+        if self.message is None:
+            self.message = self.parser.close()
+        return self.message
+
+    def raw_message(self):
+        """
+        Return a ``RawMessage`` over ``fp`` reusing the headers parsed on
+        the way in; ``fp`` must be readable and seekable.
+        """
+        return RawMessage(self.fp, headers=self.close(),
+                          body_offset=self.header_size)
+
+    def abort(self):
+        if hasattr(self.fp, 'abort'):
+            self.fp.abort()
+        else:
+            self.fp.close()
+
+
+def store_attachments(msg, store):
+    """
+    Put every attachment of a message into a ``blobstore.BlobStore``
+    and return a description of each one.
+
+    A ``RawMessage`` is streamed: each attachment body goes through an
+    incremental transfer decoder straight into a ``BlobWriter``, so
+    memory does not grow with the attachment size. A parsed
+    ``email.message.Message`` is decoded once per attachment.
+    """
+    if isinstance(msg, RawMessage):
+        return [_store_raw_part(msg, part, store)
+                for part in msg.attachments()]
+    stored = []
+    for part in msg.walk():
+        if part.is_multipart():
+            continue
+        if part.get_content_disposition() is None:
+            continue
+        payload = part.get_payload(decode=True) or b''
+        stored.append({
+            'filename': part.get_filename(),
+            'digest': store.put(payload),
+            'mimetype': part.get_content_type(),
+            'size': len(payload),
+        })
+    return stored
+
+
+def _store_raw_part(msg, part, store):
+    with store.writer() as writer:
+        size = msg.copy_decoded(part, writer)
+    return {
+        'filename': part.headers.get_filename(),
+        'digest': writer.digest,
+        'mimetype': part.headers.get_content_type(),
+        'size': size,
+    }
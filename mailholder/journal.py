@@ -0,0 +1,289 @@
+"""
+An append-only journal backing an IMAP mailbox.
+
+Every change is one record appended to the journal file::
+
+    <kind> <metadata length> <data length>\\n<JSON metadata><data>\\n
+
+``V`` starts a journal (uidvalidity), ``M`` adds a message (uid, flags,
+date; the data is the raw message), ``F`` replaces the flags of a
+message and ``X`` expunges messages. Adding a message costs one append
+of its size, whatever the size of the mailbox.
+
+Every ``checkpoint_every`` records the state without message data (the
+offset of each message in the journal plus its flags) is written to
+``<path>.checkpoint``, so a restart only replays the records after it.
+A record cut short by a crash is dropped on replay.
+
+Flag changes and expunged messages leave dead bytes behind; ``compact``
+rewrites the journal with only the live messages and their current
+flags once ``wants_compaction`` says enough of it is dead.
+"""
+import collections
+import json
+import os
+
+from .rawmessage import CHUNK_SIZE, MappedFile, RawMessage
+
+
+VERSION = 1
+
+
+class Entry(object):
+    """Where a message lives in the journal, and its flags and date."""
+    __slots__ = ('offset', 'size', 'flags', 'date')
+
+    def __init__(self, offset, size, flags, date):
+        self.offset = offset
+        self.size = size
+        self.flags = flags
+        self.date = date
+
+
+class Journal(object):
+    def __init__(self, path, checkpoint_every=1000, fsync=False,
+                 compact_ratio=0.5, compact_min_bytes=1 << 20):
+        self.path = path
+        self.checkpoint_path = path + '.checkpoint'
+        self.checkpoint_every = checkpoint_every
+        self.fsync = fsync
+        self.compact_ratio = compact_ratio
+        self.compact_min_bytes = compact_min_bytes
+        # Bytes of flag records and expunged messages compact would drop.
+        self.dead = 0
+        self.uidvalidity = None
+        self.last_uid = 0
+        # uid -> Entry, in mailbox order.
+        self.messages = collections.OrderedDict()
+        self.records = 0
+        self.file = None
+
+    def open(self, uidvalidity=None):
+        """
+        Replay the journal (creating it with ``uidvalidity`` if it does
+        not exist yet) and open it for appending. Returns ``messages``.
+        """
+        length = self.replay()
+        self.file = open(self.path, 'ab')
+        if self.file.tell() != length:
+            # Drop a torn record left by a crash.
+            self.file.truncate(length)
+            self.file.seek(length)
+        if self.uidvalidity is None:
+            self.uidvalidity = uidvalidity
+            self._append(b'V', {'uidvalidity': uidvalidity})
+            self.flush()
+        return self.messages
+
+    def replay(self):
+        """Load the checkpoint and the records after it; return the
+        length of the journal up to its last complete record."""
+        offset = self._load_checkpoint()
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return 0
+        with f:
+            f.seek(offset)
+            while True:
+                record = self._read_record(f)
+                if record is None:
+                    break
+                kind, meta, data_offset, data_size = record
+                self._apply(kind, meta, data_offset, data_size,
+                            f.tell() - offset)
+                offset = f.tell()
+        return offset
+
+    def _load_checkpoint(self):
+        try:
+            with open(self.checkpoint_path) as f:
+                state = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return 0
+        if state.get('version') != VERSION or \
+                state['offset'] > _size(self.path):
+            return 0
+        self.uidvalidity = state['uidvalidity']
+        self.last_uid = state['last_uid']
+        self.dead = state.get('dead', 0)
+        for uid, offset, size, flags, date in state['messages']:
+            self.messages[uid] = Entry(offset, size, flags, date)
+        return state['offset']
+
+    @staticmethod
+    def _read_record(f):
+        start = f.tell()
+        line = f.readline(64)
+        try:
+            kind, meta_size, data_size = line.split()
+            meta_size, data_size = int(meta_size), int(data_size)
+        except ValueError:
+            return None
+        if not line.endswith(b'\n'):
+            return None
+        meta = f.read(meta_size)
+        data_offset = f.tell()
+        f.seek(data_size, os.SEEK_CUR)
+        if len(meta) != meta_size or f.read(1) != b'\n':
+            f.seek(start)
+            return None
+        try:
+            meta = json.loads(meta.decode('utf-8'))
+        except ValueError:
+            f.seek(start)
+            return None
+        return kind, meta, data_offset, data_size
+
+    def _apply(self, kind, meta, data_offset, data_size, length):
+        if kind == b'V':
+            self.uidvalidity = meta['uidvalidity']
+            # Kept by compact, whose messages may not include it.
+            self.last_uid = max(self.last_uid, meta.get('last_uid', 0))
+        elif kind == b'M':
+            self.messages[meta['uid']] = Entry(
+                data_offset, data_size, meta['flags'], meta['date'])
+            self.last_uid = max(self.last_uid, meta['uid'])
+        elif kind == b'F':
+            entry = self.messages.get(meta['uid'])
+            if entry is not None:
+                entry.flags = meta['flags']
+            self.dead += length
+        elif kind == b'X':
+            self.dead += length
+            for uid in meta['uids']:
+                entry = self.messages.pop(uid, None)
+                if entry is not None:
+                    # The data only; the few header bytes are ignored.
+                    self.dead += entry.size
+
+    def _append(self, kind, meta, data=b''):
+        start = self.file.tell()
+        self.file.write(_header(kind, meta, len(data)))
+        offset = self.file.tell()
+        self.file.write(data)
+        self.file.write(b'\n')
+        self._apply(kind, meta, offset, len(data), self.file.tell() - start)
+        self.records += 1
+        if self.records % self.checkpoint_every == 0:
+            self.checkpoint()
+        return offset
+
+    def add(self, uid, flags, date, data):
+        """Append a message; return the offset of its data."""
+        return self._append(b'M', {'uid': uid, 'flags': sorted(flags),
+                                   'date': date}, data)
+
+    def set_flags(self, uid, flags):
+        self._append(b'F', {'uid': uid, 'flags': sorted(flags)})
+
+    def expunge(self, uids):
+        self._append(b'X', {'uids': list(uids)})
+
+    def flush(self):
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+
+    def checkpoint(self):
+        """Write the current state so replay can start from here."""
+        self.flush()
+        state = {
+            'version': VERSION,
+            'offset': self.file.tell(),
+            'uidvalidity': self.uidvalidity,
+            'last_uid': self.last_uid,
+            'dead': self.dead,
+            'messages': [[uid, entry.offset, entry.size, entry.flags,
+                          entry.date]
+                         for uid, entry in self.messages.items()],
+        }
+        tmp = self.checkpoint_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(state, f, separators=(',', ':'))
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, self.checkpoint_path)
+
+    @property
+    def wants_compaction(self):
+        """Whether enough of the journal is dead to be worth compacting."""
+        return self.dead >= self.compact_min_bytes and \
+            self.dead >= self.compact_ratio * self.file.tell()
+
+    def compact(self):
+        """
+        Rewrite the journal with its ``V`` record (now also holding the
+        last UID) and one ``M`` record per live message carrying its
+        current flags, then switch to it.
+        The ``offset`` of every entry changes, so maps of the old file
+        must be dropped by the caller.
+        """
+        self.flush()
+        tmp = self.path + '.compact'
+        offsets = {}
+        with open(self.path, 'rb') as src, open(tmp, 'wb') as dst:
+            dst.write(_header(b'V', {'uidvalidity': self.uidvalidity,
+                                     'last_uid': self.last_uid}, 0))
+            dst.write(b'\n')
+            for uid, entry in self.messages.items():
+                dst.write(_header(b'M', {'uid': uid, 'flags': entry.flags,
+                                         'date': entry.date}, entry.size))
+                offsets[uid] = dst.tell()
+                src.seek(entry.offset)
+                left = entry.size
+                while left:
+                    data = src.read(min(CHUNK_SIZE, left))
+                    if not data:
+                        raise IOError("%s is shorter than its index" %
+                                      self.path)
+                    dst.write(data)
+                    left -= len(data)
+                dst.write(b'\n')
+            if self.fsync:
+                dst.flush()
+                os.fsync(dst.fileno())
+        # A checkpoint of the old file would be replayed against the new
+        # one: drop it first, a crash before the replace just replays the
+        # old journal in full.
+        try:
+            os.unlink(self.checkpoint_path)
+        except FileNotFoundError:
+            pass
+        self.file.close()
+        os.replace(tmp, self.path)
+        self.file = open(self.path, 'ab')
+        for uid, entry in self.messages.items():
+            entry.offset = offsets[uid]
+        self.dead = 0
+        self.checkpoint()
+
+    def map(self):
+        """Map the journal as it is now for reading message data."""
+        self.flush()
+        return MappedFile(self.path)
+
+    def message(self, fp, uid):
+        """Return message ``uid`` as a ``RawMessage`` over the map ``fp``."""
+        entry = self.messages[uid]
+        return RawMessage(fp, entry.offset, end=entry.offset + entry.size)
+
+    def close(self):
+        if self.file is not None:
+            self.checkpoint()
+            self.file.close()
+            self.file = None
+
+
+def _header(kind, meta, data_size):
+    """The header line and metadata of a record with ``data_size`` bytes."""
+    encoded = json.dumps(meta, separators=(',', ':')).encode('utf-8')
+    return b'%s %d %d\n%s' % (kind, len(encoded), data_size, encoded)
+
+
+def _size(path):
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
@@ -10,17 +10,20 @@ import re
 import sys
 import datetime
 import email
+import email.utils
 import base64
+import functools
+import json
 import chardet
 
+from . import msgcache
+from .addresses import parse_address_list
+from .headers import HeaderFilter, is_registered
+from .rawmessage import RawMessage
 
-# Python 2.7 compatibility.
-if sys.version_info < (3,):
-    from email import Header as email_header
-
-else:
-    from email import header as email_header
 
+# Python 2.7 compatibility.
+if sys.version_info >= (3,):
     def unicode(value, encoding='utf-8', errors='strict'):
         """Convert to unicode"""
         return str(value, encoding, errors)
@@ -50,73 +53,120 @@ FILENAME_RE = re.compile(
 BEGIN_TAB_RE = re.compile(r"^\t+", re.M)
 BEGIN_SPACE_RE = re.compile(r"^\s+", re.M)
 
+# Decoded bytes per base64 chunk written by MailJson.dump; a multiple
+# of 3 so the chunks concatenate into one valid base64 string.
+BASE64_CHUNK = 57 * 1024
+
+
+# Distinct header values (and charsets) remembered by the decoders below;
+# bulk mail repeats the same From/To lines over and over.
+HEADER_CACHE_SIZE = 4096
+
+
+@functools.lru_cache(maxsize=HEADER_CACHE_SIZE)
+def to_text(value, charset=None):
+    """
+    Decode a header fragment to ``str``. Pure ASCII needs no decoding,
+    a declared (RFC 2047) charset is trusted, and chardet is only asked
+    about bytes that neither ASCII, the declared charset nor UTF-8 can
+    decode.
+    """
+    if isinstance(value, str):
+        return value
+    if value.isascii():
+        return value.decode("ascii")
+    for candidate in (charset, "utf-8"):
+        if not candidate:
+            continue
+        try:
+            return value.decode(candidate)
+        except (LookupError, UnicodeDecodeError):
+            pass
+    detected = chardet.detect(value)["encoding"]
+    try:
+        return value.decode(detected or "latin-1", "replace")
+    except LookupError:
+        return value.decode("latin-1")
+
 
 def decode_value(header_value, encoding):
     """Decode header value"""
     encoding = encoding.lower() if encoding else "ascii"
-    if chardet.detect(header_value)['encoding'] == encoding:
-        # Do not encode second time.
-        return header_value
-    header_value = unicode(header_value, encoding).strip().strip("\t")
-    return header_value.encode(encoding)
+    text = to_text(header_value, encoding).strip().strip("\t")
+    try:
+        return text.encode(encoding)
+    except (LookupError, UnicodeEncodeError):
+        return text.encode("utf-8")
+
+
+@functools.lru_cache(maxsize=HEADER_CACHE_SIZE)
+def parse_recipients(header):
+    """Return the decoded ``(name, address)`` pairs of an address list."""
+    return tuple(parse_address_list(header, to_text))
 
 
 class MailJson(object):
     """Class to convert between json and mail format"""
 
-    def __init__(self, data, encoding=None):
+    def __init__(self, data, encoding=None, include_headers=None,
+                 exclude_headers=None):
         self.encoding = encoding
-        self.include_headers = ()
+        self.include_headers = tuple(include_headers or ())
+        self.exclude_headers = tuple(exclude_headers or ())
+        # Compiled once instead of lower-casing the lists per header.
+        self.header_filter = HeaderFilter(self.include_headers,
+                                          self.exclude_headers)
         self.rcpt_headers = ["from", "to", "cc", "bcc", 'reply-to']
         self.json_data = {}
         self.raw_parts = []
-
-        if isinstance(data, email.message.Message):
+        # Attachment key -> callable yielding the decoded content in
+        # chunks; nothing is decoded until the document is written.
+        self.attachment_sources = {}
+        self.raw = None
+
+        if isinstance(data, RawMessage):
+            # Headers only; bodies are read from the raw data on demand.
+            self.raw = data
+            self.mail = data.headers
+            self.parse_mail()
+        elif isinstance(data, email.message.Message):
             self.mail = data
             self.parse_mail()
         elif type(data) is dict:
             raise NotImplementedError('Conversion from JSON to mail is not Supported')
         else:
-            raise TypeError('Unknown data-type passed - Must be email.message.Message')
+            raise TypeError('Unknown data-type passed - Must be email.message.Message or RawMessage')
 
-    @staticmethod
-    def _decode_headers(headers, encoding=None):
-        """Decode headers"""
-        if type(headers) is not list:
-            headers = [headers]
-        ret = []
-        for header in headers:
-            header = email_header.decode_header(header)
-            h_ret = []
-            for (value, h_encoding) in header:
-                decoded_hv = decode_value(value, h_encoding)
-                if encoding:
-                    enc = chardet.detect(value)['encoding']
-                    if not enc:
-                        enc = 'ascii'
-                    decoded_hv = decoded_hv.decode(enc).encode(encoding)
-
-                h_ret.append(decoded_hv)
-            if len(h_ret) == 1:
-                h_ret = h_ret[0]
-            ret.append(h_ret)
-        return ret
+    @classmethod
+    def from_bytes(cls, data, **kwargs):
+        """
+        Convert raw message bytes, reusing the parsed message from
+        ``msgcache.CACHE`` if there is one. Otherwise only the headers
+        are parsed and nothing is added to the cache.
+        """
+        message = msgcache.CACHE.get(msgcache.content_key(data))
+        if message is None:
+            message = RawMessage.from_bytes(data)
+        return cls(message, **kwargs)
 
     def _get_part_headers(self, part):
         """Get headers from message part"""
         # raw headers
         headers = {}
-        include_headers = self.include_headers
+        header_filter = self.header_filter
         for h_key in part.keys():
-            if include_headers and h_key.lower() not in include_headers:
-                continue
             h_key = h_key.lower()
+            if header_filter and not header_filter.allows(h_key):
+                continue
             h_value = part.get_all(h_key)
-            if isinstance(h_value, bytes):
-                h_value = self._decode_headers(h_value, self.encoding)
             headers[h_key] = h_value[0] if len(h_value) == 1 else h_value
         return headers
 
+    def nonstandard_headers(self):
+        """Return the top-level header names not in the IANA registry."""
+        return [name for name in self.json_data["headers"]
+                if not is_registered(name)]
+
     @staticmethod
     def _parse_date(data):
         """Parse date"""
@@ -169,49 +219,18 @@ class MailJson(object):
         rcpts = self.mail.get_all(header, None)
         if not rcpts:
             return None
-        if isinstance(rcpts, list):
-            rcpts = ",".join(rcpts)
-        # Get list of recipients
-        rcpts = rcpts.replace("\n", " ").replace("\r", " ").strip()
-        return rcpts.split(',')
-
-    def _extract_recipient(self, header):
-        """Extract recipient name and email address from header"""
-        v_list = email_header.decode_header(header)
-        if len(v_list) == 2:
-            # User name and Email already split.
-            name = str(v_list[0][0].strip())
-            address = str(v_list[1][0].strip())
-            address = address.replace("<", "").replace(">", "").strip()
-        else:
-            entry = v_list[0][0].strip()
-            parsed_addr = email.utils.parseaddr(entry)
-
-            name = parsed_addr[0]
-            address = parsed_addr[1]
-
-            if address:
-                address = address.strip()
-
-        if self.encoding:
-            enc = chardet.detect(name)['encoding']
-            if not enc:
-                enc = 'ascii'
-            name = name.decode(enc).encode(self.encoding)
-        return (name, address)
+        return ",".join(str(rcpt) for rcpt in rcpts)
 
     def _parse_recipients(self, header):
         """Parse header and find all recipients"""
-        ret = []
-        rcpt_list = self._get_recipient_list(header)
-        if not rcpt_list:
+        rcpts = self._get_recipient_list(header)
+        if not rcpts:
             return []
-        for rcpt in rcpt_list:
-            (name, address) = self._extract_recipient(rcpt)
-            if not name:
-                name = None
-            if address:
-                ret.append({"name": name, "email": address})
+        ret = []
+        for name, address in parse_recipients(rcpts):
+            if name and self.encoding:
+                name = name.encode(self.encoding)
+            ret.append({"name": name or None, "email": address})
         return ret
 
     @staticmethod
@@ -247,17 +266,8 @@ class MailJson(object):
 
     def _parse_headers(self):
         """ Parse mail headers (include filters)"""
-        self.include_headers = [x.lower() for x in self.include_headers]
-
-        all_headers = self._get_part_headers(self.mail)
-        headers = {}
-        # Filter in needed headers
-        for (header, value) in all_headers.items():
-            if self.include_headers and \
-                    header.lower() not in self.include_headers:
-                continue
-            else:
-                headers[header] = value
+        # _get_part_headers has already applied the header filter.
+        headers = self._get_part_headers(self.mail)
 
         # Original headers
         self.json_data["headers"] = headers
@@ -277,7 +287,7 @@ class MailJson(object):
                 self.json_data["parsed_headers"]["message-id"] = m_id
             elif header in ["from", "to", "cc", "bcc", 'reply-to']:
                 data = self._parse_recipients(header)
-                if 'from' or 'to' in header and len(data) >= 1:
+                if header == 'from' and data:
                     # From is always only one, do not need array here.
                     data = data[0]
                 self.json_data["parsed_headers"][header] = data
@@ -293,25 +303,25 @@ class MailJson(object):
 
     @staticmethod
     def _parse_attachment(part):
-        """Parse message attachment"""
+        """Parse message attachment; the content is added on output"""
         content_disposition = part.get("Content-Disposition", None)
         found = FILENAME_RE.findall(content_disposition)
         filename = sorted(found[0])[1] if found else "undefined"
-        return dict(filename=filename, content=base64.b64encode(part.get_payload(decode=True)),
-                    content_type=part.get_content_type())
+        return dict(filename=filename, content_type=part.get_content_type())
 
-    def _parse_parts(self, part):
+    def _parse_parts(self, part, payload=None):
         """Parse message part"""
         try:
-            payload = part.get_payload(decode=1)
+            if payload is None:
+                payload = part.get_payload(decode=1)
+            charset = self._get_content_charset(part, b"utf-8").decode()
             if self.encoding:
-                charset = self._get_content_charset(part, "utf-8").decode()
                 content = unicode(payload,
                                   charset,
                                   "ignore").encode(self.encoding)
             else:
                 content = payload
-            return dict(content_type=part.get_content_type(), content=content, headers=self._get_part_headers(part))
+            return dict(content_type=part.get_content_type(), charset=charset, content=content, headers=self._get_part_headers(part))
         except LookupError:
             # Sometimes an encoding isn't recognized.
             # Not much to be done.
@@ -324,17 +334,17 @@ class MailJson(object):
         self.json_data['attachments'] = {}
         part_count = 1
         attachment_count = 1
-        for part in self.mail.walk():
-            if part.is_multipart():
-                continue
+        for part, chunks in self._leaf_parts():
             content_disposition = part.get("Content-Disposition", None)
             if content_disposition:
                 # We are interested in parsed attachments.
-                self.json_data['attachments'][f'file{attachment_count}'] = self._parse_attachment(part)
+                key = f'file{attachment_count}'
+                self.json_data['attachments'][key] = self._parse_attachment(part)
+                self.attachment_sources[key] = chunks
                 attachment_count += 1
             else:
                 # We are interested in parsed parts.
-                json_part = self._parse_parts(part)
+                json_part = self._parse_parts(part, b''.join(chunks()))
                 if json_part:
                     if json_part['content_type'] == 'text/plain':
                         self.json_data['parts']['plaintext'] = json_part
@@ -347,5 +357,107 @@ class MailJson(object):
         if self.encoding:
             self.json_data["encoding"] = self.encoding
 
+    def _leaf_parts(self):
+        """
+        Yield ``(headers, chunks)`` for every non-multipart part, where
+        ``chunks()`` iterates over its transfer-decoded body.
+        """
+        if self.raw is not None:
+            for part in self.raw.structure.walk():
+                if part.children:
+                    continue
+                yield part.headers, functools.partial(
+                    self.raw.iter_decoded, part)
+            return
+        for part in self.mail.walk():
+            if part.is_multipart():
+                continue
+            yield part, functools.partial(_decoded_payload, part)
+
+    def _jsonable(self, value, charset=None):
+        """Turn the bytes left in ``json_data`` into text."""
+        if isinstance(value, bytes):
+            return value.decode(self.encoding or charset or "utf-8", "replace")
+        if isinstance(value, dict):
+            charset = value.get("charset", charset) if "content" in value \
+                else charset
+            return {key: self._jsonable(item, charset)
+                    for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self._jsonable(item, charset) for item in value]
+        return value
+
     def to_json(self):
-        return self.json_data
+        """
+        Return the document as a JSON-serialisable dict, with every
+        attachment base64 encoded in memory. Use ``dump`` for large
+        messages.
+        """
+        data = self._jsonable(self.json_data)
+        for key, attachment in data.get("attachments", {}).items():
+            attachment["content"] = base64.b64encode(b"".join(
+                self.attachment_sources[key]())).decode("ascii")
+        return data
+
+    def dump(self, fp, store=None, chunk_size=BASE64_CHUNK):
+        """
+        Write the JSON document to the text stream ``fp`` piece by piece
+        (use ``socket.makefile('w')`` for a socket).
+
+        Attachments are never held in memory as a whole: without a
+        ``store`` their content is written as a base64 string in chunks
+        of ``chunk_size`` decoded bytes; with a ``blobstore.BlobStore``
+        each attachment is streamed into the store and written as a
+        reference, ``"digest"`` and ``"size"`` instead of ``"content"``.
+        """
+        chunk_size -= chunk_size % 3
+        fp.write("{")
+        for i, (key, value) in enumerate(self.json_data.items()):
+            fp.write(", " if i else "")
+            fp.write(json.dumps(key) + ": ")
+            if key != "attachments":
+                fp.write(json.dumps(self._jsonable(value)))
+                continue
+            fp.write("{")
+            for j, (name, attachment) in enumerate(value.items()):
+                fp.write(", " if j else "")
+                fp.write(json.dumps(name) + ": ")
+                # Drop the closing brace to append the content.
+                fp.write(json.dumps(self._jsonable(attachment))[:-1])
+                fp.write(", " if attachment else "")
+                chunks = self.attachment_sources[name]()
+                if store is None:
+                    fp.write('"content": "')
+                    for encoded in _base64_chunks(chunks, chunk_size):
+                        fp.write(encoded)
+                    fp.write('"}')
+                else:
+                    with store.writer() as writer:
+                        for chunk in chunks:
+                            writer.write(chunk)
+                    fp.write('"digest": {}, "size": {}}}'.format(
+                        json.dumps(writer.digest), writer.size))
+            fp.write("}")
+        fp.write("}")
+
+
+def _decoded_payload(part):
+    yield part.get_payload(decode=True) or b""
+
+
+def _base64_chunks(chunks, chunk_size=BASE64_CHUNK):
+    """
+    Base64 encode an iterable of bytes into concatenable strings of at
+    most ``chunk_size`` (a multiple of 3) decoded bytes each.
+    """
+    pending = b""
+    for chunk in chunks:
+        pending += chunk
+        start = 0
+        while len(pending) - start >= chunk_size:
+            yield base64.b64encode(
+                pending[start:start + chunk_size]).decode("ascii")
+            start += chunk_size
+        pending = pending[start:]
+    if pending:
+        yield base64.b64encode(pending).decode("ascii")
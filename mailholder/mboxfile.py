@@ -0,0 +1,134 @@
+"""
+An mbox file that a mailbox appends messages to and cuts expunged
+messages out of in place.
+
+``mailbox.mbox`` can only remove messages by copying the whole file on
+``flush``. ``MboxFile`` keeps its own table of where every message it
+wrote starts and stops instead, so ``remove`` moves only the data after
+the first removed message down and truncates the file.
+
+Messages are written as ``From `` line, mboxrd quoted data (a line
+matching ``>*From `` gets one more ``>``) and an empty line, and any
+mbox reader can read the file. Data already in the file when it is
+opened is kept but not indexed.
+"""
+import os
+import re
+import time
+
+from .rawmessage import CHUNK_SIZE
+
+
+FROM_RE = re.compile(rb'^(>*From )', re.M)
+QUOTED_FROM_RE = re.compile(rb'^>(>*From )', re.M)
+
+
+class MboxFile(object):
+    """
+    The mbox file at ``path`` (created if missing) and the offsets of
+    the messages added to it, by the keys ``add`` returns.
+    """
+    def __init__(self, path):
+        self.path = path
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        self.file = os.fdopen(fd, 'r+b')
+        # Key -> (start, stop): the From line starts at ``start`` and
+        # the message ends at ``stop``, before its empty line.
+        self.toc = {}
+        self._next_key = 0
+        self.length = self.file.seek(0, os.SEEK_END)
+        self._separated = self.length == 0 or self._tail() == b'\n\n'
+
+    def _tail(self):
+        self.file.seek(max(self.length - 2, 0))
+        return self.file.read(2)
+
+    def add(self, data):
+        """Append the raw message ``data`` and return its key."""
+        if data.startswith(b'From '):
+            from_line, _, data = data.partition(b'\n')
+            from_line += b'\n'
+        else:
+            from_line = b'From MAILER-DAEMON ' + time.asctime(
+                time.gmtime()).encode('ascii') + b'\n'
+        data = FROM_RE.sub(rb'>\1', data)
+        if not data.endswith(b'\n'):
+            data += b'\n'
+        f = self.file
+        separator = b''
+        if not self._separated:
+            # Keep what was in the file apart from our first message.
+            separator = b'\n' if self._tail().endswith(b'\n') else b'\n\n'
+            self._separated = True
+        f.seek(self.length)
+        f.write(separator)
+        start = f.tell()
+        f.write(from_line)
+        f.write(data)
+        stop = f.tell()
+        f.write(b'\n')
+        self.length = f.tell()
+        key = self._next_key
+        self._next_key += 1
+        self.toc[key] = (start, stop)
+        return key
+
+    def get_bytes(self, key):
+        """Return message ``key`` as it was added, less its From line."""
+        start, stop = self.toc[key]
+        self.file.seek(start)
+        self.file.readline()
+        data = self.file.read(stop - self.file.tell())
+        return QUOTED_FROM_RE.sub(rb'\1', data)
+
+    def remove(self, keys):
+        """
+        Cut the messages ``keys`` out of the file in place. Only the data
+        after the first of them moves; nothing before it is rewritten.
+        """
+        keys = set(key for key in keys if key in self.toc)
+        if not keys:
+            return
+        f = self.file
+        toc = sorted(self.toc.items(), key=lambda item: item[1][0])
+        first = min(self.toc[key][0] for key in keys)
+        position = first
+        # A message owns the bytes up to the start of the next one,
+        # including its empty line.
+        ends = [start for _, (start, _) in toc[1:]] + [self.length]
+        for (key, (start, stop)), end in zip(toc, ends):
+            if start < first:
+                continue
+            if key in keys:
+                del self.toc[key]
+                continue
+            _move(f, start, end, position)
+            self.toc[key] = (position, position + stop - start)
+            position += end - start
+        f.truncate(position)
+        self.length = position
+        self.flush()
+
+    def flush(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+
+def _move(f, start, end, dest, chunk_size=CHUNK_SIZE):
+    """Copy ``f[start:end]`` down to ``dest`` (``dest <= start``)."""
+    if dest == start:
+        return
+    while start < end:
+        f.seek(start)
+        data = f.read(min(chunk_size, end - start))
+        if not data:
+            break
+        f.seek(dest)
+        f.write(data)
+        start += len(data)
+        dest += len(data)
@@ -0,0 +1,194 @@
+"""
+In-process metrics with a Prometheus text endpoint.
+
+Metrics are plain Python objects updated inline (an integer add for a
+counter, a ``bisect`` plus two adds for a histogram), cheap enough to
+leave on in production. ``serve_metrics`` exposes a registry at
+``/metrics`` on an asyncio loop.
+"""
+import asyncio
+import bisect
+import threading
+import time
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(
+        key, str(value).replace('\\', r'\\').replace('"', r'\"'))
+        for key, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter(object):
+    kind = 'counter'
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self, name, labels):
+        yield name + _format_labels(labels), self.value
+
+
+class Gauge(object):
+    """A value that goes up and down, or is read from ``function``."""
+    kind = 'gauge'
+
+    def __init__(self, function=None):
+        self.value = 0
+        self.function = function
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def samples(self, name, labels):
+        value = self.function() if self.function else self.value
+        yield name + _format_labels(labels), value
+
+
+class Histogram(object):
+    kind = 'histogram'
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self):
+        """Context manager observing the duration of its block."""
+        return _Timer(self)
+
+    def samples(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),),
+                                self.counts):
+            cumulative += count
+            yield (name + '_bucket' + _format_labels(
+                labels, [('le', _format_value(bound))]), cumulative)
+        yield name + '_sum' + _format_labels(labels), self.sum
+        yield name + '_count' + _format_labels(labels), self.count
+
+
+class _Timer(object):
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class Registry(object):
+    """
+    A set of metric families. Asking twice for the same name and labels
+    returns the same metric, so modules can declare their metrics at
+    import time.
+    """
+    def __init__(self):
+        self.families = {}
+        self.lock = threading.Lock()
+
+    def _get(self, cls, name, documentation, labels, **kwargs):
+        key = tuple(sorted((labels or {}).items()))
+        with self.lock:
+            kind, _, metrics = self.families.setdefault(
+                name, (cls.kind, documentation, {}))
+            if kind != cls.kind:
+                raise ValueError("{} is already a {}".format(name, kind))
+            if key not in metrics:
+                metrics[key] = cls(**kwargs)
+            return metrics[key]
+
+    def counter(self, name, documentation, labels=None):
+        return self._get(Counter, name, documentation, labels)
+
+    def gauge(self, name, documentation, labels=None, function=None):
+        gauge = self._get(Gauge, name, documentation, labels)
+        if function is not None:
+            gauge.function = function
+        return gauge
+
+    def histogram(self, name, documentation, labels=None,
+                  buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, documentation, labels,
+                         buckets=buckets)
+
+    def render(self):
+        """Return every metric in the Prometheus text format."""
+        lines = []
+        with self.lock:
+            families = sorted(self.families.items())
+        for name, (kind, documentation, metrics) in families:
+            lines.append('# HELP {} {}'.format(name, documentation))
+            lines.append('# TYPE {} {}'.format(name, kind))
+            for labels, metric in sorted(metrics.items()):
+                for sample, value in metric.samples(name, labels):
+                    lines.append('{} {}'.format(sample,
+                                                _format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def stage(name, registry=REGISTRY):
+    """The duration histogram of one message processing stage."""
+    return registry.histogram('mailholder_stage_seconds',
+                              'Time spent in each message processing stage.',
+                              {'stage': name})
+
+
+async def serve_metrics(host, port, registry=REGISTRY):
+    """Serve ``/metrics`` from the running event loop."""
+    async def handle(reader, writer):
+        try:
+            request = await asyncio.wait_for(
+                reader.readuntil(b'\r\n\r\n'), 10)
+            path = request.split(b' ', 2)[1].split(b'?')[0]
+            if path == b'/metrics':
+                status, body = '200 OK', registry.render().encode('utf-8')
+            else:
+                status, body = '404 Not Found', b'Not Found\n'
+            writer.write('HTTP/1.0 {}\r\nContent-Type: {}\r\n'
+                         'Content-Length: {}\r\n\r\n'.format(
+                             status, CONTENT_TYPE, len(body)).encode('ascii')
+                         + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError,
+                asyncio.LimitOverrunError, IndexError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
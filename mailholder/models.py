@@ -1,3 +1,4 @@
+import io
 import os
 import datetime
 from tortoise import Tortoise
@@ -37,6 +38,11 @@ class BaseModel(Model):
 class Email(BaseModel):
 
     id = IntField(pk=True)
+    # Id of the raw message in the capture spool; also lets a batch of
+    # bulk-created rows be looked up again to link their attachments.
+    # Maildir ids end in the host name, hence the length. The column is
+    # created by the Django migrations in data/migrations.
+    spool_id = CharField(255, unique=True, null=True)
     from_email = CharField(255)
     to_email = TextField()
     bcc = TextField()
@@ -56,14 +62,26 @@ class Email(BaseModel):
         table = 'data_email'
 
 class Attachment(BaseModel):
+    # ``digest`` names the content in the shared blobstore.BlobStore;
+    # ``file`` is only used for rows created before the store existed.
+    digest = CharField(64, index=True, null=True)
+    size = IntField(null=True)
     file = BinaryField(null=True)
     filename = CharField(255, null=True)
     mimetype = CharField(255, null=True)
-    emails: ManyToManyRelation['Email'] = ManyToManyField('models.Email', related_name='emails')
+    emails: ManyToManyRelation['Email'] = ManyToManyField(
+        'models.Email', related_name='attachments', through='data_attachment_emails',
+        backward_key='attachment_id', forward_key='email_id')
+
+    def open(self, store):
+        """Return a binary file with the attachment's content."""
+        if self.digest:
+            return store.open(self.digest)
+        return io.BytesIO(self.file or b'')
 
 
 class Log(BaseModel):
-    email_id: ManyToManyRelation['Email'] = ManyToManyField("models.Email", related_name='emails')
+    email_id: ManyToManyRelation['Email'] = ManyToManyField("models.Email", related_name='logs')
     date = DateTimeField(index=True, default=datetime.datetime.now())
     exception_type = CharField(null=True)
     message = TextField()
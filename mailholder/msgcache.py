@@ -0,0 +1,118 @@
+"""
+A process-wide cache of parsed messages keyed by a hash of their raw
+bytes, so identical content arriving through the IMAP inbox, the local
+SMTP handler and MailJson is parsed once.
+"""
+import collections
+import email
+import hashlib
+import threading
+
+from . import metrics
+
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def content_key(data):
+    """The cache key of raw message ``data``."""
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+class MessageCache(object):
+    """
+    An LRU of parsed ``email.message.Message`` objects bounded by the
+    total size of the raw messages they were parsed from.
+
+    Cached messages are shared between every caller that parses the same
+    bytes, so they must be treated as read-only. Hits, misses and
+    evictions are also counted in the ``mailholder_message_cache_*``
+    metrics labelled with ``name``, summed over caches of that name.
+    """
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, name='messages'):
+        self.max_bytes = max_bytes
+        self.name = name
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        labels = {'cache': name}
+        self._hits = metrics.REGISTRY.counter(
+            'mailholder_message_cache_hits_total',
+            'Parsed-message cache hits.', labels)
+        self._misses = metrics.REGISTRY.counter(
+            'mailholder_message_cache_misses_total',
+            'Parsed-message cache misses.', labels)
+        self._evictions = metrics.REGISTRY.counter(
+            'mailholder_message_cache_evictions_total',
+            'Messages evicted from a parse cache.', labels)
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Return the message cached under ``key`` or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                self._misses.inc()
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self._hits.inc()
+            return entry[0]
+
+    def put(self, key, message, size):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self._entries[key] = (message, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.size -= evicted
+                self.evictions += 1
+                self._evictions.inc()
+
+    def discard(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.size -= entry[1]
+
+    def parse(self, data, key=None):
+        """Return the parsed message of ``data``, from the cache if possible."""
+        key = key or content_key(data)
+        message = self.get(key)
+        if message is None:
+            message = email.message_from_bytes(data)
+            self.put(key, message, len(data))
+        return message
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self._entries),
+            'bytes': self.size,
+            'max_bytes': self.max_bytes,
+        }
+
+
+CACHE = MessageCache()
+
+metrics.REGISTRY.gauge('mailholder_message_cache_bytes',
+                       'Raw bytes of the messages in the parse cache.',
+                       function=lambda: CACHE.size)
@@ -1,8 +1,13 @@
-import os, re, sys, django, email
+import os, re, sys, django, email, functools, tempfile
+import email.message
 from io import BytesIO
 from itertools import count
 from smtpd import SMTPServer
 
+from .ingest import MessageSink, store_attachments
+from .rawmessage import RawMessage
+from .text import DEFAULT_CHARSET, iter_text, lookup_codec
+
 sys.dont_write_bytecode = True
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "settings")
 
@@ -40,10 +45,27 @@ begin_space_re = re.compile("^\s{1,}", re.M)
 ##
 class MessagePart(object):
     def __init__(self, msg):
-        self.msg = email.message_from_bytes(msg)
+        # Raw data is only parsed up to the end of the headers; the MIME
+        # tree is built the first time ``msg`` is used.
+        if isinstance(msg, (bytes, bytearray)):
+            msg = RawMessage.from_bytes(bytes(msg))
+        if isinstance(msg, RawMessage):
+            self.raw = msg
+            self.headers = msg.headers
+            self._msg = None
+        else:
+            self.raw = None
+            self.headers = msg
+            self._msg = msg
         self.string_file = BytesIO()
         self.container = []
 
+    @property
+    def msg(self):
+        if self._msg is None:
+            self._msg = self.raw.message
+        return self._msg
+
     @property
     def to_json(self):
         import json
@@ -76,35 +98,73 @@ class MessagePart(object):
 
     def saveHeaders(self):
         headers = db["headers"]
-        for header in self.msg.keys():
-            headers.insert(self.msg.get(header, ""))
+        for header in self.headers.keys():
+            headers.insert(self.headers.get(header, ""))
         return headers
 
     def saveAttachments(self, path):
         if not os.path.exists(path):
             raise NotADirectoryError("Path {0} does not exist".format(path))
-        for part in self.msg.walk():
-            if part.is_multipart():
-                continue
-            if part.get_content_disposition() is None:
-                continue
-            fileName = part.get_filename()
-            outfile = BytesIO()
+        for fileName, write in self._attachment_writers():
             if bool(fileName):
                 filePath = os.path.join(str(path), str(fileName))
                 if not os.path.isfile(filePath):
-                    fp = open(filePath, "wb")
-                    fp.write(part.get_payload(decode=True))
-                    fp.close()
-                subject = self.msg.get("Subject", "")
+                    with open(filePath, "wb") as fp:
+                        write(fp)
+                subject = self.headers.get("Subject", "")
                 print(
                     "Downloaded {0} from email with Subject: {1} into {2}".format(
                         fileName, subject, path
                     )
                 )
-                outfile.write(part.get_payload(decode=True))
+
+    def _attachment_writers(self):
+        """
+        Yield ``(filename, write)`` for every attachment, where
+        ``write(fp)`` decodes the attachment into ``fp``. Raw messages
+        are streamed through an incremental decoder in constant memory;
+        parsed ones are decoded once.
+        """
+        if self.raw is not None and not self.raw.parsed:
+            for part in self.raw.attachments():
+                yield part.headers.get_filename(), functools.partial(
+                    self.raw.copy_decoded, part
+                )
+            return
+        for part in self.msg.walk():
+            if part.is_multipart():
+                continue
+            if part.get_content_disposition() is None:
+                continue
+            yield part.get_filename(), functools.partial(
+                _write_payload, part
+            )
+
+    def storeAttachments(self, store):
+        """
+        Put every attachment into a ``blobstore.BlobStore``. Blobs are
+        keyed by content, so identical payloads are written once and
+        attachments sharing a filename no longer shadow each other.
+        """
+        if self.raw is not None and not self.raw.parsed:
+            return store_attachments(self.raw, store)
+        return store_attachments(self.msg, store)
 
     def getBodyFile(self, decode=False):
+        if self.raw is not None and not self.raw.is_multipart():
+            # The raw body is exactly the payload a full parse would give.
+            self.string_file = BytesIO(self.raw.read_body())
+            return self.string_file
+        if self.raw is not None and not self.raw.parsed:
+            # Slice the bodies out of the raw data by their offsets.
+            self.string_file = BytesIO(b"".join(
+                self.raw.read_part(part)
+                for part in self.raw.structure.walk()
+                if not part.children
+                and part.headers.get_content_maintype() != "multipart"
+                and part.headers.get("Content-Disposition") is None
+            ))
+            return self.string_file
         if self.msg.is_multipart():
             self.string_file.seek(0)
             for part in self.msg.walk():
@@ -133,40 +193,62 @@ class MessagePart(object):
         return self.string_file
 
     def getSize(self):
+        if self.raw is not None:
+            return self.raw.size
         return len(self.msg.as_string())
 
     def isMultipart(self):
+        if self.raw is not None:
+            return self.raw.is_multipart()
         return self.msg.is_multipart()
 
     def getSubPart(self, part):
+        if self.raw is not None and not self.raw.parsed:
+            # Located by byte offsets (or loaded from the spool's
+            # structure sidecar); the part is a slice of the raw data.
+            if self.raw.has_subparts():
+                return MessagePart(self.raw.subpart(part))
+            raise TypeError("Not a multipart message")
         if self.msg.is_multipart():
             return MessagePart(self.msg.get_payload()[part])
         raise TypeError("Not a multipart message")
 
     def payloads(self):
+        default = str(self.parse_charset())
         for part in self.msg.walk():
-            if part.get_content_maintype() == "multipart":
+            if part.is_multipart():
                 continue
             payload = part.get_payload(decode=True)
-            enc = self.parse_charset()
             try:
-                yield payload.decode(enc)
+                yield payload.decode(
+                    lookup_codec(part.get_content_charset(), default))
             except UnicodeDecodeError:
                 yield payload
 
+    def text(self, attachments=False):
+        """
+        Yield ``(content_type, text)`` for the text parts only, each
+        decoded with its own charset; see ``text.iter_text``.
+        """
+        return iter_text(
+            self.raw if self.raw is not None else self.msg,
+            self.headers.get_content_charset() or DEFAULT_CHARSET,
+            attachments,
+        )
+
     def parse_charset(self, default="utf8"):
-        charset = self.msg.get_charset()
+        charset = self.headers.get_charset()
         if charset is not None:
             return charset
 
-        for chunk in self.msg["Content-type"].split(";"):
+        for chunk in self.headers.get("Content-type", "").split(";"):
             if "charset" in chunk:
                 return chunk.split("=")[1]
         return default
 
     def unicode(self, header):
         """Converts a header to unicode"""
-        value = self.msg[header]
+        value = self.headers[header]
         parts = email.header.decode_header(value)
         return "".join(
             decoded_part.decode(codec)
@@ -176,23 +258,36 @@ class MessagePart(object):
         )
 
 
+def _write_payload(part, fp):
+    return fp.write(part.get_payload(decode=True) or b"")
+
+
 ##
 
 
 class LocalMessage(MessagePart):
     def __init__(self, fp, flags, date):
-        # email.message_from_binary_file is new in Python 3.3,
-        # and we need to use it if we are on Python3.
-        if hasattr(email, "message_from_binary_file"):
-            parsed_message = email.message_from_binary_file(fp)
+        # Parsed messages and RawMessages are used as they are; raw data
+        # and files are read into a RawMessage that only parses the
+        # headers until more is needed.
+        if isinstance(fp, (email.message.Message, RawMessage)):
+            parsed_message = fp
+        elif isinstance(fp, (bytes, bytearray)):
+            parsed_message = RawMessage.from_bytes(bytes(fp))
         else:
-            parsed_message = email.message_from_bytes(fp)
+            parsed_message = RawMessage.from_file(fp)
         super(LocalMessage, self).__init__(parsed_message)
-        self.data = str(self.msg)
         self.uid = get_counter()
         self.flags = set(flags)
         self.date = date
 
+    @property
+    def data(self):
+        # Serialised on demand rather than kept as a second full copy.
+        if self.raw is not None and not self.raw.parsed:
+            return self.raw.read().decode("ascii", "surrogateescape")
+        return str(self.msg)
+
     def getUID(self):
         return self.uid
 
@@ -229,11 +324,12 @@ class LocalServer(SMTPServer):
     def process_message(self, peer, mailfrom, rcpttos, data, **kwargs):
         print(type(data))
         print(data)
-        msg_data = BytesIO(data)
         flags = []
         date = email.utils.formatdate()
-        msg = LocalMessage(msg_data, flags, date)
-        msg.msg.add_header("X-peer:", peer[0])
+        # Parsed messages are shared through msgcache, so the header is
+        # added to the raw data rather than to the parsed tree.
+        data = "X-Peer: {}\r\n".format(peer[0]).encode() + bytes(data)
+        msg = LocalMessage(data, flags, date)
         print(mailfrom, rcpttos)
         print('Downloading Attachment')
         msg.getAttachment("/tmp")
@@ -250,15 +346,33 @@ class LocalServer(SMTPServer):
 
 
 class LocalHandler:
+    async def open_DATA(self, server, session, envelope):
+        # Stream DATA to a temporary file and parse the headers as they
+        # arrive instead of buffering the whole message.
+        return MessageSink(tempfile.TemporaryFile())
+
     async def handle_DATA(self, server, session, envelope, **kwargs):
-        print(type(envelope.content))
-        # print(data)
-        msg_data = BytesIO(envelope.content)
         flags = []
         date = email.utils.formatdate()
-        msg = LocalMessage(msg_data, flags, date)
+        sink = getattr(envelope, "sink", None)
+        if sink is None:
+            # Servers without open_DATA (e.g. aiosmtpd) hand over bytes.
+            msg = LocalMessage(envelope.content, flags, date)
+        else:
+            print("{0} bytes".format(sink.size))
+            # The headers were parsed on the way in; the body stays in
+            # the temporary file until something asks for it, so the
+            # file is only closed once the message has been handled.
+            msg = LocalMessage(sink.raw_message(), flags, date)
+        try:
+            return self._print_message(msg, **kwargs)
+        finally:
+            if sink is not None:
+                sink.fp.close()
+
+    def _print_message(self, msg, **kwargs):
         # msg.msg.add_header('X-peer:', peer[0])
-        print(msg.msg)
+        self._write_message(msg)
         # print(mailfrom, rcpttos)
         # print('Downloading Attachment')
         # msg.getAttachment('/tmp')
@@ -273,3 +387,13 @@ class LocalHandler:
         # print(message.items())
         print("------------ END MESSAGE ------------")
         return "250 OK"
+
+    def _write_message(self, msg):
+        # Copied in chunks: the streamed body is never read into memory
+        # as a whole, nor decoded.
+        if msg.raw is None:
+            print(msg.msg)
+            return
+        sys.stdout.flush()
+        msg.raw.copy(sys.stdout.buffer)
+        sys.stdout.buffer.flush()
@@ -0,0 +1,260 @@
+import asyncio
+import email.utils
+import logging
+
+from tortoise import Tortoise
+from tortoise.transactions import in_transaction
+
+from . import metrics
+from .models import Attachment, Email, tortoise_config
+from .rawmessage import RawMessage
+from .text import iter_text
+
+
+CONNECTION = 'mailholder'
+LINK_SQL = ('INSERT INTO data_attachment_emails (attachment_id, email_id) '
+            'VALUES (%s, %s)')
+
+# Queued by ``EmailBatcher.stop`` to end ``run``.
+STOP = object()
+
+PERSIST_SECONDS = metrics.stage('persist')
+PERSISTED = {outcome: metrics.REGISTRY.counter(
+    'mailholder_persisted_messages_total',
+    'Messages written to the database by outcome.', {'outcome': outcome})
+    for outcome in ('stored', 'failed')}
+
+
+async def init_database(config=None):
+    await Tortoise.init(config=config or tortoise_config)
+
+
+class CapturedEmail(object):
+    """A parsed message waiting to be written by ``EmailBatcher``."""
+
+    def __init__(self, spool_id, fields, attachments=()):
+        self.spool_id = spool_id
+        self.fields = fields
+        self.attachments = list(attachments)
+
+    @classmethod
+    def from_message(cls, spool_id, msg, mailfrom, rcpttos, attachments=()):
+        """
+        Build the ``Email`` columns from ``msg``, a ``RawMessage`` over
+        the spooled data (or a parsed ``email.message.Message``), and its
+        SMTP envelope. The first text/plain and text/html parts are the
+        bodies.
+        """
+        bodies = {}
+        for content_type, text in iter_text(msg):
+            bodies.setdefault(content_type, text)
+        if isinstance(msg, RawMessage):
+            msg = msg.headers
+        headers = {}
+        for key, value in msg.items():
+            headers.setdefault(key, []).append(str(value))
+        listed = {addr.lower() for _, addr in email.utils.getaddresses(
+            msg.get_all('To', []) + msg.get_all('Cc', []))}
+        fields = dict(
+            spool_id=spool_id,
+            from_email=(msg.get('From') or mailfrom or '')[:255],
+            to_email=', '.join(rcpttos),
+            cc=', '.join(msg.get_all('Cc', [])),
+            bcc=', '.join(r for r in rcpttos if r.lower() not in listed),
+            subject=str(msg.get('Subject', ''))[:255],
+            headers=headers,
+            message=bodies.get('text/plain', ''),
+            html_message=bodies.get('text/html'),
+        )
+        return cls(spool_id, fields, attachments)
+
+
+class EmailBatcher(object):
+    """
+    Write captured messages to the Tortoise ``Email`` model in batches.
+
+    ``put`` queues a ``CapturedEmail`` and blocks once ``max_queue``
+    messages are waiting, which pushes back on the SMTP sessions. The
+    ``run`` task flushes whenever ``batch_size`` messages are queued or
+    the oldest has waited ``flush_interval`` milliseconds. Each flush is
+    one transaction: a ``bulk_create`` of the emails, one of the
+    attachments not stored yet and a single multi-row insert of the
+    email/attachment links.
+
+    ``release`` is awaited with the digests of blob references no
+    attachment row took over (see ``_surplus``), which includes all of
+    them when writing a batch fails.
+    """
+    def __init__(self, batch_size=100, flush_interval=50.0, max_queue=1000,
+                 release=None):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.release = release
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.logger = logging.getLogger('persist')
+        metrics.REGISTRY.gauge('mailholder_persist_queue_depth',
+                               'Messages waiting for the database writer.',
+                               function=self.queue.qsize)
+
+    async def put(self, captured):
+        await self.queue.put(captured)
+
+    async def stop(self):
+        """Have ``run`` flush everything queued so far and return."""
+        await self.queue.put(STOP)
+
+    async def run(self):
+        """
+        Flush batches until ``stop`` is called. If the task is cancelled
+        instead, the batch it was collecting or writing and whatever is
+        still queued are flushed before it ends.
+        """
+        batch = []
+        try:
+            while True:
+                captured = await self.queue.get()
+                if captured is STOP:
+                    return
+                batch = [captured]
+                stopping = await self._collect(batch)
+                await self._flush_safely(batch)
+                batch = []
+                if stopping:
+                    return
+        except asyncio.CancelledError:
+            while not self.queue.empty():
+                captured = self.queue.get_nowait()
+                if captured is not STOP:
+                    batch.append(captured)
+            if batch:
+                # A second cancel must not cut the last write short.
+                await asyncio.shield(self._flush_safely(batch))
+            raise
+
+    async def _collect(self, batch):
+        """
+        Add queued messages to ``batch`` until it is full or the flush
+        interval is over. Returns whether ``stop`` was called.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.flush_interval / 1000
+        # Not wait_for(): it can return a message it got just as the
+        # task was cancelled and swallow the cancellation.
+        getter = None
+        try:
+            while len(batch) < self.batch_size:
+                if not self.queue.empty():
+                    captured = self.queue.get_nowait()
+                else:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    getter = asyncio.ensure_future(self.queue.get())
+                    done, _ = await asyncio.wait((getter,), timeout=timeout)
+                    if not done:
+                        break
+                    captured, getter = getter.result(), None
+                if captured is STOP:
+                    return True
+                batch.append(captured)
+        finally:
+            if getter is not None:
+                if getter.done() and not getter.cancelled():
+                    # Cancelled after the message was taken off the queue.
+                    captured = getter.result()
+                    if captured is not STOP:
+                        batch.append(captured)
+                else:
+                    getter.cancel()
+        return False
+
+    async def _flush_safely(self, batch):
+        try:
+            with PERSIST_SECONDS.time():
+                surplus = await self.flush(batch)
+        except Exception:
+            PERSISTED['failed'].inc(len(batch))
+            self.logger.exception("Failed to persist %d messages",
+                                  len(batch))
+            # The transaction was rolled back: no row holds any of the
+            # batch's blob references.
+            await self._release([a['digest'] for c in batch
+                                 for a in c.attachments])
+        else:
+            PERSISTED['stored'].inc(len(batch))
+            await self._release(surplus)
+
+    async def _release(self, digests):
+        if not digests or self.release is None:
+            return
+        try:
+            await self.release(digests)
+        except Exception:
+            self.logger.exception("Failed to release %d blob references",
+                                  len(digests))
+
+    async def flush(self, batch):
+        """
+        Write ``batch`` in one transaction and return the digests of the
+        blob references it left over.
+        """
+        async with in_transaction(CONNECTION):
+            await Email.bulk_create([Email(**c.fields) for c in batch])
+            email_ids = dict(await Email.filter(
+                spool_id__in=[c.spool_id for c in batch]
+            ).values_list('spool_id', 'id'))
+            attachment_ids, created = await self._attachment_ids(batch)
+            links = {(attachment_ids[self._key(a)], email_ids[c.spool_id])
+                     for c in batch for a in c.attachments}
+            if links:
+                await Tortoise.get_connection(CONNECTION).execute_many(
+                    LINK_SQL, sorted(links))
+        self.logger.debug("Persisted %d messages", len(batch))
+        return self._surplus(batch, created)
+
+    def _surplus(self, batch, created):
+        """
+        Every stored attachment comes with one reference on its blob
+        (``ingest.store_attachments``) and every attachment row holds
+        exactly one, dropped when the row is deleted. Return the digests
+        of the references that no row in ``created`` took over.
+        """
+        created = set(created)
+        surplus = []
+        for c in batch:
+            for a in c.attachments:
+                key = self._key(a)
+                if key in created:
+                    created.discard(key)
+                else:
+                    surplus.append(a['digest'])
+        return surplus
+
+    @staticmethod
+    def _key(attachment):
+        return attachment['digest'], attachment['filename']
+
+    async def _attachment_ids(self, batch):
+        """
+        Return ids for every attachment, creating the missing rows, and
+        the keys of the rows created.
+        """
+        wanted = {self._key(a): a for c in batch for a in c.attachments}
+        if not wanted:
+            return {}, []
+        digests = list({digest for digest, _ in wanted})
+
+        async def known():
+            rows = await Attachment.filter(digest__in=digests).values_list(
+                'digest', 'filename', 'id')
+            return {(digest, name): pk for digest, name, pk in rows}
+
+        ids = await known()
+        created = [key for key in wanted if key not in ids]
+        if created:
+            await Attachment.bulk_create([
+                Attachment(digest=a['digest'], size=a['size'],
+                           filename=a['filename'], mimetype=a['mimetype'])
+                for a in (wanted[key] for key in created)])
+            ids = await known()
+        return ids, created
@@ -0,0 +1,549 @@
+import binascii
+import email
+import email.parser
+import email.utils
+import io
+import json
+import mmap
+import os
+
+from . import msgcache
+
+
+CHUNK_SIZE = 65536
+MAX_LINE = 65536
+BASE64_JUNK = bytes(set(range(256)) - set(
+    b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/='))
+
+
+def header_end(data):
+    """Return the offset just past the first blank line of ``data``, or -1."""
+    ends = [i + 2 for i in (data.find(b'\n\n'),) if i >= 0]
+    ends += [i + 3 for i in (data.find(b'\n\r\n'),) if i >= 0]
+    return min(ends) if ends else -1
+
+
+class MappedFile(object):
+    """
+    The read-only file interface ``RawMessage`` needs over an ``mmap``
+    of a whole file, so slices of a spooled message are read without
+    copying it into memory first.
+    """
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            # An empty file cannot be mapped.
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) \
+                if size else b''
+        self.size = size
+        self.pos = 0
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.pos
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.pos = max(offset, 0)
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+    def read(self, size=-1):
+        end = self.size if size is None or size < 0 else self.pos + size
+        data = self.map[self.pos:end]
+        self.pos += len(data)
+        return data
+
+    def readline(self, size=-1):
+        end = self.map.find(b'\n', self.pos) + 1 or self.size
+        if size is not None and size >= 0:
+            end = min(end, self.pos + size)
+        return self.read(end - self.pos)
+
+    def slice(self, start, end):
+        return self.map[start:end]
+
+    def close(self):
+        if isinstance(self.map, mmap.mmap):
+            self.map.close()
+
+
+class RawMessage(object):
+    """
+    A message kept as raw bytes of which only the header block is parsed.
+
+    ``fp`` is a seekable binary file holding the message from ``start``
+    on, up to ``end`` (default: the end of the file). The headers are
+    parsed into ``headers`` (an ``email.message.Message`` without a
+    payload) and the offset of the body is recorded, so header lookups,
+    the size and the raw body of a single part message never touch the
+    rest of the data. The full MIME tree is only built the first time
+    ``message`` is used.
+
+    Callers that already parsed the headers while receiving the data
+    (e.g. ``ingest.MessageSink``) pass ``headers`` and ``body_offset``;
+    those that have its ``MimePart`` index pass ``structure``.
+    """
+    def __init__(self, fp, start=0, headers=None, body_offset=None,
+                 end=None, structure=None):
+        self.fp = fp
+        self.start = start
+        self.end = end
+        self._message = None
+        self._structure = structure
+        if headers is None:
+            headers, body_offset = self._parse_headers()
+        self.headers = headers
+        self.body_offset = self.size if body_offset is None else body_offset
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(io.BytesIO(data))
+
+    @classmethod
+    def from_file(cls, fp):
+        """Copy a message that may not be seekable (or kept) into memory."""
+        return cls.from_bytes(fp.read())
+
+    @classmethod
+    def from_path(cls, path, index_path=None):
+        """
+        Map the message stored at ``path``. If ``index_path`` holds the
+        sidecar written by ``write_index`` the headers and MIME
+        structure are loaded from it instead of scanning the data.
+        """
+        fp = MappedFile(path)
+        if index_path is None:
+            return cls(fp)
+        try:
+            with open(index_path, 'rb') as f:
+                root = load_structure(json.load(f), fp)
+        except (FileNotFoundError, ValueError):
+            # No usable sidecar; scan the data instead.
+            return cls(fp)
+        return cls(fp, headers=root.headers, body_offset=root.body_start,
+                   structure=root)
+
+    def close(self):
+        self.fp.close()
+
+    def subpart(self, index):
+        """
+        Return child ``index`` of the MIME structure as a ``RawMessage``
+        over the same data, bounded to the bytes of that part.
+        """
+        part = self.structure.children[index]
+        return RawMessage(self.fp, part.header_start, part.headers,
+                          part.body_start - part.header_start,
+                          part.body_end, part)
+
+    def _parse_headers(self):
+        headers, body_start = _LineReader(self.fp, self.start,
+                                          self.end).read_headers()
+        return headers, body_start - self.start
+
+    @property
+    def size(self):
+        if self.end is not None:
+            return self.end - self.start
+        return self.fp.seek(0, io.SEEK_END) - self.start
+
+    def _read(self, start):
+        if isinstance(self.fp, MappedFile):
+            return self.fp.slice(start, self.end)
+        self.fp.seek(start)
+        if self.end is None:
+            return self.fp.read()
+        return self.fp.read(max(self.end - start, 0))
+
+    def read(self):
+        """Return the whole raw message."""
+        return self._read(self.start)
+
+    def read_body(self):
+        """Return the raw (still transfer-encoded) body."""
+        return self._read(self.start + self.body_offset)
+
+    def copy(self, out, chunk_size=CHUNK_SIZE):
+        """Write the raw message to ``out`` in chunks; return its size."""
+        pos = self.start
+        end = self.start + self.size
+        size = 0
+        while pos < end:
+            if isinstance(self.fp, MappedFile):
+                chunk = self.fp.slice(pos, min(pos + chunk_size, end))
+            else:
+                self.fp.seek(pos)
+                chunk = self.fp.read(min(chunk_size, end - pos))
+            if not chunk:
+                break
+            out.write(chunk)
+            pos += len(chunk)
+            size += len(chunk)
+        return size
+
+    def read_part(self, part):
+        """Return the raw body of the ``MimePart`` ``part``."""
+        if isinstance(self.fp, MappedFile):
+            return self.fp.slice(part.body_start, part.body_end)
+        self.fp.seek(part.body_start)
+        return self.fp.read(part.body_size)
+
+    def is_multipart(self):
+        return self.headers.get_content_maintype() == 'multipart'
+
+    def has_subparts(self):
+        """Whether ``subpart`` can be used (multipart or message/rfc822)."""
+        return bool(self.structure.children)
+
+    @property
+    def parsed(self):
+        """Whether the full MIME tree has been built yet."""
+        return self._message is not None
+
+    @property
+    def message(self):
+        """
+        The fully parsed ``email.message.Message``, built on first use or
+        shared from ``msgcache.CACHE`` when the same bytes were parsed
+        before. It must not be modified.
+        """
+        if self._message is None:
+            self._message = msgcache.CACHE.parse(self.read())
+        return self._message
+
+    @property
+    def structure(self):
+        """The ``MimePart`` tree of the message, indexed on first use."""
+        if self._structure is None:
+            self._structure = index_parts(self.fp, self.start, self.headers,
+                                          self.body_offset, self.end)
+        return self._structure
+
+    def attachments(self):
+        """Yield the leaf ``MimePart``s that carry a Content-Disposition."""
+        for part in self.structure.walk():
+            if part.children or part.headers.get_content_disposition() is None:
+                continue
+            yield part
+
+    def iter_decoded(self, part, chunk_size=CHUNK_SIZE):
+        """Yield the transfer-decoded body of ``part`` in chunks."""
+        return part.iter_decoded(self.fp, chunk_size)
+
+    def copy_decoded(self, part, out, chunk_size=CHUNK_SIZE):
+        """Write the decoded body of ``part`` to ``out``; return its size."""
+        size = 0
+        for chunk in part.iter_decoded(self.fp, chunk_size):
+            out.write(chunk)
+            size += len(chunk)
+        return size
+
+
+class MimePart(object):
+    """
+    One node of a message's MIME structure located by byte offsets into
+    the raw data: ``headers`` (a payload-less ``email.message.Message``),
+    the raw body between ``body_start`` and ``body_end`` and, for
+    multipart and message/rfc822 parts, ``children``.
+    """
+    def __init__(self, headers, header_start, body_start):
+        self.headers = headers
+        self.header_start = header_start
+        self.body_start = body_start
+        self.body_end = body_start
+        self.children = []
+
+    def __repr__(self):
+        return '<MimePart {} {}-{}>'.format(self.headers.get_content_type(),
+                                            self.body_start, self.body_end)
+
+    @property
+    def body_size(self):
+        return self.body_end - self.body_start
+
+    def walk(self):
+        """Yield this part and every part below it, depth first."""
+        yield self
+        for child in self.children:
+            for part in child.walk():
+                yield part
+
+    def iter_body(self, fp, chunk_size=CHUNK_SIZE):
+        """Yield the raw (transfer-encoded) body in chunks."""
+        fp.seek(self.body_start)
+        remaining = self.body_size
+        while remaining > 0:
+            chunk = fp.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+    def iter_decoded(self, fp, chunk_size=CHUNK_SIZE):
+        """Yield the body decoded from its Content-Transfer-Encoding."""
+        decoder = make_decoder(self.headers.get('content-transfer-encoding'))
+        for chunk in self.iter_body(fp, chunk_size):
+            chunk = decoder.decode(chunk)
+            if chunk:
+                yield chunk
+        chunk = decoder.flush()
+        if chunk:
+            yield chunk
+
+
+class IdentityDecoder(object):
+    def decode(self, data):
+        return data
+
+    def flush(self):
+        return b''
+
+
+class Base64Decoder(object):
+    """
+    Incremental base64 decoding. Characters outside the alphabet are
+    dropped like ``get_payload(decode=True)`` does and only whole
+    quanta are decoded, the rest waits for the next chunk.
+    """
+    def __init__(self):
+        self.pending = b''
+
+    def decode(self, data):
+        data = self.pending + data.translate(None, BASE64_JUNK)
+        end = len(data) & ~3
+        self.pending = data[end:]
+        return binascii.a2b_base64(data[:end]) if end else b''
+
+    def flush(self):
+        data, self.pending = self.pending, b''
+        if not data:
+            return b''
+        try:
+            return binascii.a2b_base64(data + b'=' * (-len(data) % 4))
+        except binascii.Error:
+            return b''
+
+
+class QuotedPrintableDecoder(object):
+    """Incremental quoted-printable decoding on whole lines."""
+
+    def __init__(self):
+        self.pending = b''
+
+    def decode(self, data):
+        data = self.pending + data
+        end = data.rfind(b'\n') + 1
+        self.pending = data[end:]
+        return binascii.a2b_qp(data[:end]) if end else b''
+
+    def flush(self):
+        data, self.pending = self.pending, b''
+        return binascii.a2b_qp(data) if data else b''
+
+
+DECODERS = {
+    'base64': Base64Decoder,
+    'quoted-printable': QuotedPrintableDecoder,
+}
+
+
+def make_decoder(encoding):
+    """Return an incremental decoder for a Content-Transfer-Encoding."""
+    return DECODERS.get(str(encoding or '').strip().lower(), IdentityDecoder)()
+
+
+class _LineReader(object):
+    """
+    Iterate over ``fp`` from ``pos`` (up to ``end``) as ``(offset, line,
+    at_line_start, previous_eol)`` tuples. Lines longer than ``MAX_LINE``
+    come in pieces, so a body without line breaks never has to fit in
+    memory.
+    """
+    def __init__(self, fp, pos, end=None):
+        fp.seek(pos)
+        self.fp = fp
+        self.pos = pos
+        self.end = end
+        self.at_line_start = True
+        self.eol = 0
+        self._last_cr = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        limit = MAX_LINE if self.end is None else \
+            min(MAX_LINE, self.end - self.pos)
+        line = self.fp.readline(limit) if limit > 0 else b''
+
+        if not line:
+            raise StopIteration
+        item = (self.pos, line, self.at_line_start, self.eol)
+        self.pos += len(line)
+        self.at_line_start = line.endswith(b'\n')
+        if self.at_line_start:
+            self.eol = 2 if line.endswith(b'\r\n') or (
+                line == b'\n' and self._last_cr) else 1
+        self._last_cr = line.endswith(b'\r')
+        return item
+
+    def read_headers(self):
+        """Parse a header block; return the headers and the body offset."""
+        lines = []
+        for _, line, _, _ in self:
+            if line in (b'\n', b'\r\n'):
+                break
+            lines.append(line)
+        return email.parser.BytesHeaderParser().parsebytes(
+            b''.join(lines)), self.pos
+
+    def skip_to(self, delimiters):
+        """
+        Advance to the next line matching one of ``delimiters``
+        (``b'--' + boundary``) and return ``(offset, previous_eol,
+        delimiter, closing)``, or None at the end of the data.
+        """
+        for offset, line, at_line_start, previous_eol in self:
+            if not at_line_start or not line.startswith(b'--'):
+                continue
+            line = line.rstrip(b' \t\r\n')
+            for delimiter in reversed(delimiters):
+                if line == delimiter:
+                    return offset, previous_eol, delimiter, False
+                if line == delimiter + b'--':
+                    return offset, previous_eol, delimiter, True
+        return None
+
+
+def index_parts(fp, start=0, headers=None, body_offset=None, end=None):
+    """
+    Locate every MIME part of the message in ``fp`` in one pass over
+    its lines and return the root ``MimePart``. Only header blocks are
+    parsed; bodies are recorded as byte ranges.
+    """
+    if headers is None:
+        lines = _LineReader(fp, start, end)
+        headers, body_start = lines.read_headers()
+    else:
+        body_start = start + body_offset
+        lines = _LineReader(fp, body_start, end)
+    root = MimePart(headers, start, body_start)
+    _scan(lines, root, ())
+    return root
+
+
+def _end_body(part, lines, term):
+    if term is None:
+        part.body_end = lines.pos
+    else:
+        part.body_end = max(term[0] - term[1], part.body_start)
+
+
+def _scan(lines, part, delimiters):
+    """
+    Read the body of ``part`` and of its children. Returns the
+    delimiter line of an enclosing multipart that ended it (see
+    ``_LineReader.skip_to``) or None at the end of the data.
+    """
+    headers = part.headers
+    boundary = headers.get_param('boundary') if \
+        headers.get_content_maintype() == 'multipart' else None
+    if boundary:
+        boundary = email.utils.collapse_rfc2231_value(boundary)
+        own = b'--' + boundary.encode('ascii', 'surrogateescape')
+        inner = delimiters + (own,)
+        # The preamble, up to the first delimiter.
+        term = lines.skip_to(inner)
+        while term is not None and term[2] == own and not term[3]:
+            child_start = lines.pos
+            child_headers, body_start = lines.read_headers()
+            if headers.get_content_subtype() == 'digest':
+                child_headers.set_default_type('message/rfc822')
+            child = MimePart(child_headers, child_start, body_start)
+            part.children.append(child)
+            term = _scan(lines, child, inner)
+        if term is not None and term[2] == own:
+            # The closing delimiter; skip the epilogue.
+            term = lines.skip_to(delimiters)
+        _end_body(part, lines, term)
+        return term
+    if headers.get_content_type() == 'message/rfc822' and isinstance(
+            make_decoder(headers.get('content-transfer-encoding')),
+            IdentityDecoder):
+        child_start = lines.pos
+        child_headers, body_start = lines.read_headers()
+        child = MimePart(child_headers, child_start, body_start)
+        part.children.append(child)
+        term = _scan(lines, child, delimiters)
+        _end_body(part, lines, term)
+        return term
+    term = lines.skip_to(delimiters)
+    _end_body(part, lines, term)
+    return term
+
+
+INDEX_VERSION = 1
+
+
+def dump_structure(root):
+    """
+    Return the offsets of every part below ``root`` as a JSON-able dict:
+    ``[header_start, body_start, body_end, parent, default_type]`` per
+    part, depth first, with the index of the parent part (-1 for the
+    root).
+    """
+    parts = []
+    positions = {}
+    parents = {id(child): part for part in root.walk()
+               for child in part.children}
+    for part in root.walk():
+        positions[id(part)] = len(parts)
+        parent = parents.get(id(part))
+        parts.append([part.header_start, part.body_start, part.body_end,
+                      -1 if parent is None else positions[id(parent)],
+                      part.headers.get_default_type()])
+    return {'version': INDEX_VERSION, 'parts': parts}
+
+
+def load_structure(state, fp):
+    """
+    Rebuild the ``MimePart`` tree saved by ``dump_structure``. Only the
+    header blocks are read from ``fp`` (a ``MappedFile``). Raises
+    ``ValueError`` if ``state`` is malformed or does not fit ``fp``.
+    """
+    try:
+        return _load_structure(state, fp)
+    except (TypeError, KeyError, IndexError) as e:
+        raise ValueError("malformed index: {!r}".format(e)) from e
+
+
+def _load_structure(state, fp):
+    if state['version'] != INDEX_VERSION:
+        raise ValueError("unknown index version {}".format(state['version']))
+    parser = email.parser.BytesHeaderParser()
+    parts = []
+    for header_start, body_start, body_end, parent, default_type in \
+            state['parts']:
+        if not 0 <= header_start <= body_start <= body_end <= fp.size:
+            raise ValueError("part offsets out of range")
+        if (parent < 0) != (not parts) or parent >= len(parts):
+            raise ValueError("bad parent index {}".format(parent))
+        headers = parser.parsebytes(fp.slice(header_start, body_start))
+        if default_type != 'text/plain':
+            headers.set_default_type(default_type)
+        part = MimePart(headers, header_start, body_start)
+        part.body_end = body_end
+        if parent >= 0:
+            parts[parent].children.append(part)
+        parts.append(part)
+    return parts[0]
+
+
+def write_index(path, root):
+    """Atomically write the structure sidecar of a message to ``path``."""
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(dump_structure(root), f, separators=(',', ':'))
+    os.replace(tmp, path)
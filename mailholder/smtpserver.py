@@ -0,0 +1,556 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+
+from . import metrics
+
+
+CRLF = b'\r\n'
+DATA_TERMINATOR = b'\r\n.\r\n'
+READ_SIZE = 65536
+LOCAL_ERROR = '451 4.3.0 Requested action aborted: local error in processing'
+
+SESSIONS = metrics.REGISTRY.gauge(
+    'mailholder_smtp_sessions', 'Open SMTP sessions.')
+SESSIONS_REFUSED = metrics.REGISTRY.counter(
+    'mailholder_smtp_sessions_refused_total',
+    'Connections refused because of the session limit.')
+SESSION_SECONDS = metrics.stage('session')
+INFLIGHT = metrics.REGISTRY.gauge(
+    'mailholder_smtp_inflight_messages', 'Messages being received.')
+INFLIGHT_BYTES = metrics.REGISTRY.gauge(
+    'mailholder_smtp_inflight_bytes',
+    'Bytes reserved or received by messages in progress.')
+REFUSED = {reason: metrics.REGISTRY.counter(
+    'mailholder_smtp_admission_refused_total',
+    'Transactions refused by admission control.', {'reason': reason})
+    for reason in ('storage', 'messages', 'bytes')}
+OUTCOMES = ('accepted', 'rejected', 'failed')
+MESSAGES = {outcome: metrics.REGISTRY.counter(
+    'mailholder_smtp_messages_total',
+    'Messages received over SMTP by outcome.', {'outcome': outcome})
+    for outcome in OUTCOMES}
+MESSAGE_BYTES = {outcome: metrics.REGISTRY.counter(
+    'mailholder_smtp_message_bytes_total',
+    'Bytes of message data received over SMTP by outcome.',
+    {'outcome': outcome}) for outcome in OUTCOMES}
+
+
+class Envelope(object):
+    """
+    The SMTP envelope of a single transaction. Attribute names follow
+    aiosmtpd so handlers written for it (e.g. parsemail.LocalHandler)
+    can be plugged in unchanged. ``sink`` is set instead of ``content``
+    when the handler streams the message through ``open_DATA``.
+    """
+    def __init__(self):
+        self.mail_from = None
+        self.mail_options = []
+        self.rcpt_tos = []
+        self.rcpt_options = []
+        self.content = None
+        self.sink = None
+
+
+class Session(object):
+    """Per-connection state handed to the handler hooks."""
+    def __init__(self, peer):
+        self.peer = peer
+        self.host_name = None
+        self.extended_smtp = False
+
+
+class SMTPServer(object):
+    """
+    An asyncio SMTP server that hands every accepted message to
+    ``handler.handle_DATA(server, session, envelope)``. Handlers that
+    also define ``open_DATA(server, session, envelope)`` return a sink
+    with ``feed(chunk)``/``abort()`` and receive the message body chunk
+    by chunk as it arrives instead of as one ``bytes`` object.
+
+    Commands are read from a per-connection buffer, so pipelined
+    commands (RFC 2920) are answered in order and the replies are
+    flushed together once the client has nothing more queued.
+    ``timeout`` is the per-connection idle timeout in seconds and
+    ``max_sessions`` caps the number of concurrent connections; excess
+    connections are greeted with a 421 and closed.
+
+    Admission control pushes back on senders before the node runs out
+    of memory or disk: ``max_inflight`` caps the messages being received
+    or handled at once, ``max_inflight_bytes`` the bytes they declared
+    (SIZE) or sent so far, and ``min_free_space`` the bytes that must
+    stay free on the filesystem of ``spool_dir``. Over a limit, MAIL,
+    RCPT and DATA get a 451 (421 and a closed connection when the disk
+    is full) so well-behaved clients queue the message and retry.
+    """
+    def __init__(self, handler, host='localhost', port=25, hostname=None,
+                 timeout=300, max_sessions=None, data_size_limit=33554432,
+                 line_limit=8192, max_inflight=None, max_inflight_bytes=None,
+                 spool_dir=None, min_free_space=None):
+        self.handler = handler
+        self.host = host
+        self.port = port
+        self.hostname = hostname or socket.getfqdn()
+        self.timeout = timeout
+        self.max_sessions = max_sessions
+        self.data_size_limit = data_size_limit
+        self.line_limit = line_limit
+        self.max_inflight = max_inflight
+        self.max_inflight_bytes = max_inflight_bytes
+        self.spool_dir = spool_dir
+        self.min_free_space = min_free_space
+        self.sessions = 0
+        self.inflight = 0
+        self.inflight_bytes = 0
+        self._free_space = (None, None)
+        self.server = None
+        self.logger = logging.getLogger('smtpserver')
+
+    async def start(self, **kwargs):
+        """Start listening. Extra kwargs go to ``asyncio.start_server``."""
+        self.server = await asyncio.start_server(
+            self._handle_client, self.host, self.port, **kwargs)
+        return self.server
+
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            try:
+                await self.server.serve_forever()
+            except asyncio.CancelledError:
+                pass
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+
+    async def _handle_client(self, reader, writer):
+        if self.max_sessions and self.sessions >= self.max_sessions:
+            self.logger.warning("Session limit %d reached",
+                                self.max_sessions)
+            SESSIONS_REFUSED.inc()
+            writer.write(b'421 4.3.2 Too many connections, try again '
+                         b'later\r\n')
+            await self._close_writer(writer)
+            return
+        self.sessions += 1
+        SESSIONS.inc()
+        start = time.perf_counter()
+        try:
+            await SMTPProtocol(self, reader, writer).run()
+        finally:
+            self.sessions -= 1
+            SESSIONS.dec()
+            SESSION_SECONDS.observe(time.perf_counter() - start)
+            await self._close_writer(writer)
+
+    def free_space(self):
+        """Free bytes on the spool filesystem, re-read once a second."""
+        now = time.monotonic()
+        checked, free = self._free_space
+        if checked is None or now - checked >= 1.0:
+            st = os.statvfs(self.spool_dir)
+            free = st.f_bavail * st.f_frsize
+            self._free_space = (now, free)
+        return free
+
+    def admit(self, size=0):
+        """
+        Return the reply refusing a new transaction of ``size`` bytes, or
+        None if it can go ahead.
+        """
+        if (self.min_free_space and self.spool_dir
+                and self.free_space() - size < self.min_free_space):
+            REFUSED['storage'].inc()
+            return '421 4.3.1 Insufficient system storage, try again later'
+        if self.max_inflight and self.inflight >= self.max_inflight:
+            REFUSED['messages'].inc()
+            return '451 4.3.2 Too many messages in progress, try again later'
+        if (self.max_inflight_bytes
+                and self.inflight_bytes + size > self.max_inflight_bytes):
+            REFUSED['bytes'].inc()
+            return '451 4.3.1 Too much data in progress, try again later'
+        return None
+
+    def reserve(self, messages, size):
+        self.inflight += messages
+        self.inflight_bytes += size
+        INFLIGHT.set(self.inflight)
+        INFLIGHT_BYTES.set(self.inflight_bytes)
+
+    @staticmethod
+    async def _close_writer(writer):
+        try:
+            writer.close()
+            await writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
+
+
+class SMTPProtocol(object):
+    """The SMTP command loop for one client connection."""
+
+    def __init__(self, server, reader, writer):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.session = Session(writer.get_extra_info('peername'))
+        self.envelope = Envelope()
+        self.declared_size = 0
+        self.reserved = 0
+        self._buffer = b''
+        self._replies = []
+        self._closing = False
+        self.line_too_long = False
+
+    async def run(self):
+        self.push('220 {} ESMTP mailholder'.format(self.server.hostname))
+        try:
+            while not self._closing:
+                line = await self._readline()
+                if line is None:
+                    break
+                await self._dispatch(line)
+            await self._flush()
+        except asyncio.TimeoutError:
+            self.push('421 4.4.2 {} Error: timeout exceeded'.format(
+                self.server.hostname))
+            await self._flush()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+
+    def push(self, status):
+        self._replies.append(status.encode('ascii') + CRLF)
+
+    async def _flush(self):
+        if self._replies:
+            self.writer.write(b''.join(self._replies))
+            self._replies = []
+            await self.writer.drain()
+
+    async def _read(self):
+        data = await asyncio.wait_for(self.reader.read(READ_SIZE),
+                                      self.server.timeout)
+        if not data:
+            raise ConnectionResetError
+        return data
+
+    async def _readline(self):
+        limit = self.server.line_limit
+        discarding = False
+        while True:
+            i = self._buffer.find(b'\n')
+            if i >= 0:
+                line = self._buffer[:i + 1]
+                self._buffer = self._buffer[i + 1:]
+                if discarding:
+                    # The tail of a line already refused as too long.
+                    discarding = False
+                    continue
+                if len(line) <= limit:
+                    return line
+                self.push('500 5.5.2 Error: line too long')
+                continue
+            if len(self._buffer) > limit:
+                # Drop what we have and the rest of the line with it.
+                self._buffer = b''
+                if not discarding:
+                    self.push('500 5.5.2 Error: line too long')
+                    discarding = True
+            # Nothing else is queued, so answer what we have before
+            # blocking on the client.
+            await self._flush()
+            try:
+                self._buffer += await self._read()
+            except ConnectionResetError:
+                return None
+
+    async def _dispatch(self, line):
+        line = line.rstrip(b'\r\n').decode('utf-8', 'surrogateescape')
+        command, _, arg = line.partition(' ')
+        method = getattr(self, 'smtp_' + command.upper(), None)
+        if not command or method is None:
+            self.push('500 5.5.2 Error: command "{}" not recognized'.format(
+                command.upper()))
+            return
+        await method(arg.strip())
+
+    def _reset(self):
+        self.envelope = Envelope()
+        self.declared_size = 0
+
+    def _admit(self):
+        """Push the server's refusal, if any, and return whether it did."""
+        status = self.server.admit(self.declared_size)
+        if status is None:
+            return False
+        self.push(status)
+        if status.startswith('421'):
+            self._closing = True
+        return True
+
+    async def smtp_HELO(self, arg):
+        if not arg:
+            self.push('501 5.5.4 Syntax: HELO hostname')
+            return
+        self._reset()
+        self.session.host_name = arg
+        self.session.extended_smtp = False
+        self.push('250 {}'.format(self.server.hostname))
+
+    async def smtp_EHLO(self, arg):
+        if not arg:
+            self.push('501 5.5.4 Syntax: EHLO hostname')
+            return
+        self._reset()
+        self.session.host_name = arg
+        self.session.extended_smtp = True
+        for line in self.ehlo_lines():
+            self.push('250-' + line)
+        self.push('250 HELP')
+
+    def ehlo_lines(self):
+        return [self.server.hostname, '8BITMIME', 'PIPELINING',
+                'SIZE {}'.format(self.server.data_size_limit)]
+
+    async def smtp_NOOP(self, arg):
+        self.push('250 OK')
+
+    async def smtp_RSET(self, arg):
+        self._reset()
+        self.push('250 OK')
+
+    async def smtp_QUIT(self, arg):
+        self.push('221 Bye')
+        self._closing = True
+
+    async def smtp_VRFY(self, arg):
+        self.push('252 Cannot VRFY user, but will accept message and '
+                  'attempt delivery')
+
+    async def smtp_HELP(self, arg):
+        self.push('250 Supported commands: EHLO HELO MAIL RCPT DATA RSET '
+                  'NOOP QUIT VRFY')
+
+    @staticmethod
+    def _split_path(arg, keyword):
+        """Split ``FROM:<addr> PARAMS`` into the address and params."""
+        if not arg.upper().startswith(keyword):
+            return None, None
+        arg = arg[len(keyword):].strip()
+        if arg.startswith('<'):
+            address, _, params = arg[1:].partition('>')
+        else:
+            address, _, params = arg.partition(' ')
+        return address.strip(), params.split()
+
+    async def smtp_MAIL(self, arg):
+        if self.session.host_name is None:
+            self.push('503 5.5.1 Error: send HELO first')
+            return
+        if self.envelope.mail_from is not None:
+            self.push('503 5.5.1 Error: nested MAIL command')
+            return
+        address, params = self._split_path(arg, 'FROM:')
+        if address is None:
+            self.push('501 5.5.4 Syntax: MAIL FROM:<address>')
+            return
+        size = 0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.upper() == 'SIZE':
+                if not value.isdigit():
+                    self.push('501 5.5.4 Syntax: SIZE=<number>')
+                    return
+                size = int(value)
+        if size > self.server.data_size_limit:
+            self.push('552 5.3.4 Error: message size exceeds fixed '
+                      'maximum message size')
+            return
+        self.declared_size = size
+        if self._admit():
+            self.declared_size = 0
+            return
+        self.envelope.mail_from = address
+        self.envelope.mail_options = params
+        self.push('250 OK')
+
+    async def smtp_RCPT(self, arg):
+        if self.envelope.mail_from is None:
+            self.push('503 5.5.1 Error: need MAIL command')
+            return
+        address, params = self._split_path(arg, 'TO:')
+        if not address:
+            self.push('501 5.5.4 Syntax: RCPT TO:<address>')
+            return
+        if self._admit():
+            return
+        self.envelope.rcpt_tos.append(address)
+        self.envelope.rcpt_options.extend(params)
+        self.push('250 OK')
+
+    async def smtp_DATA(self, arg):
+        if not self.envelope.rcpt_tos:
+            self.push('503 5.5.1 Error: need RCPT command')
+            return
+        if self._admit():
+            self._reset()
+            return
+        self.reserved = self.declared_size
+        self.server.reserve(1, self.reserved)
+        try:
+            await self._receive_data()
+        finally:
+            self.server.reserve(-1, -self.reserved)
+        self._reset()
+
+    async def _receive_data(self):
+        """
+        Receive and hand over one message. Bytes beyond the SIZE
+        reserved at MAIL time are added to the server's in-flight total
+        as they arrive and stay counted until the handler is done.
+        """
+        server = self.server
+        self.push('354 End data with <CR><LF>.<CR><LF>')
+        await self._flush()
+        handler = server.handler
+        sink = None
+        # Storage that fails (e.g. a full disk) gets a 451 once the
+        # sender is done; the rest of the data is read and dropped.
+        failed = False
+        if hasattr(handler, 'open_DATA'):
+            try:
+                sink = await handler.open_DATA(server, self.session,
+                                               self.envelope)
+            except Exception:
+                server.logger.exception("Error opening message storage")
+                failed = True
+        chunks = []
+        size = 0
+        overloaded = False
+        try:
+            async for chunk in self._iter_data():
+                size += len(chunk)
+                if (size > server.data_size_limit or overloaded or failed
+                        or self.line_too_long):
+                    continue
+                if size > self.reserved:
+                    server.reserve(0, size - self.reserved)
+                    self.reserved = size
+                    # A message on its own is only bound by the size limit.
+                    if (server.max_inflight_bytes and server.inflight > 1
+                            and server.inflight_bytes
+                            > server.max_inflight_bytes):
+                        # Stop buffering; the sender retries later.
+                        REFUSED['bytes'].inc()
+                        overloaded = True
+                        continue
+                if sink is None:
+                    chunks.append(chunk)
+                    continue
+                try:
+                    sink.feed(chunk)
+                except Exception:
+                    server.logger.exception("Error storing message")
+                    failed = True
+                    aborted, sink = sink, None
+                    self._abort(aborted)
+        except BaseException:
+            if sink is not None:
+                sink.abort()
+            raise
+        if failed:
+            self._count('failed', size)
+            self.push(LOCAL_ERROR)
+        elif (size > server.data_size_limit or overloaded
+                or self.line_too_long):
+            if sink is not None:
+                sink.abort()
+            if self.line_too_long:
+                self.push('500 5.5.2 Error: line too long')
+            elif overloaded:
+                self.push('451 4.3.1 Too much data in progress, try again '
+                          'later')
+            else:
+                self.push('552 5.3.4 Error: message too large')
+            self._count('rejected', size)
+        else:
+            if sink is not None:
+                self.envelope.sink = sink
+            else:
+                self.envelope.content = b''.join(chunks)
+            try:
+                status = await handler.handle_DATA(
+                    server, self.session, self.envelope) or '250 OK'
+            except Exception:
+                server.logger.exception("Error handling message")
+                if sink is not None:
+                    self._abort(sink)
+                self._count('failed', size)
+                self.push(LOCAL_ERROR)
+            else:
+                self._count('accepted' if status.startswith('2')
+                            else 'rejected', size)
+                self.push(status)
+
+    def _abort(self, sink):
+        """Discard a stored message; a failure to clean up is only logged."""
+        try:
+            sink.abort()
+        except Exception:
+            self.server.logger.exception("Error discarding message")
+
+    @staticmethod
+    def _count(outcome, size):
+        MESSAGES[outcome].inc()
+        MESSAGE_BYTES[outcome].inc(size)
+
+    async def _iter_data(self):
+        """
+        Yield the dot-unstuffed message body in chunks as it arrives.
+
+        The pending buffer always starts at a CRLF, so both the
+        terminator and dot-stuffed lines can be matched with a single
+        ``find``/``replace`` on complete lines. Anything received after
+        the terminator is put back for the command loop.
+
+        A line longer than the server's ``line_limit`` sets
+        ``line_too_long`` and is dropped as it arrives, so it is never
+        buffered whole; the rest of the message is still read up to the
+        terminator.
+        """
+        limit = self.server.line_limit
+        pending = CRLF + self._buffer
+        self._buffer = b''
+        self.line_too_long = False
+        first = True
+        while True:
+            end = pending.find(DATA_TERMINATOR)
+            if end >= 0:
+                chunk, self._buffer = (pending[:end + 2],
+                                       pending[end + len(DATA_TERMINATOR):])
+            else:
+                cut = pending.rfind(CRLF)
+                if cut <= 0:
+                    if len(pending) > limit + 2:
+                        # Keep a CR that may start the line's CRLF.
+                        self.line_too_long = True
+                        pending = pending[-1:]
+                    pending += await self._read()
+                    continue
+                chunk, pending = pending[:cut], pending[cut:]
+            if (not self.line_too_long and len(chunk) > limit
+                    and max(map(len, chunk.split(CRLF))) + 2 > limit):
+                self.line_too_long = True
+            chunk = chunk.replace(b'\r\n..', b'\r\n.')
+            if first:
+                chunk = chunk[2:]
+                first = False
+            if chunk:
+                yield chunk
+            if end >= 0:
+                return
+            pending += await self._read()
@@ -0,0 +1,402 @@
+import asyncio
+import concurrent.futures
+import itertools
+import json
+import os
+import socket
+import time
+from urllib.parse import quote, unquote
+
+from . import metrics
+from .rawmessage import RawMessage, index_parts, write_index
+
+
+FSYNC_NONE = 'none'
+FSYNC_MESSAGE = 'message'
+FSYNC_GROUP = 'group'
+FSYNC_POLICIES = (FSYNC_NONE, FSYNC_MESSAGE, FSYNC_GROUP)
+
+INDEX_SECONDS = metrics.stage('index')
+FSYNC_SECONDS = metrics.stage('fsync')
+FSYNC_PENDING = metrics.REGISTRY.gauge(
+    'mailholder_fsync_pending_messages',
+    'Spooled messages waiting for a group fsync.')
+
+
+def fsync_path(path):
+    """fsync a file or directory by path."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class FsyncPolicy(object):
+    """
+    Decide when spool writes are forced to disk.
+
+    ``none`` leaves it to the kernel, ``message`` fsyncs every file and
+    directory before a delivery is acknowledged, and ``group`` collects
+    the touched paths and fsyncs them together once ``batch`` messages
+    are pending or the oldest has waited ``interval`` milliseconds.
+    Callers inside an event loop can ``await wait()`` to hold their
+    reply until the group containing their message is on disk; there
+    the groups are synced one after the other on a worker thread, so
+    the loop keeps serving other sessions in the meantime.
+    """
+    def __init__(self, mode=FSYNC_NONE, batch=100, interval=10.0):
+        if mode not in FSYNC_POLICIES:
+            raise ValueError("Unknown fsync policy {!r}".format(mode))
+        self.mode = mode
+        self.batch = batch
+        self.interval = interval
+        self._files = set()
+        self._dirs = set()
+        self._pending = 0
+        self._since = None
+        self._waiters = []
+        self._timer = None
+        self._executor = None
+        self._syncing = None
+
+    def written(self, f, path=None):
+        """
+        Called with an open file before it is closed. ``path`` is the
+        name the file will have by the time a group is flushed.
+        """
+        if self.mode == FSYNC_MESSAGE:
+            f.flush()
+            os.fsync(f.fileno())
+        elif self.mode == FSYNC_GROUP:
+            self._files.add(path or f.name)
+
+    def renamed(self, path):
+        """Called after ``path`` was linked into its directory."""
+        directory = os.path.dirname(path)
+        if self.mode == FSYNC_MESSAGE:
+            fsync_path(directory)
+        elif self.mode == FSYNC_GROUP:
+            self._dirs.add(directory)
+
+    def committed(self):
+        """Called once per delivered message."""
+        if self.mode != FSYNC_GROUP:
+            return
+        self._pending += 1
+        FSYNC_PENDING.set(self._pending)
+        now = time.monotonic()
+        if self._since is None:
+            self._since = now
+        if (self._pending >= self.batch
+                or (now - self._since) * 1000 >= self.interval):
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                self.flush()
+            else:
+                self._flush_in_executor(loop)
+
+    def _take(self):
+        """Detach the current group: its paths and its waiters."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        files, self._files = self._files, set()
+        dirs, self._dirs = self._dirs, set()
+        waiters, self._waiters = self._waiters, []
+        self._pending = 0
+        self._since = None
+        FSYNC_PENDING.set(0)
+        return files, dirs, waiters
+
+    @staticmethod
+    def _sync(files, dirs):
+        with FSYNC_SECONDS.time():
+            for path in files:
+                try:
+                    fsync_path(path)
+                except FileNotFoundError:
+                    # Moved on by a reader (e.g. Maildir new -> cur).
+                    pass
+            for path in dirs:
+                fsync_path(path)
+
+    @staticmethod
+    def _wake(waiters, error=None):
+        for waiter in waiters:
+            if waiter.done():
+                continue
+            if error is None:
+                waiter.set_result(None)
+            else:
+                waiter.set_exception(error)
+
+    def flush(self):
+        """fsync everything collected so far and wake the waiters."""
+        files, dirs, waiters = self._take()
+        self._sync(files, dirs)
+        self._wake(waiters)
+
+    def _flush_in_executor(self, loop):
+        files, dirs, waiters = self._take()
+        if self._executor is None:
+            # One thread, so a group is on disk only after the ones
+            # before it.
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                1, thread_name_prefix='fsync')
+        syncing = loop.run_in_executor(self._executor, self._sync,
+                                       files, dirs)
+        syncing.add_done_callback(
+            lambda future: self._wake(waiters, future.exception()))
+        self._syncing = syncing
+
+    async def wait(self):
+        """Return once every message committed so far is on disk."""
+        if self.mode != FSYNC_GROUP:
+            return
+        if not self._pending:
+            if self._syncing is not None and not self._syncing.done():
+                await asyncio.shield(self._syncing)
+            return
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        self._waiters.append(waiter)
+        if self._timer is None:
+            delay = self.interval / 1000 - (time.monotonic() - self._since)
+            self._timer = loop.call_later(max(delay, 0),
+                                          self._flush_in_executor, loop)
+        await waiter
+
+    def close(self):
+        """Flush what is left and stop the fsync thread."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        if self._pending:
+            self.flush()
+
+
+class Spool(object):
+    """
+    A directory of captured messages where every message is stored once,
+    no matter how many recipients it had.
+
+    Layout::
+
+        messages/<id>.mail   raw message data
+        envelopes.idx        one JSON line per message: id, from, to
+        rcpt/<recipient>     one message id per line, appended on delivery
+        mime/<id>.json       optional MIME part offsets, see ``open_message``
+
+    Listing the mail of a recipient reads only that recipient's index
+    file, so it costs O(1) per message regardless of the spool size.
+    Message ids include the pid and index lines are written with
+    O_APPEND, so several capture processes can share one spool.
+    """
+    MESSAGES = 'messages'
+    RECIPIENTS = 'rcpt'
+    STRUCTURES = 'mime'
+    ENVELOPES = 'envelopes.idx'
+
+    def __init__(self, mail_dir, fsync=None):
+        self.mail_dir = mail_dir
+        self.message_dir = os.path.join(mail_dir, self.MESSAGES)
+        self.rcpt_dir = os.path.join(mail_dir, self.RECIPIENTS)
+        self.structure_dir = os.path.join(mail_dir, self.STRUCTURES)
+        self.envelope_path = os.path.join(mail_dir, self.ENVELOPES)
+        self.fsync = fsync or FsyncPolicy()
+        self._sequence = itertools.count()
+        for path in self.directories():
+            os.makedirs(path, 0o775, exist_ok=True)
+
+    def directories(self):
+        return [self.message_dir, self.rcpt_dir, self.structure_dir]
+
+    def new_id(self):
+        return "{:f}.{}.{}".format(time.time(), os.getpid(),
+                                   next(self._sequence))
+
+    def delivery_path(self, msg_id):
+        """Return where ``commit`` puts the raw data of ``msg_id``."""
+        return os.path.join(self.message_dir, msg_id + '.mail')
+
+    def tmp_path(self, msg_id):
+        """Return where ``msg_id`` is written before it is committed."""
+        return self.delivery_path(msg_id) + '.tmp'
+
+    def path(self, msg_id):
+        """Return the path of the raw data of ``msg_id``."""
+        return self.delivery_path(msg_id)
+
+    def structure_path(self, msg_id):
+        """Return the path of the MIME structure sidecar of ``msg_id``."""
+        return os.path.join(self.structure_dir, msg_id + '.json')
+
+    def open_message(self, msg_id):
+        """
+        Return the message as a ``RawMessage`` mapped from the spool.
+        With a structure sidecar, sizes, bodies and sub-parts are slices
+        of the mapping and nothing is parsed but header blocks.
+        """
+        return RawMessage.from_path(self.path(msg_id),
+                                    self.structure_path(msg_id))
+
+    def _rcpt_path(self, recipient):
+        name = quote(recipient.lower(), safe='@+-_')
+        # quote() never escapes '.', so '.' and '..' would name the
+        # directory itself or its parent.
+        if name.startswith('.'):
+            name = '%2E' + name[1:]
+        return os.path.join(self.rcpt_dir, name)
+
+    def open(self, mailfrom, rcpttos):
+        """Return a ``SpoolWriter`` for a message delivered in pieces."""
+        return SpoolWriter(self, mailfrom, rcpttos)
+
+    def deliver(self, mailfrom, rcpttos, data):
+        """Store ``data`` once and index it for every recipient."""
+        writer = self.open(mailfrom, rcpttos)
+        writer.write(data)
+        return writer.commit()
+
+    def index(self, msg_id, mailfrom, rcpttos):
+        """Record the envelope of a stored message."""
+        envelope = json.dumps({'id': msg_id, 'from': mailfrom,
+                               'to': rcpttos}, separators=(',', ':'))
+        with open(self.envelope_path, 'a') as f:
+            f.write(envelope + '\n')
+            self.fsync.written(f)
+        line = (msg_id + '\n').encode('ascii')
+        for recipient in set(r.lower() for r in rcpttos):
+            with open(self._rcpt_path(recipient), 'ab') as f:
+                f.write(line)
+                self.fsync.written(f)
+
+    def messages_for(self, recipient):
+        """Return the ids of all messages delivered to ``recipient``."""
+        try:
+            with open(self._rcpt_path(recipient)) as f:
+                return f.read().split()
+        except FileNotFoundError:
+            return []
+
+    def recipients(self):
+        """Return every recipient that has mail in the spool."""
+        return [unquote(name) for name in os.listdir(self.rcpt_dir)]
+
+    def envelopes(self):
+        """Iterate over the envelope index in delivery order."""
+        try:
+            with open(self.envelope_path) as f:
+                for line in f:
+                    yield json.loads(line)
+        except FileNotFoundError:
+            return
+
+
+class MaildirSpool(Spool):
+    """
+    A ``Spool`` whose messages live in a Maildir (``tmp``/``new``/``cur``)
+    so any Maildir reader can pick them up. Messages are written to
+    ``tmp`` under a unique name and renamed into ``new`` on commit; the
+    envelope and recipient indexes sit next to the Maildir folders.
+    """
+    def __init__(self, mail_dir, fsync=None):
+        self.hostname = socket.gethostname().replace(
+            '/', r'\057').replace(':', r'\072')
+        Spool.__init__(self, mail_dir, fsync)
+
+    def directories(self):
+        return [os.path.join(self.mail_dir, sub)
+                for sub in ('tmp', 'new', 'cur')] + [self.rcpt_dir,
+                                                     self.structure_dir]
+
+    def new_id(self):
+        now = time.time()
+        return "{}.M{}P{}Q{}.{}".format(int(now), int(now % 1 * 1000000),
+                                        os.getpid(), next(self._sequence),
+                                        self.hostname)
+
+    def delivery_path(self, msg_id):
+        return os.path.join(self.mail_dir, 'new', msg_id)
+
+    def tmp_path(self, msg_id):
+        return os.path.join(self.mail_dir, 'tmp', msg_id)
+
+    def path(self, msg_id):
+        path = self.delivery_path(msg_id)
+        if os.path.exists(path):
+            return path
+        # A reader may have moved it to cur and added an info suffix.
+        cur = os.path.join(self.mail_dir, 'cur')
+        for name in os.listdir(cur):
+            if name.split(':', 1)[0] == msg_id:
+                return os.path.join(cur, name)
+        return path
+
+
+SPOOLS = {
+    'flat': Spool,
+    'maildir': MaildirSpool,
+}
+
+
+class SpoolWriter(object):
+    """
+    A message being written into the spool. The data goes to a
+    temporary file and only shows up in the spool and its indexes once
+    ``commit`` renames it into place.
+    """
+    def __init__(self, spool, mailfrom, rcpttos):
+        self.spool = spool
+        self.mailfrom = mailfrom
+        self.rcpttos = rcpttos
+        self.msg_id = spool.new_id()
+        self.tmp_path = spool.tmp_path(self.msg_id)
+        self.path = spool.delivery_path(self.msg_id)
+        self.file = open(self.tmp_path, 'xb')
+        self.committed = False
+
+    def write(self, data):
+        return self.file.write(data)
+
+    def write_structure(self, headers=None, body_offset=None):
+        """
+        Index the MIME parts of the data written so far and store the
+        sidecar that ``Spool.open_message`` loads. ``headers`` and
+        ``body_offset`` are those already parsed on the way in, if any.
+        """
+        self.file.flush()
+        with open(self.tmp_path, 'rb') as f:
+            root = index_parts(f, 0, headers, body_offset)
+        write_index(self.spool.structure_path(self.msg_id), root)
+        return root
+
+    def commit(self):
+        fsync = self.spool.fsync
+        fsync.written(self.file, self.path)
+        self.file.close()
+        os.rename(self.tmp_path, self.path)
+        self.committed = True
+        fsync.renamed(self.path)
+        with INDEX_SECONDS.time():
+            self.spool.index(self.msg_id, self.mailfrom, self.rcpttos)
+        fsync.committed()
+        return self.msg_id
+
+    def abort(self):
+        """Discard the message, unless it was committed already."""
+        if self.committed:
+            return
+        try:
+            self.file.close()
+        except OSError:
+            # Flushing what was buffered failed (e.g. a full disk);
+            # it is being thrown away.
+            pass
+        os.unlink(self.tmp_path)
+        try:
+            os.unlink(self.spool.structure_path(self.msg_id))
+        except FileNotFoundError:
+            pass
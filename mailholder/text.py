@@ -0,0 +1,69 @@
+"""
+Text extraction from messages for search indexing and previews.
+
+Only text parts are decoded, each with its own charset, and codec
+lookups are cached since the same handful of charsets repeats across
+every message.
+"""
+import codecs
+import functools
+
+from .rawmessage import RawMessage
+
+
+DEFAULT_CHARSET = 'utf-8'
+
+
+@functools.lru_cache(maxsize=256)
+def lookup_codec(charset, default=DEFAULT_CHARSET):
+    """
+    Return the Python codec name for a MIME ``charset`` parameter, or
+    that of ``default`` when it is missing or unknown.
+    """
+    charset = (charset or '').strip().strip('"\'').lower()
+    if charset:
+        try:
+            return codecs.lookup(charset).name
+        except LookupError:
+            pass
+    if default is None:
+        return None
+    return lookup_codec(default, None) or 'utf-8'
+
+
+def decode_text(data, charset=None, default=DEFAULT_CHARSET):
+    """Decode ``data`` with ``charset``, replacing undecodable bytes."""
+    return data.decode(lookup_codec(charset, default), 'replace')
+
+
+def is_text_part(headers, attachments=False):
+    """Whether the part with ``headers`` holds text worth extracting."""
+    if headers.get_content_maintype() != 'text':
+        return False
+    return attachments or headers.get_content_disposition() != 'attachment'
+
+
+def iter_text(msg, default=DEFAULT_CHARSET, attachments=False):
+    """
+    Yield ``(content_type, text)`` for every text part of ``msg`` (a
+    ``RawMessage`` or an ``email.message.Message``), decoded on demand.
+    Parts without a charset use ``default``. Text attachments are
+    skipped unless ``attachments`` is set.
+    """
+    if isinstance(msg, RawMessage) and not msg.parsed:
+        for part in msg.structure.walk():
+            headers = part.headers
+            if part.children or not is_text_part(headers, attachments):
+                continue
+            data = b''.join(msg.iter_decoded(part))
+            yield headers.get_content_type(), decode_text(
+                data, headers.get_content_charset(), default)
+        return
+    if isinstance(msg, RawMessage):
+        msg = msg.message
+    for part in msg.walk():
+        if part.is_multipart() or not is_text_part(part, attachments):
+            continue
+        data = part.get_payload(decode=True) or b''
+        yield part.get_content_type(), decode_text(
+            data, part.get_content_charset(), default)
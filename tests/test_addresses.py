@@ -0,0 +1,86 @@
+import email.utils
+import unittest
+
+from mailholder.addresses import decode_words, parse_address_list
+
+try:
+    from mailholder.mailtojson import MailJson
+except ImportError:
+    MailJson = None
+
+
+class TestParseAddressList(unittest.TestCase):
+    def assertParses(self, header, expected):
+        self.assertEqual(parse_address_list(header), expected)
+
+    def test_plain(self):
+        self.assertParses('a@example.com, Bob <b@example.com>',
+                          [('', 'a@example.com'), ('Bob', 'b@example.com')])
+
+    def test_quoted_name_with_comma(self):
+        self.assertParses('"Smith, John" <john@example.com>, b@example.com',
+                          [('Smith, John', 'john@example.com'),
+                           ('', 'b@example.com')])
+
+    def test_comments(self):
+        self.assertParses('a@example.com (Alice)',
+                          [('Alice', 'a@example.com')])
+        self.assertParses('Bob <bob@example.com> (work)',
+                          [('Bob', 'bob@example.com')])
+
+    def test_groups(self):
+        self.assertParses('undisclosed-recipients:;', [])
+        self.assertParses('Team: a@example.com, "B" <b@example.com>;, '
+                          'c@example.com',
+                          [('', 'a@example.com'), ('B', 'b@example.com'),
+                           ('', 'c@example.com')])
+
+    def test_source_route_and_folding(self):
+        self.assertParses('<@r1,@r2:user@example.com>',
+                          [('', 'user@example.com')])
+        self.assertParses('Name\r\n <name@example.com>',
+                          [('Name', 'name@example.com')])
+        self.assertParses('a@example.com,,', [('', 'a@example.com')])
+
+    def test_encoded_words(self):
+        self.assertParses('=?utf-8?q?J=C3=B6rg?= <j@example.de>',
+                          [('Jörg', 'j@example.de')])
+        # A character split across two adjacent encoded words.
+        self.assertEqual(decode_words('=?utf-8?b?wg==?= =?utf-8?b?qQ==?='),
+                         '©')
+        self.assertEqual(decode_words('plain name'), 'plain name')
+
+    def test_matches_getaddresses(self):
+        header = ', '.join('"User {0}" <user{0}@example.com>'.format(i)
+                           for i in range(50))
+        self.assertEqual(parse_address_list(header),
+                         email.utils.getaddresses([header]))
+
+
+@unittest.skipIf(MailJson is None, "chardet is not installed")
+class TestMailJsonRecipients(unittest.TestCase):
+    def parsed_headers(self, data):
+        mail = MailJson.from_bytes(data)
+        mail.parse_mail()
+        return mail.json_data['parsed_headers']
+
+    def test_only_from_is_collapsed(self):
+        headers = self.parsed_headers(
+            b'From: Alice <a@example.com>\r\n'
+            b'To: b@example.com, c@example.com\r\n'
+            b'Reply-To: d@example.com\r\n\r\nbody\r\n')
+        self.assertEqual(headers['from'],
+                         {'name': 'Alice', 'email': 'a@example.com'})
+        self.assertEqual(headers['to'], [
+            {'name': None, 'email': 'b@example.com'},
+            {'name': None, 'email': 'c@example.com'}])
+        self.assertEqual(headers['reply-to'],
+                         [{'name': None, 'email': 'd@example.com'}])
+
+    def test_empty_from(self):
+        headers = self.parsed_headers(b'From: \r\nTo: b@example.com\r\n\r\n')
+        self.assertEqual(headers['from'], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
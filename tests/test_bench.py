@@ -0,0 +1,60 @@
+import asyncio
+import shutil
+import tempfile
+import unittest
+
+from mailholder.bench import run_load
+from mailholder.smtpserver import SMTPServer
+
+
+MESSAGE = b'Subject: bench\r\n\r\nbody\r\n.\r\n'
+
+
+class Handler(object):
+    def __init__(self, status='250 OK'):
+        self.status = status
+
+    async def handle_DATA(self, server, session, envelope):
+        return self.status
+
+
+class TestRunLoad(unittest.IsolatedAsyncioTestCase):
+    async def start(self, status='250 OK', **kwargs):
+        server = SMTPServer(Handler(status), host='127.0.0.1', port=0,
+                            **kwargs)
+        listener = await server.start()
+        self.addAsyncCleanup(self.stop, server)
+        return listener.sockets[0].getsockname()[1]
+
+    @staticmethod
+    async def stop(server):
+        server.close()
+
+    async def test_accepted(self):
+        port = await self.start()
+        results = await run_load('127.0.0.1', port, [MESSAGE], 10, 3, 2)
+        self.assertEqual(results['accepted'], 10)
+        self.assertEqual(results['tempfailed'], 0)
+        self.assertEqual(len(results['latencies']), 10)
+
+    async def test_disconnect_is_a_temporary_failure(self):
+        # Not enough free space: MAIL gets a 421 and the connection is
+        # closed, which must not end the run.
+        spool_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, spool_dir)
+        port = await self.start(spool_dir=spool_dir, min_free_space=1 << 62)
+        results = await asyncio.wait_for(
+            run_load('127.0.0.1', port, [MESSAGE], 6, 2, 1), 10)
+        self.assertEqual(results['tempfailed'], 6)
+        self.assertEqual(results['accepted'], 0)
+
+    async def test_refused_message_is_a_temporary_failure(self):
+        port = await self.start('451 4.3.0 Try again later')
+        results = await asyncio.wait_for(
+            run_load('127.0.0.1', port, [MESSAGE], 4, 1, 1), 10)
+        self.assertEqual(results['tempfailed'], 4)
+        self.assertEqual(results['rejected'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
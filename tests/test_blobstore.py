@@ -0,0 +1,63 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from mailholder.blobstore import BlobStore
+
+
+class TestBlobStore(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.store = BlobStore(self.dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_put_dedupes(self):
+        digest = self.store.put(b'attachment')
+        self.assertEqual(self.store.put(b'attachment'), digest)
+        self.assertEqual(self.store.refs(digest), 2)
+        self.assertEqual(self.store.size(digest), len(b'attachment'))
+        with self.store.open(digest) as f:
+            self.assertEqual(f.read(), b'attachment')
+
+    def test_put_file_matches_put(self):
+        data = os.urandom(200000)
+        digest = self.store.put_file(io.BytesIO(data))
+        self.assertEqual(self.store.put(data), digest)
+        self.assertEqual(self.store.refs(digest), 2)
+
+    def test_gc_keeps_referenced_blobs(self):
+        kept = self.store.put(b'kept')
+        dropped = self.store.put(b'dropped')
+        self.store.put(b'dropped')
+        self.store.decref(dropped)
+        self.assertEqual(self.store.gc(), 0)
+        self.store.decref(dropped)
+        self.assertEqual(self.store.gc(), 1)
+        self.assertFalse(self.store.exists(dropped))
+        self.assertTrue(self.store.exists(kept))
+        self.assertEqual(self.store.refs(dropped), 0)
+
+    def test_decref_does_not_go_negative(self):
+        digest = self.store.put(b'x')
+        self.store.decref(digest)
+        self.store.decref(digest)
+        self.assertEqual(self.store.refs(digest), 0)
+        # A new reference after the extra decref keeps the blob alive.
+        self.store.put(b'x')
+        self.assertEqual(self.store.gc(), 0)
+        self.assertTrue(self.store.exists(digest))
+
+    def test_writer_abort_leaves_nothing(self):
+        writer = self.store.writer()
+        writer.write(b'partial')
+        writer.abort()
+        self.assertEqual([name for name in os.listdir(self.dir)
+                          if name != 'refs.sqlite3'], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
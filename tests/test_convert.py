@@ -0,0 +1,151 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from mailholder import convert
+from mailholder.spool import MaildirSpool, Spool
+
+try:
+    from mailholder import mailtojson
+except ImportError:
+    mailtojson = None
+
+
+def data(n):
+    return b'Subject: message %d\r\n\r\nbody %d\r\n' % (n, n)
+
+
+MBOX = (b'From a@example.com Mon Jan  1 00:00:00 2024\n'
+        b'Subject: one\n\n'
+        b'>From the start\n'
+        b'>>From quoted once\n'
+        b' >From not quoted\n'
+        b'\n'
+        b'From b@example.com Mon Jan  1 00:00:01 2024\n'
+        b'Subject: two\n\n'
+        b'last line\n'
+        b'\n')
+
+
+class TestSources(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def deliver(self, spool, count):
+        ids = []
+        for n in range(count):
+            msg_id = spool.new_id()
+            with open(spool.delivery_path(msg_id), 'wb') as f:
+                f.write(data(n))
+            ids.append(msg_id)
+        return ids
+
+    def messages(self, source=None):
+        return [convert.read_message(*item)
+                for item in convert.iter_sources(source or self.dir)]
+
+    def test_flat_spool(self):
+        spool = Spool(self.dir)
+        ids = self.deliver(spool, 3)
+        with open(spool.envelope_path, 'wb') as f:
+            f.write(b'envelopes')
+        with open(os.path.join(spool.rcpt_dir, 'x'), 'wb') as f:
+            f.write(ids[0].encode('ascii'))
+        # A delivery in progress.
+        with open(spool.tmp_path(spool.new_id()), 'wb') as f:
+            f.write(b'Subject: partial\r\n')
+        items = list(convert.iter_sources(self.dir))
+        self.assertEqual([path for path, _, _ in items],
+                         sorted(spool.path(msg_id) for msg_id in ids))
+        self.assertEqual(sorted(self.messages()), [data(n) for n in range(3)])
+
+    def test_maildir(self):
+        spool = MaildirSpool(self.dir)
+        self.deliver(spool, 2)
+        os.rename(os.path.join(self.dir, 'new', os.listdir(
+            os.path.join(self.dir, 'new'))[0]),
+            os.path.join(self.dir, 'cur', 'seen:2,S'))
+        with open(os.path.join(self.dir, 'tmp', 'partial'), 'wb') as f:
+            f.write(b'Subject: partial\r\n')
+        self.assertEqual(sorted(self.messages()), [data(0), data(1)])
+
+    def test_mbox(self):
+        path = os.path.join(self.dir, 'mbox')
+        with open(path, 'wb') as f:
+            f.write(MBOX)
+        self.assertEqual(self.messages(path), [
+            b'Subject: one\n\n'
+            b'From the start\n'
+            b'>From quoted once\n'
+            b' >From not quoted\n',
+            b'Subject: two\n\n'
+            b'last line\n',
+        ])
+
+    def test_mbox_from_in_body(self):
+        # Only a From line after an empty line starts a message.
+        path = os.path.join(self.dir, 'mbox')
+        with open(path, 'wb') as f:
+            f.write(b'From a\r\nSubject: one\r\n\r\nbody\r\nFrom here\r\n')
+        self.assertEqual(self.messages(path),
+                         [b'Subject: one\r\n\r\nbody\r\nFrom here\r\n'])
+
+
+@unittest.skipIf(mailtojson is None, "chardet is not installed")
+class TestConvert(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.source = os.path.join(self.dir, 'mail')
+        os.mkdir(self.source)
+        for n in range(5):
+            with open(os.path.join(self.source, '%d.eml' % n), 'wb') as f:
+                f.write(data(n))
+        self.checkpoint = os.path.join(self.dir, 'checkpoint')
+
+    def run_convert(self, out, **kwargs):
+        result = convert.convert(self.source, out, jobs=1, **kwargs)
+        return result, out.getvalue().splitlines(True)
+
+    def test_convert(self):
+        (written, failed), lines = self.run_convert(io.BytesIO())
+        self.assertEqual((written, failed), (5, 0))
+        documents = [json.loads(line) for line in lines]
+        self.assertEqual([doc['index'] for doc in documents], list(range(5)))
+        self.assertEqual(documents[2]['mail']['parsed_headers']['subject'],
+                         'message 2')
+
+    def test_resume(self):
+        _, expected = self.run_convert(io.BytesIO())
+        # Interrupted after message 1 and again while writing message 2.
+        out = io.BytesIO(b''.join(expected[:2]) + expected[2][:10])
+        with open(self.checkpoint, 'w') as f:
+            json.dump({'done': 2, 'extra': [],
+                       'size': len(b''.join(expected[:2]))}, f)
+        (written, failed), lines = self.run_convert(
+            out, checkpoint=self.checkpoint, checkpoint_every=1)
+        self.assertEqual((written, failed), (3, 0))
+        self.assertEqual(lines, expected)
+        state = convert.Checkpoint(self.checkpoint)
+        self.assertEqual((state.done, state.extra, state.size),
+                         (5, set(), len(b''.join(expected))))
+
+    def test_resume_out_of_order(self):
+        _, expected = self.run_convert(io.BytesIO())
+        out = io.BytesIO(expected[0] + expected[3])
+        with open(self.checkpoint, 'w') as f:
+            json.dump({'done': 1, 'extra': [3], 'size': len(out.getvalue())},
+                      f)
+        (written, failed), lines = self.run_convert(
+            out, checkpoint=self.checkpoint)
+        self.assertEqual((written, failed), (3, 0))
+        self.assertEqual(sorted(lines), sorted(expected))
+        self.assertEqual(len(lines), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
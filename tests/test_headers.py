@@ -0,0 +1,117 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from mailholder import build_headers, headers
+from mailholder.headers import HeaderFilter
+
+
+CSV = ('Header Field Name,Template,Protocol,Status,Reference\n'
+       'Subject,,mail,standard,[RFC5322]\n'
+       'Subject,,netnews,standard,[RFC5536]\n'
+       'Subject,,mail,standard,[RFC5322]\n'
+       'Message-ID,,mail,standard,[RFC5322]\n'
+       ',,mail,,\n'
+       'Accept,,http,standard,[RFC7231]\n')
+
+
+class TestBuildHeaders(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.csv = os.path.join(self.dir, 'headers.csv')
+        with open(self.csv, 'w') as f:
+            f.write(CSV)
+        self.output = os.path.join(self.dir, 'registry.py')
+
+    def build(self, *args):
+        return subprocess.run(
+            [sys.executable, '-m', 'mailholder.build_headers'] + list(args),
+            cwd=build_headers.ROOT_DIR, capture_output=True, text=True)
+
+    def test_registry_up_to_date(self):
+        result = self.build('--check')
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+    def test_check(self):
+        args = ('--csv', self.csv, '--output', self.output)
+        result = self.build('--check', *args)
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn('out of date', result.stderr)
+        self.assertEqual(self.build(*args).returncode, 0)
+        self.assertEqual(self.build('--check', *args).returncode, 0)
+        with open(self.output, 'a') as f:
+            f.write('# edited\n')
+        self.assertNotEqual(self.build('--check', *args).returncode, 0)
+
+    def test_read_registry(self):
+        self.assertEqual(build_headers.read_registry(self.csv), {
+            'accept': ('Accept', (('http', 'standard'),)),
+            'message-id': ('Message-ID', (('mail', 'standard'),)),
+            'subject': ('Subject', (('mail', 'standard'),
+                                    ('netnews', 'standard'))),
+        })
+
+    def test_render(self):
+        namespace = {}
+        exec(build_headers.render(build_headers.read_registry(self.csv)),
+             namespace)
+        self.assertEqual(namespace['HEADERS']['message-id'].name,
+                         'Message-ID')
+        self.assertEqual(dict(namespace['BY_PROTOCOL']), {
+            'http': frozenset({'accept'}),
+            'mail': frozenset({'message-id', 'subject'}),
+            'netnews': frozenset({'subject'}),
+        })
+
+
+class TestLookup(unittest.TestCase):
+    def test_canonical(self):
+        self.assertEqual(headers.canonical('message-id'), 'Message-ID')
+        self.assertEqual(headers.canonical('MIME-VERSION'), 'MIME-Version')
+        self.assertEqual(headers.canonical('x-Unknown'), 'x-Unknown')
+
+    def test_lookup(self):
+        self.assertEqual(headers.lookup('SUBJECT').name, 'Subject')
+        self.assertIsNone(headers.lookup('X-Mailer'))
+
+    def test_is_registered(self):
+        self.assertTrue(headers.is_registered('Content-Type'))
+        self.assertFalse(headers.is_registered('X-Mailer'))
+        # Accept is an HTTP header, not a mail one.
+        self.assertFalse(headers.is_registered('Accept'))
+        self.assertTrue(headers.is_registered('Accept', ('http',)))
+
+
+class TestHeaderFilter(unittest.TestCase):
+    def test_empty(self):
+        header_filter = HeaderFilter()
+        self.assertFalse(header_filter)
+        self.assertTrue(header_filter.allows('x-unknown'))
+
+    def test_include(self):
+        header_filter = HeaderFilter(include=['Message-ID', 'X-Custom'])
+        self.assertTrue(header_filter)
+        self.assertTrue(header_filter.allows('message-id'))
+        self.assertTrue(header_filter.allows('x-custom'))
+        self.assertFalse(header_filter.allows('subject'))
+        self.assertFalse(header_filter.allows('x-unknown'))
+
+    def test_exclude(self):
+        header_filter = HeaderFilter(exclude=['RECEIVED', 'x-spam'])
+        self.assertTrue(header_filter)
+        self.assertFalse(header_filter.allows('received'))
+        self.assertFalse(header_filter.allows('x-spam'))
+        self.assertTrue(header_filter.allows('x-unknown'))
+
+    def test_exclude_wins(self):
+        header_filter = HeaderFilter(['Subject', 'To'], ['subject'])
+        self.assertFalse(header_filter.allows('subject'))
+        self.assertTrue(header_filter.allows('to'))
+
+
+if __name__ == '__main__':
+    unittest.main()
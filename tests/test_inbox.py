@@ -0,0 +1,309 @@
+import email
+import io
+import mailbox
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    from twisted.mail import imap4
+    from mailholder import inbox
+except ImportError:
+    inbox = None
+
+
+def message(n):
+    return io.BytesIO(
+        b'From: sender%d@example.com\r\nTo: rcpt@example.com\r\n'
+        b'Subject: message %d\r\n\r\nbody %d\r\n' % (n, n, n))
+
+
+@unittest.skipIf(inbox is None, "twisted is not installed")
+class MailboxTestCase(unittest.TestCase):
+    def setUp(self):
+        self.mailbox = inbox.MemoryIMAPMailbox()
+
+    def add(self, count, flags=()):
+        for n in range(count):
+            self.mailbox.addMessage(message(n), list(flags))
+
+    def fetch(self, ids, uid):
+        return [(seq, msg.uid) for seq, msg
+                in self.mailbox.fetch(imap4.parseIdList(ids), uid)]
+
+
+class TestUIDIndex(MailboxTestCase):
+    def setUp(self):
+        super(TestUIDIndex, self).setUp()
+        self.add(5)
+        # Leave a gap in the UIDs: 1, 2, 4, 5.
+        self.mailbox._set_flags(self.mailbox.msgs[2], {inbox.DELETED})
+        self.mailbox.expunge()
+
+    def test_uids(self):
+        self.assertEqual(self.mailbox.uids, [1, 2, 4, 5])
+        self.assertEqual(self.mailbox.getUID(3), 4)
+        self.assertEqual(self.mailbox.getUIDNext(), 6)
+        self.assertEqual(self.mailbox.next_uid(), 6)
+
+    def test_fetch_by_sequence(self):
+        self.assertEqual(self.fetch(b'2:3', False), [(2, 2), (3, 4)])
+        self.assertEqual(self.fetch(b'3:*', False), [(3, 4), (4, 5)])
+        self.assertEqual(self.fetch(b'9', False), [])
+
+    def test_fetch_by_uid(self):
+        # Missing UIDs are skipped and sequence numbers follow the gap.
+        self.assertEqual(self.fetch(b'2:4', True), [(2, 2), (3, 4)])
+        self.assertEqual(self.fetch(b'3', True), [])
+        self.assertEqual(self.fetch(b'5:*', True), [(4, 5)])
+        self.assertEqual(self.fetch(b'1,5', True), [(1, 1), (4, 5)])
+
+    def test_store_by_uid(self):
+        result = self.mailbox.store(imap4.parseIdList(b'4'), [inbox.SEEN],
+                                    1, True)
+        self.assertEqual(list(result), [3])
+        self.assertEqual(self.mailbox.by_uid[4].flags, {inbox.SEEN})
+        self.assertEqual(self.mailbox.by_uid[5].flags, set())
+
+    def test_empty(self):
+        empty = inbox.MemoryIMAPMailbox()
+        self.assertEqual(empty.fetch(imap4.parseIdList(b'1:*'), True), [])
+
+
+class TestFlagIndex(MailboxTestCase):
+    def setUp(self):
+        super(TestFlagIndex, self).setUp()
+        self.add(4, [inbox.RECENT, inbox.UNSEEN])
+
+    def store(self, ids, flags, mode):
+        return self.mailbox.store(imap4.parseIdList(ids), flags, mode, True)
+
+    def test_counts(self):
+        self.assertEqual(self.mailbox.getRecentCount(), 4)
+        self.assertEqual(self.mailbox.getUnseenCount(), 4)
+        self.store(b'1:2', [inbox.UNSEEN, inbox.RECENT], -1)
+        self.assertEqual(self.mailbox.getRecentCount(), 2)
+        self.assertEqual(self.mailbox.getUnseenCount(), 2)
+        self.store(b'3', [inbox.SEEN], 0)
+        self.assertEqual(self.mailbox.getRecentCount(), 1)
+        self.assertEqual(self.mailbox.getUnseenCount(), 1)
+
+    def test_index_matches_flags(self):
+        self.store(b'1,3', [inbox.FLAGGED], 1)
+        self.store(b'3:4', [inbox.SEEN], 0)
+        index = dict((flag, uids) for flag, uids
+                     in self.mailbox.flag_index.items())
+        expected = {}
+        for msg in self.mailbox.msgs:
+            for flag in msg.flags:
+                expected.setdefault(flag, set()).add(msg.uid)
+        self.assertEqual(index, expected)
+
+    def test_expunge_unindexes(self):
+        self.store(b'2', [inbox.DELETED], 1)
+        self.mailbox.expunge()
+        self.assertNotIn(inbox.DELETED, self.mailbox.flag_index)
+        self.assertEqual(self.mailbox.flag_index[inbox.RECENT], {1, 3, 4})
+        self.assertEqual(self.mailbox.getRecentCount(), 3)
+
+
+class TestSearch(MailboxTestCase):
+    def setUp(self):
+        super(TestSearch, self).setUp()
+        self.add(5)
+        self.mailbox.store(imap4.parseIdList(b'2,4'), [inbox.SEEN], 1, True)
+        self.mailbox.store(imap4.parseIdList(b'4:5'), [inbox.FLAGGED, '$Work'],
+                           1, True)
+        # UIDs 1, 3, 4, 5 at sequence numbers 1 to 4.
+        self.mailbox.store(imap4.parseIdList(b'2'), [inbox.DELETED], 1, True)
+        self.mailbox.expunge()
+
+    def search(self, *query, **kwargs):
+        return self.mailbox.search(list(query), kwargs.get('uid', True))
+
+    def test_flags(self):
+        self.assertEqual(self.search('ALL'), [1, 3, 4, 5])
+        self.assertEqual(self.search('SEEN'), [4])
+        self.assertEqual(self.search(b'unseen'), [1, 3, 5])
+        self.assertEqual(self.search('FLAGGED', 'UNSEEN'), [5])
+        self.assertEqual(self.search('KEYWORD', '$Work'), [4, 5])
+        self.assertEqual(self.search('UNKEYWORD', '$Work'), [1, 3])
+        self.assertEqual(self.search('UNDELETED'), [1, 3, 4, 5])
+
+    def test_sequence_numbers(self):
+        self.assertEqual(self.search('FLAGGED', uid=False), [3, 4])
+        self.assertEqual(self.search('2:3', uid=False), [2, 3])
+        self.assertEqual(self.search('2:3'), [3, 4])
+        self.assertEqual(self.search('UID', '3:*'), [3, 4, 5])
+
+    def test_not_or_and_lists(self):
+        self.assertEqual(self.search('NOT', 'SEEN'), [1, 3, 5])
+        self.assertEqual(self.search('OR', 'SEEN', 'UID', '1'), [1, 4])
+        self.assertEqual(self.search(['FLAGGED', 'SEEN']), [4])
+        self.assertEqual(self.search('NOT', ['FLAGGED', 'SEEN']), [1, 3, 5])
+
+    def test_headers_body_and_size(self):
+        self.assertEqual(self.search('FROM', 'SENDER3'), [4])
+        self.assertEqual(self.search('SUBJECT', b'message'), [1, 3, 4, 5])
+        self.assertEqual(self.search('HEADER', 'To', 'rcpt'), [1, 3, 4, 5])
+        self.assertEqual(self.search('BODY', 'body 2'), [3])
+        self.assertEqual(self.search('TEXT', 'sender4'), [5])
+        size = self.mailbox.by_uid[1].getSize()
+        self.assertEqual(self.search('LARGER', str(size)), [])
+        self.assertEqual(self.search('SMALLER', str(size + 1)), [1, 3, 4, 5])
+
+    def test_dates(self):
+        self.assertEqual(self.search('SINCE', '1-Jan-2000'), [1, 3, 4, 5])
+        self.assertEqual(self.search('BEFORE', '1-Jan-2000'), [])
+        self.assertRaises(imap4.IllegalQueryError, self.search,
+                          'SINCE', 'yesterday')
+
+    def test_unsupported(self):
+        self.assertRaises(imap4.IllegalQueryError, self.search, 'FUZZY')
+
+
+class TestExpunge(MailboxTestCase):
+    def delete(self, ids):
+        self.mailbox.store(imap4.parseIdList(ids), [inbox.DELETED], 1, False)
+
+    def subjects(self):
+        return [str(msg.headers['Subject']) for msg in self.mailbox.msgs]
+
+    def test_sequence_numbers(self):
+        self.add(10)
+        self.delete(b'2:3,5,10')
+        # Each number counts the messages expunged before it.
+        self.assertEqual(self.mailbox.expunge(), [2, 2, 3, 7])
+        self.assertEqual(self.mailbox.uids, [1, 4, 6, 7, 8, 9])
+        self.assertEqual(sorted(self.mailbox.by_uid), [1, 4, 6, 7, 8, 9])
+        self.assertEqual(self.fetch(b'2:3', False), [(2, 4), (3, 6)])
+
+    def test_nothing_deleted(self):
+        self.add(3)
+        self.assertEqual(self.mailbox.expunge(), [])
+        self.assertEqual(self.mailbox.uids, [1, 2, 3])
+
+    def test_all_deleted(self):
+        self.add(3)
+        self.delete(b'1:*')
+        self.assertEqual(self.mailbox.expunge(), [1, 1, 1])
+        self.assertEqual(self.mailbox.msgs, [])
+        self.assertEqual(self.mailbox.fetch(imap4.parseIdList(b'1:*'), True),
+                         [])
+
+    def test_compact_mbox(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        path = os.path.join(tmp, 'mbox')
+        self.mailbox.setFile(path)
+        self.add(6)
+        self.delete(b'2,4:5')
+        self.assertEqual(self.mailbox.expunge(), [2, 3, 3])
+        self.assertEqual(self.subjects(),
+                         ['message 0', 'message 2', 'message 5'])
+        mbox = self.mailbox.mbox
+        # The table of contents still points at the right messages ...
+        self.assertEqual(
+            [email.message_from_bytes(mbox.get_bytes(
+                self.mailbox.mbox_keys[uid]))['Subject']
+             for uid in self.mailbox.uids],
+            ['message 0', 'message 2', 'message 5'])
+        # ... and so does the file once read afresh.
+        self.assertEqual([msg['Subject'] for msg in mailbox.mbox(path)],
+                         ['message 0', 'message 2', 'message 5'])
+        self.add(1)
+        self.assertEqual([msg['Subject'] for msg in mailbox.mbox(path)],
+                         ['message 0', 'message 2', 'message 5',
+                          'message 0'])
+
+
+class TestJournalMailbox(MailboxTestCase):
+    compact = False
+
+    def setUp(self):
+        super(TestJournalMailbox, self).setUp()
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        self.path = os.path.join(tmp, 'journal')
+        self.open()
+
+    def open(self):
+        self.mailbox = inbox.MemoryIMAPMailbox()
+        self.mailbox.setFile(self.path, journal=True, compact=self.compact)
+        self.addCleanup(self.mailbox.close)
+
+    def store(self, ids, flags):
+        self.mailbox.store(imap4.parseIdList(ids), flags, 1, True)
+
+    def contents(self):
+        return [(msg.uid, msg.raw.read(), sorted(msg.flags))
+                for msg in self.mailbox.msgs]
+
+    def test_reopen(self):
+        self.add(3)
+        self.store(b'2', [inbox.SEEN])
+        self.store(b'1', [inbox.DELETED])
+        self.mailbox.expunge()
+        expected = self.contents()
+        uidvalidity = self.mailbox.getUIDValidity()
+        self.mailbox.close()
+        self.open()
+        self.assertEqual(self.contents(), expected)
+        self.assertEqual(self.mailbox.getUIDValidity(), uidvalidity)
+        self.assertEqual(self.mailbox.getUIDNext(), 4)
+        self.assertEqual(self.mailbox.flag_index[inbox.SEEN], {2})
+
+    def test_changes_are_flushed(self):
+        self.add(2)
+        self.store(b'1', [inbox.SEEN])
+        with open(self.path, 'rb') as f:
+            self.assertIn(b'\nF ', f.read())
+
+    def test_compaction(self):
+        self.add(4)
+        self.store(b'3', [inbox.FLAGGED])
+        self.store(b'1:2', [inbox.DELETED])
+        journal = self.mailbox.journal
+        journal.compact_min_bytes = journal.compact_ratio = 0
+        size = os.path.getsize(self.path)
+        self.assertEqual(self.mailbox.expunge(), [1, 1])
+        self.assertEqual(journal.dead, 0)
+        self.assertLess(os.path.getsize(self.path), size)
+        self.assertEqual(self.contents(), [
+            (3, message(2).read(), [inbox.FLAGGED]),
+            (4, message(3).read(), [])])
+        self.assertEqual(self.mailbox.search(['BODY', 'body 3'], True), [4])
+        self.add(1)
+        expected = self.contents()
+        self.mailbox.close()
+        self.open()
+        self.assertEqual(self.contents(), expected)
+        self.assertEqual(self.mailbox.getUIDNext(), 6)
+
+
+class TestCompactJournalMailbox(TestJournalMailbox):
+    compact = True
+
+    def test_message_objects(self):
+        self.add(2)
+        self.assertIsInstance(self.mailbox.msgs[0], inbox.CompactMessage)
+        self.assertEqual(self.mailbox.msgs[1].msg['Subject'], 'message 1')
+
+    def test_bounded_cache(self):
+        self.add(5)
+        size = self.mailbox.msgs[0].getSize()
+        self.mailbox.bodies.cache.max_bytes = 2 * size
+        for msg in self.mailbox.msgs:
+            self.assertEqual(msg.msg['Subject'],
+                             str(msg.headers['Subject']))
+        cache = self.mailbox.bodies.cache
+        self.assertEqual(len(cache), 2)
+        self.assertLessEqual(cache.size, 2 * size)
+        self.store(b'5', [inbox.DELETED])
+        self.mailbox.expunge()
+        self.assertEqual(len(cache), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
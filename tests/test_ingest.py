@@ -0,0 +1,46 @@
+import io
+import unittest
+
+from mailholder.ingest import MessageSink
+
+
+MESSAGE = (b'From: a@example.com\r\nTo: b@example.com\r\nSubject: hi\r\n'
+           b'\r\nfirst line\r\nsecond line\r\n')
+
+
+class TestMessageSink(unittest.TestCase):
+    def feed(self, data, size):
+        sink = MessageSink(io.BytesIO())
+        for i in range(0, len(data), size):
+            sink.feed(data[i:i + size])
+        return sink
+
+    def test_headers_only(self):
+        sink = self.feed(MESSAGE, 1000)
+        msg = sink.close()
+        self.assertEqual(msg['Subject'], 'hi')
+        self.assertFalse(msg.get_payload())
+        self.assertEqual(sink.size, len(MESSAGE))
+        self.assertEqual(sink.header_size, MESSAGE.index(b'\r\n\r\n') + 4)
+
+    def test_raw_message_keeps_body(self):
+        # Chunk sizes that split the blank line between headers and body.
+        for size in (1, 2, 3, 7, len(MESSAGE)):
+            raw = self.feed(MESSAGE, size).raw_message()
+            self.assertEqual(raw.headers['Subject'], 'hi', size)
+            self.assertEqual(raw.read_body(),
+                             b'first line\r\nsecond line\r\n', size)
+            self.assertEqual(raw.read(), MESSAGE, size)
+
+    def test_without_headers(self):
+        raw = self.feed(b'\r\nbody only\r\n', 4).raw_message()
+        self.assertEqual(raw.read_body(), b'body only\r\n')
+
+    def test_abort_closes(self):
+        sink = self.feed(MESSAGE, 10)
+        sink.abort()
+        self.assertTrue(sink.fp.closed)
+
+
+if __name__ == '__main__':
+    unittest.main()
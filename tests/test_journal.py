@@ -0,0 +1,170 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from mailholder.journal import Journal
+
+
+def data(n):
+    return b'Subject: message %d\r\n\r\nbody %d\r\n' % (n, n)
+
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = os.path.join(self.dir, 'journal')
+
+    def open(self, **kwargs):
+        journal = Journal(self.path, **kwargs)
+        journal.open(1234)
+        self.addCleanup(journal.close)
+        return journal
+
+    def fill(self, journal, count):
+        for n in range(1, count + 1):
+            journal.add(n, [], 'date %d' % n, data(n))
+        journal.flush()
+
+    def state(self, journal):
+        fp = journal.map()
+        try:
+            return dict((uid, (journal.message(fp, uid).read(), entry.flags,
+                               entry.date))
+                        for uid, entry in journal.messages.items())
+        finally:
+            fp.close()
+
+    def reopen(self, journal, **kwargs):
+        # Simulate a crash: nothing is checkpointed on the way out.
+        journal.file.close()
+        journal.file = None
+        return self.open(**kwargs)
+
+    def test_replay(self):
+        journal = self.open()
+        self.fill(journal, 3)
+        journal.set_flags(2, {'\\Seen', '\\Flagged'})
+        journal.expunge([1])
+        journal.flush()
+        expected = self.state(journal)
+        journal = self.reopen(journal)
+        self.assertEqual(journal.uidvalidity, 1234)
+        self.assertEqual(journal.last_uid, 3)
+        self.assertEqual(list(journal.messages), [2, 3])
+        self.assertEqual(self.state(journal), expected)
+        self.assertEqual(journal.messages[2].flags, ['\\Flagged', '\\Seen'])
+
+    def test_torn_record(self):
+        journal = self.open()
+        self.fill(journal, 2)
+        length = os.path.getsize(self.path)
+        journal.add(3, [], 'date 3', data(3))
+        journal.flush()
+        # Cut the last record short, as a crash mid-write would.
+        with open(self.path, 'r+b') as f:
+            f.truncate(os.path.getsize(self.path) - 5)
+        journal = self.reopen(journal)
+        self.assertEqual(list(journal.messages), [1, 2])
+        self.assertEqual(os.path.getsize(self.path), length)
+        # New records follow the last complete one.
+        journal.add(3, [], 'date 3', data(3))
+        journal = self.reopen(journal)
+        self.assertEqual(list(journal.messages), [1, 2, 3])
+        self.assertEqual(self.state(journal)[3][0], data(3))
+
+    def test_torn_header(self):
+        journal = self.open()
+        self.fill(journal, 1)
+        with open(self.path, 'ab') as f:
+            f.write(b'M 12')
+        journal = self.reopen(journal)
+        self.assertEqual(list(journal.messages), [1])
+
+    def test_checkpoint(self):
+        journal = self.open(checkpoint_every=2)
+        self.fill(journal, 4)
+        journal.set_flags(4, {'\\Seen'})
+        journal.flush()
+        self.assertTrue(os.path.exists(journal.checkpoint_path))
+        expected = self.state(journal)
+        journal = self.reopen(journal)
+        self.assertEqual(self.state(journal), expected)
+
+    def test_stale_checkpoint(self):
+        journal = self.open()
+        self.fill(journal, 2)
+        journal.close()
+        # A checkpoint past the end of the journal is ignored.
+        with open(self.path, 'r+b') as f:
+            f.truncate(10)
+        journal = self.open()
+        self.assertEqual(list(journal.messages), [])
+        self.assertEqual(journal.uidvalidity, 1234)
+
+    def test_dead_bytes(self):
+        journal = self.open()
+        self.fill(journal, 3)
+        self.assertEqual(journal.dead, 0)
+        journal.set_flags(1, {'\\Seen'})
+        journal.expunge([2])
+        journal.flush()
+        dead = journal.dead
+        self.assertGreater(dead, len(data(2)))
+        journal = self.reopen(journal)
+        self.assertEqual(journal.dead, dead)
+        journal.close()
+        journal = self.open()
+        self.assertEqual(journal.dead, dead)
+
+    def test_wants_compaction(self):
+        journal = self.open(compact_min_bytes=100, compact_ratio=0.3)
+        self.fill(journal, 4)
+        self.assertFalse(journal.wants_compaction)
+        journal.expunge([1, 2])
+        self.assertFalse(journal.wants_compaction)
+        journal.expunge([3])
+        self.assertTrue(journal.wants_compaction)
+
+    def test_compact(self):
+        journal = self.open()
+        self.fill(journal, 4)
+        journal.set_flags(3, {'\\Seen'})
+        journal.expunge([1, 4])
+        expected = self.state(journal)
+        size = os.path.getsize(self.path)
+        journal.compact()
+        self.assertEqual(journal.dead, 0)
+        self.assertLess(os.path.getsize(self.path), size)
+        self.assertEqual(self.state(journal), expected)
+        self.assertEqual(list(journal.messages), [2, 3])
+        journal.add(5, [], 'date 5', data(5))
+        journal.flush()
+        expected = self.state(journal)
+        journal = self.reopen(journal)
+        self.assertEqual(self.state(journal), expected)
+        self.assertEqual(journal.last_uid, 5)
+        # Without the checkpoint the compacted file replays the same.
+        journal.file.close()
+        journal.file = None
+        os.unlink(journal.checkpoint_path)
+        journal = self.open()
+        self.assertEqual(self.state(journal), expected)
+        self.assertEqual(journal.last_uid, 5)
+
+    def test_compact_keeps_last_uid(self):
+        journal = self.open()
+        self.fill(journal, 3)
+        journal.expunge([3])
+        journal.compact()
+        journal.file.close()
+        journal.file = None
+        os.unlink(journal.checkpoint_path)
+        journal = self.open()
+        self.assertEqual(list(journal.messages), [1, 2])
+        self.assertEqual(journal.last_uid, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
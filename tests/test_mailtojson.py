@@ -0,0 +1,162 @@
+import base64
+import email
+import glob
+import io
+import json
+import os
+import unittest
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from unittest import mock
+
+try:
+    from mailholder import mailtojson
+except ImportError:
+    mailtojson = None
+
+
+EML_DIR = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'eml_files')
+
+
+def sample_messages():
+    """The sample .eml files plus one with an odd-sized attachment."""
+    messages = []
+    for path in sorted(glob.glob(os.path.join(EML_DIR, '*.eml'))):
+        with open(path, 'rb') as f:
+            messages.append(f.read())
+    outer = MIMEMultipart()
+    outer['Subject'] = 'attachment'
+    outer.attach(MIMEText('héllo wörld', 'plain', 'utf-8'))
+    attachment = MIMEApplication(bytes(range(256)) * 40 + b'xy')
+    attachment.add_header('Content-Disposition', 'attachment',
+                          filename='data.bin')
+    outer.attach(attachment)
+    messages.append(outer.as_bytes())
+    return messages
+
+
+@unittest.skipIf(mailtojson is None, "chardet is not installed")
+class TestToText(unittest.TestCase):
+    def setUp(self):
+        mailtojson.to_text.cache_clear()
+        patcher = mock.patch.object(mailtojson.chardet, 'detect',
+                                    return_value={'encoding': 'koi8-r'})
+        self.detect = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_str(self):
+        self.assertEqual(mailtojson.to_text('caf\xe9'), 'caf\xe9')
+
+    def test_ascii(self):
+        self.assertEqual(mailtojson.to_text(b'plain', 'x-unknown'), 'plain')
+        self.detect.assert_not_called()
+
+    def test_declared_charset(self):
+        self.assertEqual(mailtojson.to_text(b'caf\xe9', 'iso-8859-1'),
+                         'caf\xe9')
+        self.assertEqual(mailtojson.to_text(b'na\xc3\xafve', 'x-unknown'),
+                         'na\xefve')
+        self.detect.assert_not_called()
+
+    def test_detected_charset(self):
+        self.assertEqual(mailtojson.to_text(b'\xf0\xd2\xc9\xd7\xc5\xd4'),
+                         'Привет')
+        self.detect.assert_called_once_with(b'\xf0\xd2\xc9\xd7\xc5\xd4')
+
+    def test_cached(self):
+        for _ in range(3):
+            mailtojson.to_text(b'\xf0\xd2\xc9\xd7\xc5\xd4')
+        self.assertEqual(self.detect.call_count, 1)
+        self.assertEqual(mailtojson.to_text.cache_info().hits, 2)
+
+
+@unittest.skipIf(mailtojson is None, "chardet is not installed")
+class TestDecodeValue(unittest.TestCase):
+    def test_ascii(self):
+        self.assertEqual(mailtojson.decode_value(b' \tplain\t ', None),
+                         b'plain')
+
+    def test_charset(self):
+        self.assertEqual(mailtojson.decode_value(b'caf\xe9', 'ISO-8859-1'),
+                         b'caf\xe9')
+
+    def test_unencodable(self):
+        # Text the declared charset cannot hold comes back as UTF-8.
+        self.assertEqual(mailtojson.decode_value(b'na\xc3\xafve', 'ascii'),
+                         b'na\xc3\xafve')
+        self.assertEqual(mailtojson.decode_value(b'na\xc3\xafve', 'x-bogus'),
+                         b'na\xc3\xafve')
+
+
+@unittest.skipIf(mailtojson is None, "chardet is not installed")
+class TestHeaders(unittest.TestCase):
+    def test_values_kept_as_str(self):
+        mail = mailtojson.MailJson.from_bytes(
+            b'Subject: =?utf-8?q?caf=C3=A9?=\r\n'
+            b'X-Tag: one\r\nX-Tag: two\r\n\r\nbody\r\n')
+        self.assertEqual(mail.json_data['headers'], {
+            'subject': '=?utf-8?q?caf=C3=A9?=',
+            'x-tag': ['one', 'two'],
+        })
+
+    def test_filter(self):
+        data = (b'Message-Id: <1@example.com>\r\nSUBJECT: hi\r\n'
+                b'X-Unknown: 1\r\nReceived: a\r\n\r\nbody\r\n')
+        mail = mailtojson.MailJson.from_bytes(
+            data, include_headers=['MESSAGE-ID', 'Subject', 'X-Unknown'],
+            exclude_headers=['x-unknown'])
+        self.assertEqual(mail.json_data['headers'], {
+            'message-id': '<1@example.com>', 'subject': 'hi'})
+        mail = mailtojson.MailJson.from_bytes(data,
+                                              exclude_headers=['RECEIVED'])
+        self.assertEqual(list(mail.json_data['headers']),
+                         ['message-id', 'subject', 'x-unknown'])
+        self.assertEqual(mail.nonstandard_headers(), ['x-unknown'])
+
+
+@unittest.skipIf(mailtojson is None, "chardet is not installed")
+class TestDump(unittest.TestCase):
+    def dumped(self, mail, **kwargs):
+        out = io.StringIO()
+        mail.dump(out, **kwargs)
+        return out.getvalue()
+
+    def test_matches_to_json(self):
+        for data in sample_messages():
+            for mail in (mailtojson.MailJson.from_bytes(data),
+                         mailtojson.MailJson(email.message_from_bytes(data))):
+                expected = json.dumps(mail.to_json())
+                self.assertEqual(self.dumped(mail), expected)
+                # Small chunks split every attachment into several.
+                self.assertEqual(self.dumped(mail, chunk_size=1000),
+                                 expected)
+
+    def test_attachments_chunked(self):
+        mail = mailtojson.MailJson.from_bytes(sample_messages()[-1])
+        out = io.StringIO()
+        with mock.patch.object(out, 'write', wraps=out.write) as write:
+            mail.dump(out, chunk_size=1000)
+        written = [call.args[0] for call in write.call_args_list]
+        # 999 decoded bytes per piece, even though the source is one chunk.
+        start = written.index('"content": "') + 1
+        pieces = written[start:written.index('"}', start)]
+        self.assertGreater(len(pieces), 1)
+        self.assertEqual(max(len(piece) for piece in pieces), 1332)
+        content = json.loads(out.getvalue())['attachments']['file1']
+        self.assertEqual(base64.b64decode(content['content']),
+                         bytes(range(256)) * 40 + b'xy')
+
+    def test_base64_chunks(self):
+        data = bytes(range(256)) * 10
+        pieces = [data[i:i + 100] for i in range(0, len(data), 100)]
+        encoded = list(mailtojson._base64_chunks(pieces, 999))
+        self.assertEqual([len(piece) for piece in encoded],
+                         [1332, 1332, 752])
+        self.assertEqual(''.join(encoded),
+                         base64.b64encode(data).decode('ascii'))
+
+
+if __name__ == '__main__':
+    unittest.main()
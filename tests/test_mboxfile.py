@@ -0,0 +1,91 @@
+import mailbox
+import os
+import shutil
+import tempfile
+import unittest
+
+from mailholder.mboxfile import MboxFile
+
+
+def data(n):
+    return b'Subject: message %d\r\n\r\nbody %d\r\nFrom me\r\n' % (n, n)
+
+
+class TestMboxFile(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = os.path.join(self.dir, 'mbox')
+
+    def open(self):
+        mbox = MboxFile(self.path)
+        self.addCleanup(mbox.close)
+        return mbox
+
+    def subjects(self):
+        return [msg['Subject'] for msg in mailbox.mbox(self.path)]
+
+    def test_add(self):
+        mbox = self.open()
+        keys = [mbox.add(data(n)) for n in range(3)]
+        mbox.flush()
+        self.assertEqual([mbox.get_bytes(key) for key in keys],
+                         [data(n) for n in range(3)])
+        self.assertEqual(self.subjects(),
+                         ['message 0', 'message 1', 'message 2'])
+        # The body line is quoted so it does not start a message.
+        with open(self.path, 'rb') as f:
+            self.assertIn(b'\n>From me\r\n', f.read())
+
+    def test_quoted_from(self):
+        mbox = self.open()
+        message = b'Subject: q\n\n>From quoted\n>>From twice\n'
+        key = mbox.add(message)
+        self.assertEqual(mbox.get_bytes(key), message)
+
+    def test_existing_file(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'From a\nSubject: old\n\nno empty line after')
+        mbox = self.open()
+        key = mbox.add(data(1))
+        mbox.flush()
+        self.assertEqual(mbox.get_bytes(key), data(1))
+        self.assertEqual(self.subjects(), ['old', 'message 1'])
+
+    def test_remove(self):
+        mbox = self.open()
+        keys = [mbox.add(data(n)) for n in range(6)]
+        size = os.path.getsize(self.path)
+        mbox.remove([keys[1], keys[3], keys[4], 'unknown'])
+        self.assertLess(os.path.getsize(self.path), size)
+        self.assertEqual(sorted(mbox.toc), [keys[0], keys[2], keys[5]])
+        for n in (0, 2, 5):
+            self.assertEqual(mbox.get_bytes(keys[n]), data(n))
+        self.assertEqual(self.subjects(),
+                         ['message 0', 'message 2', 'message 5'])
+        key = mbox.add(data(6))
+        mbox.remove([keys[5]])
+        self.assertEqual(mbox.get_bytes(key), data(6))
+        self.assertEqual(self.subjects(),
+                         ['message 0', 'message 2', 'message 6'])
+
+    def test_remove_all(self):
+        mbox = self.open()
+        keys = [mbox.add(data(n)) for n in range(2)]
+        mbox.remove(keys)
+        self.assertEqual(os.path.getsize(self.path), 0)
+        mbox.add(data(2))
+        mbox.flush()
+        self.assertEqual(self.subjects(), ['message 2'])
+
+    def test_remove_keeps_earlier_data(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'From a\nSubject: old\n\n')
+        mbox = self.open()
+        keys = [mbox.add(data(n)) for n in range(2)]
+        mbox.remove(keys[:1])
+        self.assertEqual(self.subjects(), ['old', 'message 1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
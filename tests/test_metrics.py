@@ -0,0 +1,97 @@
+import asyncio
+import unittest
+
+from mailholder import metrics
+
+
+class TestRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = metrics.Registry()
+
+    def test_same_metric_twice(self):
+        counter = self.registry.counter('c_total', 'A counter.', {'a': '1'})
+        self.assertIs(self.registry.counter('c_total', 'A counter.',
+                                            {'a': '1'}), counter)
+        self.assertIsNot(self.registry.counter('c_total', 'A counter.',
+                                               {'a': '2'}), counter)
+        self.assertRaises(ValueError, self.registry.gauge, 'c_total', 'x')
+
+    def test_render(self):
+        self.registry.counter('requests_total', 'Requests.',
+                              {'code': '200'}).inc(3)
+        self.registry.counter('requests_total', 'Requests.',
+                              {'code': '500'}).inc()
+        gauge = self.registry.gauge('depth', 'Queue depth.')
+        gauge.inc(5)
+        gauge.dec(2)
+        self.registry.gauge('size', 'Read on demand.', function=lambda: 1.5)
+        self.assertEqual(self.registry.render(), (
+            '# HELP depth Queue depth.\n'
+            '# TYPE depth gauge\n'
+            'depth 3\n'
+            '# HELP requests_total Requests.\n'
+            '# TYPE requests_total counter\n'
+            'requests_total{code="200"} 3\n'
+            'requests_total{code="500"} 1\n'
+            '# HELP size Read on demand.\n'
+            '# TYPE size gauge\n'
+            'size 1.5\n'))
+
+    def test_label_escaping(self):
+        self.registry.counter('c_total', 'A counter.',
+                              {'path': 'a"b\\c'}).inc()
+        self.assertIn('c_total{path="a\\"b\\\\c"} 1\n',
+                      self.registry.render())
+
+    def test_histogram_buckets(self):
+        histogram = self.registry.histogram('latency_seconds', 'Latency.',
+                                            {'stage': 'x'},
+                                            buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value)
+        lines = self.registry.render().splitlines()[2:]
+        # Buckets are cumulative and a bound includes values equal to it.
+        self.assertEqual(lines, [
+            'latency_seconds_bucket{stage="x",le="0.1"} 2',
+            'latency_seconds_bucket{stage="x",le="1.0"} 3',
+            'latency_seconds_bucket{stage="x",le="+Inf"} 4',
+            'latency_seconds_sum{stage="x"} 2.65',
+            'latency_seconds_count{stage="x"} 4',
+        ])
+
+    def test_timer(self):
+        histogram = self.registry.histogram('t_seconds', 'Timed.')
+        with histogram.time():
+            pass
+        self.assertEqual(histogram.count, 1)
+        self.assertEqual(histogram.counts[0], 1)
+
+
+class TestServeMetrics(unittest.IsolatedAsyncioTestCase):
+    async def get(self, path):
+        registry = metrics.Registry()
+        registry.counter('hits_total', 'Hits.').inc(2)
+        server = await metrics.serve_metrics('127.0.0.1', 0, registry)
+        self.addAsyncCleanup(server.wait_closed)
+        self.addCleanup(server.close)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(b'GET ' + path + b' HTTP/1.0\r\n\r\n')
+        response = await reader.read()
+        writer.close()
+        return response
+
+    async def test_metrics(self):
+        response = await self.get(b'/metrics?x=1')
+        head, body = response.split(b'\r\n\r\n', 1)
+        self.assertTrue(head.startswith(b'HTTP/1.0 200 OK'))
+        self.assertIn(metrics.CONTENT_TYPE.encode('ascii'), head)
+        self.assertIn(b'\nhits_total 2\n', body)
+
+    async def test_not_found(self):
+        response = await self.get(b'/other')
+        self.assertTrue(response.startswith(b'HTTP/1.0 404'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+
+from mailholder import metrics
+from mailholder.msgcache import MessageCache, content_key
+
+
+def message(number):
+    return b'Subject: %d\r\n\r\nbody\r\n' % number
+
+
+def sample(name, cache):
+    return metrics.REGISTRY.counter(name, '', {'cache': cache}).value
+
+
+class TestMessageCache(unittest.TestCase):
+    def test_parse_once(self):
+        cache = MessageCache(name='test-parse')
+        data = message(1)
+        first = cache.parse(data)
+        self.assertIs(cache.parse(data), first)
+        self.assertEqual(first['Subject'], '1')
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_lru_bounded_by_bytes(self):
+        size = len(message(0))
+        cache = MessageCache(max_bytes=size * 2, name='test-lru')
+        for number in range(3):
+            cache.parse(message(number))
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.size, size * 2)
+        self.assertEqual(cache.evictions, 1)
+        self.assertIsNone(cache.get(content_key(message(0))))
+        self.assertIsNotNone(cache.get(content_key(message(2))))
+
+    def test_oversized_message_not_cached(self):
+        cache = MessageCache(max_bytes=4, name='test-oversized')
+        cache.parse(message(1))
+        self.assertEqual(len(cache), 0)
+
+    def test_counters(self):
+        before = [sample('mailholder_message_cache_{}_total'.format(kind),
+                         'test-counters')
+                  for kind in ('hits', 'misses', 'evictions')]
+        cache = MessageCache(max_bytes=len(message(0)),
+                             name='test-counters')
+        cache.parse(message(1))
+        cache.parse(message(1))
+        cache.parse(message(2))
+        after = [sample('mailholder_message_cache_{}_total'.format(kind),
+                        'test-counters')
+                 for kind in ('hits', 'misses', 'evictions')]
+        self.assertEqual([b - a for a, b in zip(before, after)], [1, 2, 1])
+        text = metrics.REGISTRY.render()
+        self.assertIn('# TYPE mailholder_message_cache_hits_total counter',
+                      text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import io
+import unittest
+from unittest import mock
+
+from mailholder.rawmessage import RawMessage
+from mailholder.smtpserver import Envelope
+
+try:
+    from mailholder import parsemail
+except ImportError:
+    parsemail = None
+
+
+@unittest.skipIf(parsemail is None, "django is not installed")
+class TestLocalHandler(unittest.IsolatedAsyncioTestCase):
+    async def handle(self, data, chunk_size=1000):
+        handler = parsemail.LocalHandler()
+        envelope = Envelope()
+        sink = await handler.open_DATA(None, None, envelope)
+        for i in range(0, len(data), chunk_size):
+            sink.feed(data[i:i + chunk_size])
+        envelope.sink = sink
+        stdout = io.TextIOWrapper(io.BytesIO())
+        with mock.patch('sys.stdout', stdout):
+            status = await handler.handle_DATA(None, None, envelope)
+        stdout.flush()
+        return status, stdout.buffer.getvalue()
+
+    async def test_prints_message_without_reading_it_whole(self):
+        data = (b'Subject: big\r\n\r\n' +
+                b''.join(b'line %d\r\n' % n for n in range(20000)))
+        # Neither a full read nor a full parse of the streamed body.
+        with mock.patch.object(RawMessage, 'read',
+                               side_effect=AssertionError("read whole")):
+            status, output = await self.handle(data)
+        self.assertEqual(status, '250 OK')
+        self.assertIn(data, output)
+
+
+if __name__ == '__main__':
+    unittest.main()
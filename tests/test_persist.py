@@ -0,0 +1,214 @@
+import asyncio
+import contextlib
+import shutil
+import tempfile
+import unittest
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from unittest import mock
+
+from mailholder.blobstore import BlobStore
+from mailholder.ingest import store_attachments
+from mailholder.rawmessage import RawMessage
+
+try:
+    from mailholder import persist
+except ImportError:
+    persist = None
+
+
+MESSAGE = (b'From: a@example.com\r\nTo: b@example.com\r\nSubject: hi\r\n'
+           b'MIME-Version: 1.0\r\n'
+           b'Content-Type: multipart/alternative; boundary="b"\r\n\r\n'
+           b'--b\r\nContent-Type: text/plain; charset=utf-8\r\n\r\n'
+           b'plain body\r\n'
+           b'--b\r\nContent-Type: text/html\r\n\r\n<p>html body</p>\r\n'
+           b'--b--\r\n')
+
+
+def captured(number):
+    return persist.CapturedEmail(str(number), {})
+
+
+@unittest.skipIf(persist is None, "tortoise is not installed")
+class TestCapturedEmail(unittest.TestCase):
+    def test_bodies_from_raw_message(self):
+        # Only the headers are parsed up front; the bodies come from the
+        # data itself.
+        msg = RawMessage.from_bytes(MESSAGE)
+        fields = persist.CapturedEmail.from_message(
+            'id', msg, 'a@example.com',
+            ['b@example.com', 'hidden@example.com']).fields
+        self.assertEqual(fields['message'], 'plain body')
+        self.assertEqual(fields['html_message'], '<p>html body</p>')
+        self.assertEqual(fields['subject'], 'hi')
+        self.assertEqual(fields['bcc'], 'hidden@example.com')
+
+
+@unittest.skipIf(persist is None, "tortoise is not installed")
+class TestEmailBatcher(unittest.IsolatedAsyncioTestCase):
+    def make_batcher(self, **kwargs):
+        batcher = persist.EmailBatcher(**kwargs)
+        batcher.flushed = []
+
+        async def flush(batch):
+            await asyncio.sleep(0)
+            batcher.flushed.append([c.spool_id for c in batch])
+        batcher.flush = flush
+        return batcher
+
+    async def test_batches(self):
+        batcher = self.make_batcher(batch_size=2, flush_interval=10000)
+        task = asyncio.ensure_future(batcher.run())
+        for number in range(5):
+            await batcher.put(captured(number))
+        await batcher.stop()
+        await asyncio.wait_for(task, 5)
+        self.assertEqual(batcher.flushed, [['0', '1'], ['2', '3'], ['4']])
+
+    async def test_flush_interval(self):
+        batcher = self.make_batcher(batch_size=100, flush_interval=10)
+        task = asyncio.ensure_future(batcher.run())
+        await batcher.put(captured(0))
+        await asyncio.sleep(0.1)
+        self.assertEqual(batcher.flushed, [['0']])
+        await batcher.stop()
+        await asyncio.wait_for(task, 5)
+
+    async def test_cancel_keeps_collected_batch(self):
+        batcher = self.make_batcher(batch_size=100, flush_interval=10000)
+        task = asyncio.ensure_future(batcher.run())
+        await batcher.put(captured(0))
+        await asyncio.sleep(0.01)
+        await batcher.put(captured(1))
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.assertEqual(sorted(sum(batcher.flushed, [])), ['0', '1'])
+
+    async def test_cancel_during_flush(self):
+        batcher = self.make_batcher(batch_size=1, flush_interval=10000)
+        started = asyncio.Event()
+        release = asyncio.Event()
+        flush = batcher.flush
+
+        async def slow_flush(batch):
+            started.set()
+            await release.wait()
+            await flush(batch)
+        batcher.flush = slow_flush
+        task = asyncio.ensure_future(batcher.run())
+        await batcher.put(captured(0))
+        await started.wait()
+        await batcher.put(captured(1))
+        task.cancel()
+        await asyncio.sleep(0.01)
+        release.set()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.assertEqual(sorted(sum(batcher.flushed, [])), ['0', '1'])
+
+
+def with_attachment(filename='a.bin'):
+    msg = MIMEMultipart()
+    attachment = MIMEApplication(b'attached data' * 100)
+    attachment.add_header('Content-Disposition', 'attachment',
+                          filename=filename)
+    msg.attach(attachment)
+    return RawMessage.from_bytes(msg.as_bytes())
+
+
+class FakeTable(object):
+    """Just enough of a Tortoise model for ``EmailBatcher.flush``."""
+    def __init__(self):
+        self.rows = []
+        self.fail = False
+
+    def __call__(self, **fields):
+        return fields
+
+    async def bulk_create(self, objects):
+        if self.fail:
+            raise RuntimeError("database is down")
+        for fields in objects:
+            self.rows.append(dict(fields, id=len(self.rows) + 1))
+
+    def filter(self, **lookup):
+        (name, values), = lookup.items()
+        name = name[:-len('__in')]
+        return FakeQuery([row for row in self.rows if row[name] in values])
+
+
+class FakeQuery(object):
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def values_list(self, *names):
+        return [tuple(row[name] for name in names) for row in self.rows]
+
+
+@unittest.skipIf(persist is None, "tortoise is not installed")
+class TestBlobReferences(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.store = BlobStore(self.dir)
+        self.emails = FakeTable()
+        self.attachments = FakeTable()
+        connection = mock.Mock(execute_many=mock.AsyncMock())
+        for name, value in (
+                ('Email', self.emails), ('Attachment', self.attachments),
+                ('in_transaction', lambda name: contextlib.nullcontext()),
+                ('Tortoise', mock.Mock(get_connection=lambda name:
+                                       connection))):
+            patcher = mock.patch.object(persist, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.batcher = persist.EmailBatcher(release=self.release)
+
+    async def release(self, digests):
+        for digest in digests:
+            self.store.decref(digest)
+
+    def capture(self, number, filename='a.bin'):
+        spool_id = str(number)
+        return persist.CapturedEmail(
+            spool_id, {'spool_id': spool_id},
+            store_attachments(with_attachment(filename), self.store))
+
+    def delete_attachments(self):
+        # What data.models.release_attachment_blob does for each row.
+        for row in self.attachments.rows:
+            self.store.decref(row['digest'])
+        self.attachments.rows = []
+
+    async def test_capture_delete_gc(self):
+        await self.batcher._flush_safely([self.capture(1), self.capture(2)])
+        await self.batcher._flush_safely([self.capture(3)])
+        row, = self.attachments.rows
+        # One reference for the one row, whatever the number of captures.
+        self.assertEqual(self.store.refs(row['digest']), 1)
+        self.assertEqual(self.store.gc(), 0)
+        self.delete_attachments()
+        self.assertEqual(self.store.gc(), 1)
+        self.assertFalse(self.store.exists(row['digest']))
+
+    async def test_reference_per_row(self):
+        await self.batcher._flush_safely([self.capture(1, 'a.bin'),
+                                          self.capture(2, 'b.bin')])
+        digests = {row['digest'] for row in self.attachments.rows}
+        self.assertEqual(len(self.attachments.rows), 2)
+        digest, = digests
+        self.assertEqual(self.store.refs(digest), 2)
+
+    async def test_failed_batch_releases_references(self):
+        self.attachments.fail = True
+        with self.assertLogs('persist', 'ERROR'):
+            await self.batcher._flush_safely([self.capture(1),
+                                              self.capture(2)])
+        self.assertEqual(self.attachments.rows, [])
+        self.assertEqual(self.store.gc(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
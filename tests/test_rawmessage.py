@@ -0,0 +1,212 @@
+import email
+import glob
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from email.mime.application import MIMEApplication
+from email.mime.message import MIMEMessage
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from mailholder.rawmessage import (MappedFile, RawMessage, dump_structure,
+                                   load_structure, write_index)
+
+
+EML_DIR = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'eml_files')
+
+
+def sample_messages():
+    """The sample .eml files plus a nested multipart message."""
+    messages = []
+    for path in sorted(glob.glob(os.path.join(EML_DIR, '*.eml'))):
+        with open(path, 'rb') as f:
+            messages.append(f.read())
+    outer = MIMEMultipart()
+    outer['Subject'] = 'nested'
+    outer.attach(MIMEText('héllo wörld ' * 50, 'plain', 'utf-8'))
+    attachment = MIMEApplication(bytes(range(256)) * 20)
+    attachment.add_header('Content-Disposition', 'attachment',
+                          filename='data.bin')
+    outer.attach(attachment)
+    inner = MIMEMultipart()
+    inner.attach(MIMEText('inner text'))
+    quoted = MIMEText('=' * 100 + ' café\n', 'plain', 'utf-8')
+    del quoted['Content-Transfer-Encoding']
+    quoted['Content-Transfer-Encoding'] = 'quoted-printable'
+    quoted.set_payload(email.quoprimime.body_encode(
+        '=' * 100 + ' café\n'))
+    quoted.add_header('Content-Disposition', 'attachment', filename='q.txt')
+    inner.attach(quoted)
+    outer.attach(MIMEMessage(inner))
+    messages.append(outer.as_bytes())
+    messages.append(outer.as_bytes().replace(b'\n', b'\r\n'))
+    return messages
+
+
+def payload_bytes(part):
+    payload = part._payload
+    if isinstance(payload, str):
+        payload = payload.encode('ascii', 'surrogateescape')
+    return payload
+
+
+class TestRawMessage(unittest.TestCase):
+    def test_headers_only_until_needed(self):
+        for data in sample_messages():
+            full = email.message_from_bytes(data)
+            raw = RawMessage.from_bytes(data)
+            self.assertEqual(raw.headers['Subject'], full['Subject'])
+            self.assertEqual(raw.is_multipart(), full.is_multipart())
+            self.assertEqual(raw.size, len(data))
+            self.assertEqual(raw.read(), data)
+            self.assertFalse(raw.parsed)
+            if not full.is_multipart():
+                self.assertEqual(raw.read_body(), payload_bytes(full))
+                self.assertFalse(raw.parsed)
+            self.assertEqual(raw.message.as_bytes(), full.as_bytes())
+            self.assertTrue(raw.parsed)
+
+    def test_without_body(self):
+        raw = RawMessage.from_bytes(b'Subject: no body')
+        self.assertEqual(raw.headers['Subject'], 'no body')
+        self.assertEqual(raw.read_body(), b'')
+
+    def test_without_headers(self):
+        raw = RawMessage.from_bytes(b'\r\nbody only')
+        self.assertEqual(len(raw.headers), 0)
+        self.assertEqual(raw.read_body(), b'body only')
+
+    def test_bounded(self):
+        data = b'Subject: a\r\n\r\nfirst' + b'Subject: b\r\n\r\nsecond'
+        raw = RawMessage(io.BytesIO(data), len(b'Subject: a\r\n\r\nfirst'))
+        self.assertEqual(raw.headers['Subject'], 'b')
+        self.assertEqual(raw.read_body(), b'second')
+        raw = RawMessage(io.BytesIO(data), 0,
+                         end=len(b'Subject: a\r\n\r\nfirst'))
+        self.assertEqual(raw.read_body(), b'first')
+        self.assertEqual(raw.size, len(b'Subject: a\r\n\r\nfirst'))
+
+    def test_copy(self):
+        data = sample_messages()[-1]
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(b'junk' + data + b'junk')
+            f.flush()
+            for raw in (RawMessage.from_bytes(data),
+                        RawMessage(MappedFile(f.name), 4,
+                                   end=4 + len(data))):
+                out = io.BytesIO()
+                self.assertEqual(raw.copy(out, chunk_size=100), len(data))
+                self.assertEqual(out.getvalue(), data)
+                self.assertFalse(raw.parsed)
+
+
+class TestMimeIndex(unittest.TestCase):
+    def test_leaf_bodies_match_email(self):
+        for data in sample_messages():
+            raw = RawMessage.from_bytes(data)
+            leaves = [part for part in raw.structure.walk()
+                      if not part.children]
+            expected = [part for part in email.message_from_bytes(data).walk()
+                        if not part.is_multipart()]
+            self.assertEqual(len(leaves), len(expected))
+            for part, want in zip(leaves, expected):
+                self.assertEqual(part.headers.get_content_type(),
+                                 want.get_content_type())
+                self.assertEqual(raw.read_part(part), payload_bytes(want))
+            self.assertFalse(raw.parsed)
+
+    def test_attachments_decoded_in_chunks(self):
+        for data in sample_messages():
+            want = [(part.get_filename(), part.get_payload(decode=True))
+                    for part in email.message_from_bytes(data).walk()
+                    if not part.is_multipart()
+                    and part.get_content_disposition() is not None]
+            raw = RawMessage.from_bytes(data)
+            got = []
+            for part in raw.attachments():
+                out = io.BytesIO()
+                size = raw.copy_decoded(part, out, chunk_size=1000)
+                self.assertEqual(size, len(out.getvalue()))
+                got.append((part.headers.get_filename(), out.getvalue()))
+            self.assertEqual(got, want)
+
+    def test_subpart(self):
+        data = sample_messages()[-1]
+        raw = RawMessage.from_bytes(data)
+        self.assertTrue(raw.has_subparts())
+        nested = raw.subpart(2)
+        self.assertEqual(nested.headers.get_content_type(), 'message/rfc822')
+        inner = nested.subpart(0)
+        self.assertTrue(inner.is_multipart())
+        self.assertEqual(inner.subpart(0).read_body().strip(), b'inner text')
+
+
+class TestIndexSidecar(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.data = sample_messages()[-1]
+        self.path = os.path.join(self.dir, 'message')
+        with open(self.path, 'wb') as f:
+            f.write(self.data)
+        self.index_path = os.path.join(self.dir, 'message.json')
+        self.state = dump_structure(RawMessage.from_bytes(self.data).structure)
+
+    def open(self, index_path):
+        raw = RawMessage.from_path(self.path, index_path)
+        self.addCleanup(raw.close)
+        return raw
+
+    def assertStructure(self, raw):
+        expected = RawMessage.from_bytes(self.data)
+        self.assertEqual(dump_structure(raw.structure),
+                         dump_structure(expected.structure))
+        self.assertEqual([raw.read_part(part) for part in raw.attachments()],
+                         [expected.read_part(part)
+                          for part in expected.attachments()])
+
+    def test_loaded(self):
+        write_index(self.index_path,
+                    RawMessage.from_bytes(self.data).structure)
+        raw = self.open(self.index_path)
+        self.assertIsNotNone(raw._structure)
+        self.assertStructure(raw)
+
+    def test_no_sidecar(self):
+        for index_path in (None, self.index_path):
+            raw = self.open(index_path)
+            self.assertIsNone(raw._structure)
+            self.assertStructure(raw)
+
+    def test_malformed(self):
+        parts = self.state['parts']
+        size = len(self.data)
+        for state in ('not json', [], {}, {'version': 99, 'parts': parts},
+                      {'version': 1}, {'version': 1, 'parts': []},
+                      {'version': 1, 'parts': [[0, 10]]},
+                      {'version': 1, 'parts': [[0, '10', 20, -1, 'x']]},
+                      {'version': 1, 'parts': [[0, 10, size + 1, -1, 'x']]},
+                      {'version': 1, 'parts': [[0, 10, 20, 5, 'x']]},
+                      {'version': 1, 'parts': parts + [[0, 10, 20, -1, 'x']]}):
+            with self.subTest(state=state):
+                with open(self.index_path, 'w') as f:
+                    f.write(state if isinstance(state, str)
+                            else json.dumps(state))
+                raw = self.open(self.index_path)
+                # Scanned instead.
+                self.assertIsNone(raw._structure)
+                self.assertStructure(raw)
+
+    def test_load_structure_errors(self):
+        fp = MappedFile(self.path)
+        self.addCleanup(fp.close)
+        self.assertRaises(ValueError, load_structure, None, fp)
+        self.assertRaises(ValueError, load_structure, {'parts': []}, fp)
+
+
+if __name__ == '__main__':
+    unittest.main()
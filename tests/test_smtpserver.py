@@ -0,0 +1,259 @@
+import asyncio
+import tempfile
+import unittest
+
+from mailholder.smtpserver import SMTPServer
+
+
+class Handler(object):
+    def __init__(self):
+        self.envelopes = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.envelopes.append(envelope)
+        return '250 OK'
+
+
+class SMTPTestCase(unittest.IsolatedAsyncioTestCase):
+    server_options = {}
+
+    async def asyncSetUp(self):
+        self.handler = Handler()
+        self.server = SMTPServer(self.handler, host='127.0.0.1', port=0,
+                                 hostname='test', **self.server_options)
+        listener = await self.server.start()
+        self.port = listener.sockets[0].getsockname()[1]
+        self.reader, self.writer = await asyncio.open_connection(
+            '127.0.0.1', self.port)
+        self.assertTrue((await self.reply()).startswith('220'))
+
+    async def asyncTearDown(self):
+        self.writer.close()
+        self.server.close()
+
+    async def reply(self):
+        """Read one (possibly multi-line) reply and return its last line."""
+        while True:
+            line = (await self.reader.readline()).decode('ascii')
+            if line[3:4] != '-':
+                return line.rstrip('\r\n')
+
+    async def command(self, line):
+        self.writer.write(line + b'\r\n')
+        return await self.reply()
+
+
+class TestSMTPProtocol(SMTPTestCase):
+    server_options = {'line_limit': 100}
+
+    async def test_transaction(self):
+        self.assertEqual(await self.command(b'EHLO client'), '250 HELP')
+        self.assertEqual(await self.command(b'MAIL FROM:<a@example.com>'),
+                         '250 OK')
+        self.assertEqual(await self.command(b'RCPT TO:<b@example.com>'),
+                         '250 OK')
+        self.assertTrue((await self.command(b'DATA')).startswith('354'))
+        self.assertEqual(
+            await self.command(b'Subject: hi\r\n\r\n..dot\r\nend\r\n.'),
+            '250 OK')
+        envelope, = self.handler.envelopes
+        self.assertEqual(envelope.mail_from, 'a@example.com')
+        self.assertEqual(envelope.rcpt_tos, ['b@example.com'])
+        self.assertEqual(envelope.content,
+                         b'Subject: hi\r\n\r\n.dot\r\nend\r\n')
+
+    async def test_command_order(self):
+        self.assertTrue((await self.command(b'MAIL FROM:<a@example.com>'))
+                        .startswith('503'))
+        await self.command(b'HELO client')
+        self.assertTrue((await self.command(b'RCPT TO:<b@example.com>'))
+                        .startswith('503'))
+        self.assertTrue((await self.command(b'DATA')).startswith('503'))
+        self.assertTrue((await self.command(b'BOGUS')).startswith('500'))
+
+    async def test_pipelining(self):
+        self.writer.write(b'EHLO client\r\nMAIL FROM:<a@example.com>\r\n'
+                          b'RCPT TO:<b@example.com>\r\nDATA\r\n')
+        self.assertEqual(await self.reply(), '250 HELP')
+        self.assertEqual(await self.reply(), '250 OK')
+        self.assertEqual(await self.reply(), '250 OK')
+        self.assertTrue((await self.reply()).startswith('354'))
+        self.assertEqual(await self.command(b'body\r\n.\r\nNOOP'), '250 OK')
+        self.assertEqual(await self.reply(), '250 OK')
+        self.assertEqual(len(self.handler.envelopes), 1)
+
+    async def test_long_command_line(self):
+        # The rest of the refused line must not be run as a command.
+        self.writer.write(b'NOOP ' + b'x' * 1000 + b' QUIT\r\n')
+        self.assertEqual(await self.reply(), '500 5.5.2 Error: line too long')
+        self.assertEqual(await self.command(b'NOOP'), '250 OK')
+
+    async def test_long_data_line(self):
+        await self.command(b'HELO client')
+        await self.command(b'MAIL FROM:<a@example.com>')
+        await self.command(b'RCPT TO:<b@example.com>')
+        await self.command(b'DATA')
+        self.writer.write(b'Subject: hi\r\n\r\n' + b'x' * 1000 + b'\r\n')
+        self.assertEqual(await self.command(b'end\r\n.'),
+                         '500 5.5.2 Error: line too long')
+        self.assertEqual(self.handler.envelopes, [])
+        self.assertEqual(await self.command(b'NOOP'), '250 OK')
+
+    async def test_long_data_line_across_reads(self):
+        await self.command(b'HELO client')
+        await self.command(b'MAIL FROM:<a@example.com>')
+        await self.command(b'RCPT TO:<b@example.com>')
+        await self.command(b'DATA')
+        for _ in range(10):
+            self.writer.write(b'x' * 500)
+            await self.writer.drain()
+            await asyncio.sleep(0.01)
+        self.assertEqual(await self.command(b'\r\n.'),
+                         '500 5.5.2 Error: line too long')
+        self.assertEqual(await self.command(b'NOOP'), '250 OK')
+
+
+class Sink(object):
+    def __init__(self, fail_feed=False):
+        self.chunks = []
+        self.aborted = False
+        self.fail_feed = fail_feed
+
+    def feed(self, chunk):
+        if self.fail_feed:
+            raise OSError(28, "No space left on device")
+        self.chunks.append(chunk)
+
+    def abort(self):
+        self.aborted = True
+
+
+class FailingHandler(object):
+    def __init__(self):
+        self.sinks = []
+        self.fail = None
+
+    async def open_DATA(self, server, session, envelope):
+        if self.fail == 'open':
+            raise OSError(28, "No space left on device")
+        self.sinks.append(Sink(fail_feed=self.fail == 'feed'))
+        return self.sinks[-1]
+
+    async def handle_DATA(self, server, session, envelope):
+        raise RuntimeError("storage failed")
+
+
+class TestHandlerErrors(SMTPTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.server.handler = self.handler = FailingHandler()
+
+    async def send(self):
+        await self.command(b'HELO client')
+        await self.command(b'MAIL FROM:<a@example.com>')
+        await self.command(b'RCPT TO:<b@example.com>')
+        with self.assertLogs('smtpserver', 'ERROR'):
+            self.assertTrue((await self.command(b'DATA')).startswith('354'))
+            self.assertEqual(await self.command(b'body\r\n.'),
+                             '451 4.3.0 Requested action aborted: local '
+                             'error in processing')
+        # The session goes on.
+        self.assertEqual(await self.command(b'NOOP'), '250 OK')
+        self.assertEqual(self.server.inflight, 0)
+        self.assertEqual(self.server.inflight_bytes, 0)
+
+    async def test_sink_aborted_when_handler_fails(self):
+        await self.send()
+        sink, = self.handler.sinks
+        self.assertTrue(sink.aborted)
+
+    async def test_open_fails(self):
+        self.handler.fail = 'open'
+        await self.send()
+        self.assertEqual(self.handler.sinks, [])
+
+    async def test_feed_fails(self):
+        self.handler.fail = 'feed'
+        await self.send()
+        sink, = self.handler.sinks
+        self.assertTrue(sink.aborted)
+
+
+class BlockingHandler(Handler):
+    """Holds every message until ``release`` is set."""
+    def __init__(self):
+        Handler.__init__(self)
+        self.release = asyncio.Event()
+
+    async def handle_DATA(self, server, session, envelope):
+        await self.release.wait()
+        return await Handler.handle_DATA(self, server, session, envelope)
+
+
+class TestAdmission(SMTPTestCase):
+    server_options = {'max_inflight': 1, 'max_sessions': 2,
+                      'data_size_limit': 1000}
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.server.handler = self.handler = BlockingHandler()
+
+    async def connect(self):
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+        self.addCleanup(writer.close)
+        return reader, writer
+
+    async def test_session_limit(self):
+        reader, writer = await self.connect()
+        self.assertTrue((await reader.readline()).startswith(b'220'))
+        reader, writer = await self.connect()
+        self.assertTrue((await reader.readline()).startswith(b'421'))
+        self.assertEqual(await reader.read(), b'')
+
+    async def test_message_size(self):
+        await self.command(b'EHLO client')
+        self.assertTrue((await self.command(
+            b'MAIL FROM:<a@example.com> SIZE=2000')).startswith('552'))
+        await self.command(b'MAIL FROM:<a@example.com>')
+        await self.command(b'RCPT TO:<b@example.com>')
+        await self.command(b'DATA')
+        self.writer.write(b''.join(b'x' * 60 + b'\r\n' for _ in range(50)))
+        self.assertTrue((await self.command(b'.')).startswith('552'))
+        self.assertEqual(self.handler.envelopes, [])
+
+    async def test_inflight_limit(self):
+        await self.command(b'HELO client')
+        await self.command(b'MAIL FROM:<a@example.com>')
+        await self.command(b'RCPT TO:<b@example.com>')
+        await self.command(b'DATA')
+        self.writer.write(b'body\r\n.\r\n')
+        await self.writer.drain()
+        await asyncio.sleep(0.05)
+        # The first message is still being handled.
+        reader, writer = await self.connect()
+        await reader.readline()
+        writer.write(b'HELO other\r\nMAIL FROM:<c@example.com>\r\n')
+        await reader.readline()
+        self.assertTrue((await reader.readline()).startswith(b'451'))
+        self.handler.release.set()
+        self.assertEqual(await self.reply(), '250 OK')
+        self.assertEqual(self.server.inflight, 0)
+        writer.write(b'MAIL FROM:<c@example.com>\r\n')
+        self.assertTrue((await reader.readline()).startswith(b'250'))
+
+
+class TestStorageAdmission(SMTPTestCase):
+    async def asyncSetUp(self):
+        self.server_options = {'spool_dir': tempfile.gettempdir(),
+                               'min_free_space': 1 << 62}
+        await super().asyncSetUp()
+
+    async def test_disk_full(self):
+        await self.command(b'HELO client')
+        self.assertTrue((await self.command(b'MAIL FROM:<a@example.com>'))
+                        .startswith('421'))
+        self.assertEqual(await self.reader.read(), b'')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from mailholder.spool import FSYNC_GROUP, FsyncPolicy, MaildirSpool, Spool
+
+
+class TestSpool(unittest.TestCase):
+    spool_class = Spool
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.spool = self.spool_class(self.dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_deliver(self):
+        data = b'Subject: hi\r\n\r\nbody\r\n'
+        msg_id = self.spool.deliver('a@example.com',
+                                    ['B@example.com', 'c@example.com'], data)
+        with open(self.spool.path(msg_id), 'rb') as f:
+            self.assertEqual(f.read(), data)
+        self.assertEqual(self.spool.messages_for('b@example.com'), [msg_id])
+        self.assertEqual(self.spool.messages_for('c@example.com'), [msg_id])
+        self.assertEqual(self.spool.messages_for('d@example.com'), [])
+        self.assertEqual(sorted(self.spool.recipients()),
+                         ['b@example.com', 'c@example.com'])
+        self.assertEqual(list(self.spool.envelopes()), [
+            {'id': msg_id, 'from': 'a@example.com',
+             'to': ['B@example.com', 'c@example.com']}])
+
+    def test_abort(self):
+        writer = self.spool.open('a@example.com', ['b@example.com'])
+        writer.write(b'Subject: hi\r\n\r\nbody\r\n')
+        writer.abort()
+        self.assertFalse(os.path.exists(writer.tmp_path))
+        self.assertFalse(os.path.exists(writer.path))
+        self.assertEqual(self.spool.recipients(), [])
+
+    def test_abort_after_write_error(self):
+        writer = self.spool.open('a@example.com', ['b@example.com'])
+        writer.write(b'Subject: hi\r\n\r\nbody\r\n')
+        close = writer.file.close
+
+        def failing_close():
+            close()
+            raise OSError(28, "No space left on device")
+        with mock.patch.object(writer.file, 'close', failing_close):
+            writer.abort()
+        self.assertFalse(os.path.exists(writer.tmp_path))
+
+    def test_structure_sidecar(self):
+        data = (b'Content-Type: multipart/mixed; boundary="b"\r\n\r\n'
+                b'--b\r\nContent-Type: text/plain\r\n\r\nhello\r\n'
+                b'--b--\r\n')
+        writer = self.spool.open('a@example.com', ['b@example.com'])
+        writer.write(data)
+        writer.write_structure()
+        msg_id = writer.commit()
+        msg = self.spool.open_message(msg_id)
+        try:
+            # Loaded from the sidecar rather than scanned.
+            self.assertIsNotNone(msg._structure)
+            part, = msg.structure.children
+            self.assertEqual(msg.read_part(part), b'hello')
+        finally:
+            msg.close()
+
+    def test_abort_removes_sidecar(self):
+        writer = self.spool.open('a@example.com', ['b@example.com'])
+        writer.write(b'Subject: hi\r\n\r\nbody\r\n')
+        writer.write_structure()
+        sidecar = self.spool.structure_path(writer.msg_id)
+        self.assertTrue(os.path.exists(sidecar))
+        writer.abort()
+        self.assertFalse(os.path.exists(sidecar))
+        self.assertEqual(os.listdir(self.spool.structure_dir), [])
+
+    def test_rcpt_path_stays_in_rcpt_dir(self):
+        for recipient in ('.', '..', '../../etc/passwd', '/tmp/x', '.hidden',
+                          'a/../b', '..\\x'):
+            path = self.spool._rcpt_path(recipient)
+            self.assertEqual(os.path.dirname(path), self.spool.rcpt_dir,
+                             recipient)
+            self.assertNotIn(os.path.basename(path), ('.', '..'))
+
+    def test_dot_recipients(self):
+        msg_id = self.spool.deliver('a@example.com', ['..', '.'], b'x\r\n')
+        self.assertEqual(self.spool.messages_for('..'), [msg_id])
+        self.assertEqual(self.spool.messages_for('.'), [msg_id])
+        self.assertEqual(sorted(self.spool.recipients()), ['.', '..'])
+
+
+class TestMaildirSpool(TestSpool):
+    spool_class = MaildirSpool
+
+    def test_deliver_to_new(self):
+        msg_id = self.spool.deliver('a@example.com', ['b@example.com'],
+                                    b'x\r\n')
+        self.assertEqual(os.listdir(os.path.join(self.dir, 'new')), [msg_id])
+        os.rename(os.path.join(self.dir, 'new', msg_id),
+                  os.path.join(self.dir, 'cur', msg_id + ':2,S'))
+        self.assertTrue(os.path.exists(self.spool.path(msg_id)))
+
+
+
+class TestFsyncPolicy(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.synced = []
+        patcher = mock.patch('mailholder.spool.fsync_path', self.fsync_path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def fsync_path(self, path):
+        self.synced.append((path, threading.current_thread().name))
+
+    async def test_group_waits_for_batch(self):
+        policy = FsyncPolicy(FSYNC_GROUP, batch=2, interval=60000)
+        spool = Spool(self.dir, policy)
+        spool.deliver('a@example.com', ['b@example.com'], b'x\r\n')
+        waiting = asyncio.ensure_future(policy.wait())
+        await asyncio.sleep(0.01)
+        self.assertFalse(waiting.done())
+        self.assertEqual(self.synced, [])
+        spool.deliver('a@example.com', ['b@example.com'], b'y\r\n')
+        await asyncio.wait_for(waiting, 5)
+        # Both messages, the indexes and the message directory.
+        paths = set(path for path, _ in self.synced)
+        self.assertIn(spool.message_dir, paths)
+        self.assertEqual(len([p for p in paths if p.endswith('.mail')]), 2)
+        # Synced off the event loop thread.
+        self.assertTrue(all(name.startswith('fsync')
+                            for _, name in self.synced))
+        policy.close()
+
+    async def test_group_interval(self):
+        policy = FsyncPolicy(FSYNC_GROUP, batch=100, interval=10)
+        spool = Spool(self.dir, policy)
+        spool.deliver('a@example.com', ['b@example.com'], b'x\r\n')
+        await asyncio.wait_for(policy.wait(), 5)
+        self.assertTrue(self.synced)
+        # Nothing pending: returns at once.
+        await asyncio.wait_for(policy.wait(), 5)
+        policy.close()
+
+    async def test_wait_covers_group_being_synced(self):
+        policy = FsyncPolicy(FSYNC_GROUP, batch=1)
+        spool = Spool(self.dir, policy)
+        spool.deliver('a@example.com', ['b@example.com'], b'x\r\n')
+        # The group was handed to the fsync thread on commit.
+        await asyncio.wait_for(policy.wait(), 5)
+        self.assertTrue(self.synced)
+        policy.close()
+
+    def test_flush_without_loop(self):
+        policy = FsyncPolicy(FSYNC_GROUP, batch=1)
+        Spool(self.dir, policy).deliver('a@example.com', ['b@example.com'],
+                                        b'x\r\n')
+        self.assertTrue(self.synced)
+        self.assertTrue(all(name == threading.current_thread().name
+                            for _, name in self.synced))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import email
+import unittest
+
+from mailholder.rawmessage import RawMessage
+from mailholder.text import decode_text, iter_text, lookup_codec
+
+
+MESSAGE = (
+    b'Content-Type: multipart/mixed; boundary="b"\r\n\r\n'
+    b'--b\r\nContent-Type: text/plain; charset=iso-8859-1\r\n'
+    b'Content-Transfer-Encoding: quoted-printable\r\n\r\ncaf=E9\r\n'
+    b'--b\r\nContent-Type: text/html; charset="koi8-r"\r\n\r\n'
+    b'\xf0\xd2\xc9\xd7\xc5\xd4\r\n'
+    b'--b\r\nContent-Type: text/plain\r\n\r\nna\xc3\xafve\r\n'
+    b'--b\r\nContent-Type: text/plain; charset=utf-8\r\n'
+    b'Content-Disposition: attachment; filename="a.txt"\r\n\r\nattached\r\n'
+    b'--b\r\nContent-Type: application/octet-stream\r\n\r\n\x00\x01\r\n'
+    b'--b--\r\n')
+EXPECTED = [('text/plain', 'caf\xe9'),
+            ('text/html', 'Привет'),
+            ('text/plain', 'na\xefve')]
+
+
+class TestLookupCodec(unittest.TestCase):
+    def test_names(self):
+        self.assertEqual(lookup_codec('UTF8'), 'utf-8')
+        self.assertEqual(lookup_codec('"Latin-1"'), 'iso8859-1')
+
+    def test_fallback(self):
+        self.assertEqual(lookup_codec(None), 'utf-8')
+        self.assertEqual(lookup_codec('x-unknown'), 'utf-8')
+        self.assertEqual(lookup_codec('x-unknown', 'ascii'), 'ascii')
+        self.assertEqual(lookup_codec('x-unknown', 'x-bogus'), 'utf-8')
+
+    def test_decode_text(self):
+        self.assertEqual(decode_text(b'caf\xe9', 'latin-1'), 'caf\xe9')
+        self.assertEqual(decode_text(b'caf\xe9'), 'caf�')
+
+
+class TestIterText(unittest.TestCase):
+    def test_raw_message(self):
+        raw = RawMessage.from_bytes(MESSAGE)
+        self.assertEqual(list(iter_text(raw)), EXPECTED)
+        # Extracted from the byte index, without a full parse.
+        self.assertFalse(raw.parsed)
+
+    def test_parsed_message(self):
+        msg = email.message_from_bytes(MESSAGE)
+        self.assertEqual(list(iter_text(msg)), EXPECTED)
+
+    def test_attachments(self):
+        raw = RawMessage.from_bytes(MESSAGE)
+        self.assertEqual(list(iter_text(raw, attachments=True)),
+                         EXPECTED + [('text/plain', 'attached')])
+
+    def test_default_charset(self):
+        raw = RawMessage.from_bytes(
+            b'Content-Type: text/plain\r\n\r\ncaf\xe9\r\n')
+        self.assertEqual(list(iter_text(raw, 'latin-1')),
+                         [('text/plain', 'caf\xe9\r\n')])
+
+
+if __name__ == '__main__':
+    unittest.main()